@@ -6,16 +6,19 @@ Magnetic analogue of washer electrostatic code.
 Computes vector potential A then evaluates B = curl(A).
 Plots in XY plane.
 
+The coils are evaluated with calcs.annulus_field (the 'annulus' B method of the pushers), every grid point and
+coil at once; run from the project root with PYTHONPATH=.:Scripts.
+
 Author:  FJ Wessel
 """
 
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.special import ellipk, ellipe
-from scipy.integrate import quad
+
+from calcs.coil_geometry import CoilGeometry
+from calcs.annulus_field import AnnularCoils
 
 # --- CONSTANTS & PARAMETERS ---
-mu_0 = 4 * np.pi * 1e-7
 
 # 1. Face Coils (All moments outward)
 a, b = 0.2, 0.8  # Inner and outer radii [m]
@@ -62,68 +65,22 @@ for vec in corner_base_vectors:
     corner_configs.append({'center': center, 'z_loc': z_loc, 'x_loc': x_loc})
 
 
-def compute_disk_B_kernel(r_l, z_l, r_in, r_out, K_surface):
-    """Computes the analytical field components for an arbitrary annular winding profile."""
-    if r_l < 1e-6:
-        val, _ = quad(lambda rp: rp ** 2 / ((rp ** 2 + z_l ** 2) ** (1.5)), r_in, r_out)
-        return 0.0, (mu_0 * K_surface / 2.0) * val
-
-    def integrand_bz(rp):
-        d1 = np.sqrt((r_l + rp) ** 2 + z_l ** 2)
-        d2 = (r_l - rp) ** 2 + z_l ** 2
-        k2 = (4 * r_l * rp) / ((r_l + rp) ** 2 + z_l ** 2)
-        if abs(d2) < 1e-6 or abs(k2 - 1.0) < 1e-6: return 0.0
-        return (1.0 / d1) * (ellipk(k2) + ((rp ** 2 - r_l ** 2 - z_l ** 2) / d2) * ellipe(k2))
-
-    def integrand_br(rp):
-        d1 = np.sqrt((r_l + rp) ** 2 + z_l ** 2)
-        d2 = (r_l - rp) ** 2 + z_l ** 2
-        k2 = (4 * r_l * rp) / ((r_l + rp) ** 2 + z_l ** 2)
-        if abs(d2) < 1e-6 or abs(k2 - 1.0) < 1e-6: return 0.0
-        return (1.0 / d1) * (-ellipk(k2) + ((r_l ** 2 + rp ** 2 + z_l ** 2) / d2) * ellipe(k2))
-
-    bz_val, _ = quad(integrand_bz, r_in, r_out, limit=50)
-    br_val, _ = quad(integrand_br, r_in, r_out, limit=50)
-
-    bz = (mu_0 * K_surface / (2.0 * np.pi)) * bz_val
-    br = (mu_0 * K_surface / (2.0 * np.pi)) * (z_l / r_l) * br_val
-    return br, bz
+# --- ANNULAR COILS (6 faces, then 8 corners) ---
+# each winding carries K * (r_out - r_in) = I_total, spread evenly over its radii
+coil_configs = face_configs + corner_configs
+coils = AnnularCoils(CoilGeometry.from_frames(centres=[cfg['center'] for cfg in coil_configs],
+                                              z_axes=[cfg['z_loc'] for cfg in coil_configs],
+                                              x_axes=[cfg['x_loc'] for cfg in coil_configs],
+                                              radii=[b] * 6 + [d] * 8,
+                                              strengths=[K_face * (b - a)] * 6 + [K_corner * (d - c)] * 8,
+                                              inner_radii=[a] * 6 + [c] * 8),
+                     order=64)
 
 
 def get_total_B(X, Y, Z):
-    """Accumulates global 3D field contributions from the 6 face and 8 corner coils."""
-    B_total = np.zeros(3)
-    P_global = np.array([X, Y, Z])
-
-    # Contribution from 6 Face Coils (Outward)
-    for face in face_configs:
-        P_rel = P_global - face['center']
-        z_l = np.dot(P_rel, face['z_loc'])
-        x_l = np.dot(P_rel, face['x_loc'])
-        y_loc_axis = np.cross(face['z_loc'], face['x_loc'])
-        y_l = np.dot(P_rel, y_loc_axis)
-        r_l = np.sqrt(x_l ** 2 + y_l ** 2)
-
-        br_l, bz_l = compute_disk_B_kernel(r_l, z_l, a, b, K_face)
-        bx_l = br_l * (x_l / r_l) if r_l > 1e-6 else 0.0
-        by_l = br_l * (y_l / r_l) if r_l > 1e-6 else 0.0
-        B_total += bz_l * face['z_loc'] + bx_l * face['x_loc'] + by_l * y_loc_axis
-
-    # Contribution from 8 Corner Coils (Inward Anti-Coils)
-    for corner in corner_configs:
-        P_rel = P_global - corner['center']
-        z_l = np.dot(P_rel, corner['z_loc'])
-        x_l = np.dot(P_rel, corner['x_loc'])
-        y_loc_axis = np.cross(corner['z_loc'], corner['x_loc'])
-        y_l = np.dot(P_rel, y_loc_axis)
-        r_l = np.sqrt(x_l ** 2 + y_l ** 2)
-
-        br_l, bz_l = compute_disk_B_kernel(r_l, z_l, c, d, K_corner)
-        bx_l = br_l * (x_l / r_l) if r_l > 1e-6 else 0.0
-        by_l = br_l * (y_l / r_l) if r_l > 1e-6 else 0.0
-        B_total += bz_l * corner['z_loc'] + bx_l * corner['x_loc'] + by_l * y_loc_axis
-
-    return B_total
+    """Accumulates global 3D field contributions from the 6 face and 8 corner coils (at arrays of points)."""
+    P_global = np.stack(np.broadcast_arrays(X, Y, Z), axis=-1)
+    return coils.getB(P_global.reshape(-1, 3)).reshape(P_global.shape)
 
 
 # --- GRID GENERATION (Z = 0) ---
@@ -131,15 +88,10 @@ grid_res = 55
 xy_range = np.linspace(-2.2, 2.2, grid_res)
 X_mesh, Y_mesh = np.meshgrid(xy_range, xy_range)
 
-Bx = np.zeros(X_mesh.shape)
-By = np.zeros(X_mesh.shape)
-
 print("Computing analytical fields for the 14-coil hybrid configuration...")
-for i in range(grid_res):
-    for j in range(grid_res):
-        B_vec = get_total_B(X_mesh[i, j], Y_mesh[i, j], 0.0)
-        Bx[i, j] = B_vec[0]
-        By[i, j] = B_vec[1]
+B_vec = get_total_B(X_mesh, Y_mesh, 0.0)
+Bx = B_vec[..., 0]
+By = B_vec[..., 1]
 
 # --- VISUALIZATION (CORRECTED PLANE GEOMETRY) ---
 fig, ax = plt.subplots(figsize=(11, 11))
@@ -113,4 +113,45 @@ def cel(kc, p=1.0, a=1.0, b=1.0, debug=False):
     result = (np.pi / 2.0) * (aa * dd + bb * ee) / (aa * (aa + pp))
     if not np.isfinite(result):
         raise ValueError(f"Final result is not finite: {result}")
-    return result
\ No newline at end of file
+    return result
+
+def cel_iter_scalar(qc, p, g, cc, ss, em, kk):
+    """
+    cel_iter for floats (compiled with numba in calcs.loop_field).
+    """
+    while abs(g - qc) >= g * 1e-8:
+        qc = 2 * m.sqrt(kk)
+        kk = qc * em
+        f = cc
+        cc = cc + ss / p
+        g = kk / p
+        ss = 2 * (ss + f * g)
+        p = p + g
+        g = em
+        em = em + qc
+
+    return 1.5707963267948966 * (ss + cc * em) / (em * (em + p))
+
+
+def cel_iter(qc, p, g, cc, ss, em, kk, errtol=1e-8):
+    """
+    The iteration of cel_x on arrays, continued from a prepared state (the first step already done by the
+    caller, as in Ortner et al.): every element iterates until the slowest one has converged, which is a
+    handful of rounds as the iteration converges quadratically.
+
+    All inputs are arrays of the same shape (or scalars); returns an array of that shape.
+    """
+    qc, p, g, cc, ss, em, kk = np.broadcast_arrays(*(np.asarray(a, dtype=np.float64)
+                                                     for a in (qc, p, g, cc, ss, em, kk)))
+    while np.any(np.abs(g - qc) >= g * errtol):
+        qc = 2 * np.sqrt(kk)
+        kk = qc * em
+        f = cc
+        cc = cc + ss / p
+        g = kk / p
+        ss = 2 * (ss + f * g)
+        p = p + g
+        g = em
+        em = em + qc
+
+    return 1.5707963267948966 * (ss + cc * em) / (em * (em + p))
@@ -4,6 +4,8 @@ from scipy.spatial.transform import Rotation
 from Alg.polarSpace import toCyl, toCart
 import psutil
 
+from calcs.coil_geometry import CoilGeometry
+
 """
 Second attempt at polymorphism for field solvers with classes.
 First attempt was in settings.fields.FieldMethods_Impl.py, and the reason(s) why it didn't work was:
@@ -125,28 +127,28 @@ class RotationAndCylindricalSolver(RotationSolver, CylindricalSolver):
 class Bob_e_Solver(Solver, RotationAndCylindricalSolver):
     def solve(self, params : dict):
         """
-        Calls an internal single-coil solver (that assumes cyl. coords in aligned space) from an input of:
+        Calls an internal solver (that assumes cyl. coords in aligned space) from an input of:
         {
-            coord: (3, n, n, n),
-            collection: mp.Collection
+            coord: (n, n, 3),
+            collection: mp.Collection,
+            coils: the collection's CoilGeometry (optional)
         }
         """
         # Unpack input dictionary
         coord = params.get('coord')
         collection = params.get('collection')
 
-        def bob_e_at(coord, rotation, q=1, radius=1, resolution=200):
+        def bob_e_at(coord, q=1, radius=1, resolution=200):
             """
-            GIVES FIELD FOR ONE COIL
+            GIVES FIELD FOR EVERY COIL
             Vectorized version of bob_e_at with proper numerical integration.
             Inputs:
-                coord: ndarray of shape (3, Nx, Ny, Nz) in cylindrical coordinates (r, θ, z)
-                rotation: the coil's orientation (scipy.spatial.transform.Rotation object)
-                q: total charge
-                radius: coil radius
+                coord: ndarray of shape (3, m, C) in cylindrical coordinates (r, θ, z) of each coil's space
+                q: total charge of each coil (C,)
+                radius: coil radii (C,)
                 resolution: number of integration points
             Returns:
-                zeta, rho: electric field components along z and r directions, shape (Nx, Ny, Nz)
+                zeta, rho: electric field components along z and r directions of each coil, shape (m, C)
             """
             # PREPARE INPUTS #
             ##################
@@ -155,8 +157,7 @@ class Bob_e_Solver(Solver, RotationAndCylindricalSolver):
 
             # make cyl-coord inputs non-dimensional
             # Extract components along first axis
-            rho = coord[0] / radius  # shape: (...), can be 1D, 2D, or 3D
-            phi = coord[1] / radius
+            rho = coord[0] / radius  # shape: (m, C)
             zeta = coord[2] / radius
 
 
@@ -171,7 +172,7 @@ class Bob_e_Solver(Solver, RotationAndCylindricalSolver):
             # Integration setup
             thetas = np.linspace(0, np.pi, resolution)
             dtheta = thetas[1] - thetas[0]
-            cosines = np.cos(thetas).reshape((-1, 1, 1, 1))  # (res, 1, 1, 1)
+            cosines = np.cos(thetas).reshape((-1, 1, 1))  # (res, 1, 1)
 
             # Broadcast spatial coords
             rho_exp = np.expand_dims(rho, axis=0)  # always adds a new leading axis
@@ -191,45 +192,32 @@ class Bob_e_Solver(Solver, RotationAndCylindricalSolver):
             E_zeta = fzeta * Fzeta_c * kq_a2
             E_rho = frho * Frho_c * kq_a2
 
-            # CLEANING #
-            ############
-            # Convert results back to Cartesian
-            x, y, z = self.cylindrical_to_cartesian(E_rho, phi, E_zeta)
-            # Re-align the results back to world space by applying forward rotation of coil to results
-            e_coords = np.stack([x, y, z], axis=-1) #(n,n,3)
-            e_coords_rehsaped = e_coords.reshape((-1, 3)) #scipy.rotate expects (n, 3)
-            e_coords_aligned = self.orient_point_to_world(e_coords_rehsaped, rotation, output_shape=e_coords.shape)
-
-            return e_coords_aligned
+            return E_zeta, E_rho
 
         # OBJECTIVE:
-        #   call bob_e_at for each coil in the collection (provided that rotations are done for each)
-        #   then sum all results by axis to get total field.
-        e_sum = np.zeros_like(coord)
-        for coil in collection:
-            #print(coil.position)
-            # GATHER PARAMETERS #
-            #####################
-            rotation = coil.orientation
-            q = coil.current
-            radius = coil.diameter / 2
-
-            # PREPARE COORDINATE INPUT #
-            ############################
-            # fyi: coordinates are expected to be (n,n,3) and cartesian at this point.
-            # Align points to coil space, then convert to cylindrical coords.
-            aligned_cyl_input = self.prepare_coords_inverse(coord, rotation, coil.position)
-
-            # COLLECT AND AGGREGATE RESULTS #
-            #################################
-            e_coil = bob_e_at(aligned_cyl_input, rotation, q, radius, resolution=100) #(n,n,3)
-            e_sum += e_coil[0]
-        return e_sum
+        #   call bob_e_at for every coil at once, on the points aligned to each coil's space,
+        #   then re-align each coil's results to world space and sum them to get total field.
+        coils = params.get('coils')
+        if coils is None:
+            coils = CoilGeometry.from_collection(collection)
+
+        # PREPARE COORDINATE INPUT #
+        ############################
+        # fyi: coordinates are expected to be (n,n,3) and cartesian at this point.
+        # Align points to every coil's space, then convert to cylindrical coords: (m, C) each
+        points = np.asarray(coord, dtype=np.float64).reshape(-1, 3)
+        r, phi, z = coils.to_cylindrical(points)
+
+        # COLLECT AND AGGREGATE RESULTS #
+        #################################
+        e_zeta, e_rho = bob_e_at(np.stack([r, phi, z]), coils.strengths, coils.radii, resolution=100) #(m, C)
+        e_sum = coils.cylindrical_to_world(e_rho, e_zeta, phi).sum(axis=1)
+        return e_sum.reshape(np.shape(coord))
 
 class Disk_e_Solver(Solver):
     def solve(self, params : dict):
         # Collect params
-        def compute_fields(rho, z, Q, O_radius, I_radius=0, orientation=None, th=0):
+        def compute_fields(rho, z, Q, O_radius, I_radius=0):
             thetas = np.linspace(0, 2 * np.pi, 200)
             dtheta = thetas[1] - thetas[0]
             sigma = Q / (np.pi * O_radius ** 2)  # charge density C/m^2
@@ -264,43 +252,27 @@ class Disk_e_Solver(Solver):
             E_rho = prefactor * Erho
             E_z = prefactor * Ez
 
-            # FORMAT OUTPUT
-            # convert result back to cartesian
-            E_raw = toCart(E_rho, th, E_z)
-            # apply forward rotation
-            E = orientation.apply(E_raw, inverse=False)
-
-            return E
-
-        def _field_step_1(coord, c, inners):
-            # orient point
-            p_oriented = c.orientation.apply(coord - c.position, inverse=True)
-            # convert coordinate to cyl
-            p_cyl = toCyl(p_oriented)
-
-            E = compute_fields(rho=p_cyl[0], z=p_cyl[2],
-                               Q=c.current,
-                               O_radius=c.diameter / 2,
-                               I_radius=inners,
-                               orientation=c.orientation,
-                               th=p_cyl[1])
-
-            return E
+            return E_rho, E_z
 
         coords = params['coords']
         collection = params['collection']
         inners = params['inners']
+        coils = params.get('coils')
+        if coils is None:
+            coils = CoilGeometry.from_collection(collection, inners)
 
-        E = []
-        for coord in coords:
-            _e = np.zeros((3,), dtype=np.float64)
-            for i in range(len(collection)):
-                c = collection[i]
-                inner = float(inners[i])
-                _e += _field_step_1(coord, c, inner)
-            E.append(_e)
+        # every point into every coil's space at once, then the integral per point per coil
+        r, phi, z = coils.to_cylindrical(coords) # (m, C) each
+        E = np.empty(r.shape + (2,), dtype=np.float64)
+        for n in range(r.shape[0]):
+            for i in range(len(coils)):
+                E[n, i] = compute_fields(rho=r[n, i], z=z[n, i],
+                                         Q=coils.strengths[i],
+                                         O_radius=coils.radii[i],
+                                         I_radius=coils.inner_radii[i])
 
-        return np.array(E)
+        # convert results back to cartesian, apply each coil's forward rotation, and sum over the coils
+        return coils.cylindrical_to_world(E[..., 0], E[..., 1], phi).sum(axis=1)
 
 
 
@@ -433,4 +405,25 @@ class MagpySolver(Solver):
     def solve(self, params : dict):
         coords = params.get("coords")
         collection = params.get("collection")
-        return collection.getB(coords)
\ No newline at end of file
+        return collection.getB(coords)
+
+class Loop_b_Solver(Solver):
+    """
+    The 'loop' B method: the same field as MagpySolver from the closed form loop field (calcs.loop_field).
+    """
+    def solve(self, params : dict):
+        from calcs.loop_field import CircleLoops
+        coords = params.get("coords")
+        collection = params.get("collection")
+        return CircleLoops.from_collection(collection).getB(coords, squeeze=False)
+
+class Annulus_b_Solver(Solver):
+    """
+    The 'annulus' B method: flat multi-turn coils of inner radii 'inners' (calcs.annulus_field).
+    """
+    def solve(self, params : dict):
+        from calcs.annulus_field import AnnularCoils
+        coords = params.get("coords")
+        collection = params.get("collection")
+        inners = params.get("inners")
+        return AnnularCoils.from_collection(collection, inners).getB(coords, squeeze=False)
\ No newline at end of file
@@ -6,7 +6,10 @@ from concurrent.futures import as_completed
 thetas = np.linspace(0, 2 * np.pi, 200)
 dtheta = thetas[1] - thetas[0]
 
-def compute_fields(rho, z, Q, O_radius, I_radius=0, orientation=None, th=0):
+def disk_field(rho, z, Q, O_radius, I_radius=0):
+    """
+    (E_rho, E_z) of a charged annulus (washer) at (rho, z) in its own frame.
+    """
     sigma = Q / (np.pi * O_radius ** 2)  # charge density C/m^2
     prefactor = sigma / (4 * np.pi * epsilon_0)
 
@@ -37,6 +40,11 @@ def compute_fields(rho, z, Q, O_radius, I_radius=0, orientation=None, th=0):
     E_rho = prefactor * Erho
     E_z   = prefactor * Ez
 
+    return E_rho, E_z
+
+def compute_fields(rho, z, Q, O_radius, I_radius=0, orientation=None, th=0):
+    E_rho, E_z = disk_field(rho, z, Q, O_radius, I_radius)
+
     # FORMAT OUTPUT
     # convert result back to cartesian
     E_raw = toCart(E_rho, th, E_z)
@@ -48,55 +56,43 @@ def compute_fields(rho, z, Q, O_radius, I_radius=0, orientation=None, th=0):
 from magpylib import Collection
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+from calcs.coil_geometry import CoilGeometry
 
-def _field_step_1(coord, c, inners):
-    # orient point
-    p_oriented = c.orientation.apply(coord - c.position, inverse=True)
-    # convert coordinate to cyl
-    p_cyl = toCyl(p_oriented)
-
-    E = compute_fields(rho = p_cyl[0], z = p_cyl[2],
-                   Q = c.current,
-                   O_radius = c.diameter / 2,
-                   I_radius = inners,
-                   orientation = c.orientation,
-                   th = p_cyl[1])
-
-    return E
-
-def fields_from_grid(grid, c, inners):
+def _disk_fields(points, coils:CoilGeometry, submit=None):
+    """
+    E of the washers at (n, 3) points, (n, 3): every point goes into every coil's frame at once,
+    then the annulus integral runs per point per coil (through submit(f, *args) -> future, if given).
+    """
+    r, phi, z = coils.to_cylindrical(points) # (n, C) each
+    args = [(r[n, k], z[n, k], coils.strengths[k], coils.radii[k], coils.inner_radii[k])
+            for n in range(r.shape[0]) for k in range(len(coils))]
+    if submit is None:
+        e = [disk_field(*a) for a in args]
+    else:
+        # (results in submission order: each coil's result goes back through its own frame)
+        e = [future.result() for future in [submit(disk_field, *a) for a in args]]
+    e = np.array(e, dtype=np.float64).reshape(r.shape + (2,))
+    return coils.cylindrical_to_world(e[..., 0], e[..., 1], phi).sum(axis=1)
+
+def fields_from_grid(grid, c, inners, coils:CoilGeometry=None):
     # grid is expected to be shaped 100, 100, 100, 3
-    x, y, z = np.moveaxis(grid, -1, 0)
-    points = np.column_stack((x.ravel(), y.ravel(), z.ravel()))
-    #print(points)
-
-    out = []
-
-    for point in points:
-        e_val = [_field_step_1(point, cir, inner)
-                 for cir, inner in zip(c.children, np.array(inners, dtype=np.float64))]
-        out.append(np.sum(np.array(e_val), axis=0))
+    if coils is None:
+        coils = CoilGeometry.from_collection(c, inners)
+    points = grid.reshape(-1, 3)
 
-    out = np.array(out)
-    out = np.reshape(out, (100, 100, 100, 3))
+    out = _disk_fields(points, coils)
+    out = np.reshape(out, grid.shape)
     print(out)
     return out
 
-def compute_disk_with_collection(coord, collection:Collection, inners, executor:ThreadPoolExecutor):
+def compute_disk_with_collection(coord, collection:Collection, inners, executor:ThreadPoolExecutor,
+                                 coils:CoilGeometry=None):
     """
     Needs to take in the point (in cartesian space), the collection, and a list of inner_radius values
     and output the E-field (also in cartesian space)
+    coils: the collection's geometry (with inners), if the caller has it already
     """
-    # combine inners and collection children to a dict so map can iterate over them at the same time
-
-
-    # GET THE E RHO AND E ZETA
-    futures=[executor.submit(_field_step_1, coord, c, inners)
-             for c, inners in zip(collection.children, np.array(inners, dtype=np.float64))]
-
-    out = []
-    # populate E container with results from each ring (all values are rotated back)
-    for future in as_completed(futures):
-        out.append(future.result())
-
-    return np.sum(np.array(out), axis=0) # total E = sum by column
+    if coils is None:
+        coils = CoilGeometry.from_collection(collection, inners)
+    # GET THE E RHO AND E ZETA of each ring, and rotate them back
+    return _disk_fields(coord, coils, executor.submit)[0] # total E = sum over the rings
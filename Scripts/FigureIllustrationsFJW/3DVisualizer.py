@@ -3,16 +3,19 @@
 Generates a 3D volumetric grid of |B|, renders interactive 3D isosurfaces,
 and overlays explicit 3D wireframe rings representing the physical coils.
 
+The coils are evaluated with calcs.annulus_field (the 'annulus' B method of the pushers), the whole volume
+at once; run from the project root with PYTHONPATH=.:Scripts.
+
 Author: FJ Wessel & AI Collaborator
 """
 
 import numpy as np
 import plotly.graph_objects as go
-from scipy.special import ellipk, ellipe
-from scipy.integrate import quad
+
+from calcs.coil_geometry import CoilGeometry
+from calcs.annulus_field import AnnularCoils
 
 # --- CONSTANTS & PARAMETERS ---
-mu_0 = 4 * np.pi * 1e-7
 
 # 1. Face Coils (All moments outward)
 r_face_in = 0.15
@@ -53,60 +56,21 @@ for vec in corner_raw:
     x_loc /= np.linalg.norm(x_loc)
     corner_configs.append({'center': center, 'z_loc': z_loc, 'x_loc': x_loc})
 
-def compute_disk_B_kernel(r_l, z_l, r_in, r_out, K_surface):
-    if r_l < 1e-6:
-        val, _ = quad(lambda rp: rp ** 2 / ((rp ** 2 + z_l ** 2) ** (1.5)), r_in, r_out)
-        return 0.0, (mu_0 * K_surface / 2.0) * val
-
-    def integrand_bz(rp):
-        d1 = np.sqrt((r_l + rp) ** 2 + z_l ** 2)
-        d2 = (r_l - rp) ** 2 + z_l ** 2
-        k2 = (4 * r_l * rp) / ((r_l + rp) ** 2 + z_l ** 2)
-        if abs(d2) < 1e-6 or abs(k2 - 1.0) < 1e-6: return 0.0
-        return (1.0 / d1) * (ellipk(k2) + ((rp ** 2 - r_l ** 2 - z_l ** 2) / d2) * ellipe(k2))
-
-    def integrand_br(rp):
-        d1 = np.sqrt((r_l + rp) ** 2 + z_l ** 2)
-        d2 = (r_l - rp) ** 2 + z_l ** 2
-        k2 = (4 * r_l * rp) / ((r_l + rp) ** 2 + z_l ** 2)
-        if abs(d2) < 1e-6 or abs(k2 - 1.0) < 1e-6: return 0.0
-        return (1.0 / d1) * (-ellipk(k2) + ((r_l ** 2 + rp ** 2 + z_l ** 2) / d2) * ellipe(k2))
-
-    bz_val, _ = quad(integrand_bz, r_in, r_out, limit=30)
-    br_val, _ = quad(integrand_br, r_in, r_out, limit=30)
-    return (mu_0 * K_surface / (2.0 * np.pi)) * (z_l / r_l) * br_val, (mu_0 * K_surface / (2.0 * np.pi)) * bz_val
+# --- ANNULAR COILS (6 faces, then 8 corners) ---
+coil_configs = face_configs + corner_configs
+coils = AnnularCoils(CoilGeometry.from_frames(centres=[cfg['center'] for cfg in coil_configs],
+                                              z_axes=[cfg['z_loc'] for cfg in coil_configs],
+                                              x_axes=[cfg['x_loc'] for cfg in coil_configs],
+                                              radii=[r_face_out] * 6 + [r_corner_out] * 8,
+                                              strengths=[K_face * (r_face_out - r_face_in)] * 6
+                                                        + [K_corner * (r_corner_out - r_corner_in)] * 8,
+                                              inner_radii=[r_face_in] * 6 + [r_corner_in] * 8),
+                     order=64)
 
 def get_total_B_mag(X, Y, Z):
-    B_total = np.zeros(3)
-    P_global = np.array([X, Y, Z])
-
-    for face in face_configs:
-        P_rel = P_global - face['center']
-        z_l = np.dot(P_rel, face['z_loc'])
-        x_l = np.dot(P_rel, face['x_loc'])
-        y_loc_axis = np.cross(face['z_loc'], face['x_loc'])
-        y_l = np.dot(P_rel, y_loc_axis)
-        r_l = np.sqrt(x_l ** 2 + y_l ** 2)
-
-        br_l, bz_l = compute_disk_B_kernel(r_l, z_l, r_face_in, r_face_out, K_face)
-        bx_l = br_l * (x_l / r_l) if r_l > 1e-6 else 0.0
-        by_l = br_l * (y_l / r_l) if r_l > 1e-6 else 0.0
-        B_total += bz_l * face['z_loc'] + bx_l * face['x_loc'] + by_l * y_loc_axis
-
-    for corner in corner_configs:
-        P_rel = P_global - corner['center']
-        z_l = np.dot(P_rel, corner['z_loc'])
-        x_l = np.dot(P_rel, corner['x_loc'])
-        y_loc_axis = np.cross(corner['z_loc'], corner['x_loc'])
-        y_l = np.dot(P_rel, y_loc_axis)
-        r_l = np.sqrt(x_l ** 2 + y_l ** 2)
-
-        br_l, bz_l = compute_disk_B_kernel(r_l, z_l, r_corner_in, r_corner_out, K_corner)
-        bx_l = br_l * (x_l / r_l) if r_l > 1e-6 else 0.0
-        by_l = br_l * (y_l / r_l) if r_l > 1e-6 else 0.0
-        B_total += bz_l * corner['z_loc'] + bx_l * corner['x_loc'] + by_l * y_loc_axis
-
-    return np.linalg.norm(B_total)
+    P_global = np.stack(np.broadcast_arrays(X, Y, Z), axis=-1)
+    B_total = coils.getB(P_global.reshape(-1, 3)).reshape(P_global.shape)
+    return np.linalg.norm(B_total, axis=-1)
 
 def get_3d_ring_points(center, normal, radius, num_pts=80):
     """Generates 3D coordinates tracing a circle around a given center normal."""
@@ -126,14 +90,8 @@ bound = 2.0
 span = np.linspace(-bound, bound, grid_res)
 X, Y, Z = np.meshgrid(span, span, span, indexing='ij')
 
-B_mag_volume = np.zeros(X.shape)
-
 print(f"Populating {grid_res}^3 volumetric field matrix...")
-for i in range(grid_res):
-    print(f"Processing slice {i+1} of {grid_res}...")
-    for j in range(grid_res):
-        for k in range(grid_res):
-            B_mag_volume[i, j, k] = get_total_B_mag(X[i,j,k], Y[i,j,k], Z[i,j,k])
+B_mag_volume = get_total_B_mag(X, Y, Z)
 
 # --- BUILD PLOTLY CANVAS ---
 print("Rendering interactive 3D visualization window...")
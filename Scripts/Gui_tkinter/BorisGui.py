@@ -28,7 +28,7 @@ from Gui_tkinter.styles import load_styles
 from Gui_tkinter.widgets.constructs import *
 
 # state dict
-from system.state_dict_main import AppConfig, AppConfigMeta
+from system.state_dict_main import AppConfig, AppConfigMeta, fill_missing_fields
 
 import pickle
 from system.bus import CommandBus
@@ -46,7 +46,7 @@ class App(tk.Tk):
     paths = {} # directories that correspond to the expected usage {key (usage) : value (Path data object)
 
 
-    def __init__(self, manager):
+    def __init__(self):
         # before doing anything, ensure that you are the only instance.
         if "_initialized" in self.__dict__:
             return
@@ -86,7 +86,7 @@ class App(tk.Tk):
         self.construct_widgets() # everything else
 
         # Post widget init registering
-        self.event_registration(manager) # any widgets that need special event triggers
+        self.event_registration() # any widgets that need special event triggers
         self.scroll_registration() # any scrollable frames need to do this before being scrollable
 
         def print_params(event):
@@ -111,7 +111,7 @@ class App(tk.Tk):
         _pickle_path = os.path.join(self.paths['DIR_Config'], self.params_meta.filename)
         if os.path.exists(_pickle_path):
             with open(_pickle_path, 'rb') as f:
-                self.params = pickle.load(f)
+                self.params = fill_missing_fields(pickle.load(f))
         # If not, continue with the default instance (do nothing)
 
     def dump_params(self)->None:
@@ -202,12 +202,12 @@ class App(tk.Tk):
         self.scrollable_frames = [field_frame_s]
         self.input_file_widgets = [b_field_frame, e_field_frame, particle_preview]
 
-    def event_registration(self, manager)->None:
+    def event_registration(self)->None:
         """
         Widgets that need configured events get them assigned here
         """
         self.calculate_button.configure(command=partial(open_output_config, self,
-                                              manager, self.params, self.plotting_file_dir_var, self.bus))  # update calculate button's command after setting up params
+                                              self.params, self.plotting_file_dir_var, self.bus))  # update calculate button's command after setting up params
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.plotly_button.configure(command=partial(graph_trajectory_plotly_abstraction_layer,
@@ -681,6 +681,18 @@ class CircleCurrentConfig():
             del out['Rotations']
         return out
 
+@dataclass
+class AnnulusCurrentConfig(CircleCurrentConfig):
+    """
+    A row of an annular B coil: the Diameter is the outer one, Amp the total current (turns x current).
+    """
+    Inner_r: EntryTableParam = field(init=False)
+
+    def __init__(self, frame, PosX = 0, PosY = 0, PosZ = 0, Amp = 1e5, Diameter = 1, RotationAngle = [], RotationAxis = [], Inner_r=0.1):
+        super().__init__(frame=frame, PosX=PosX, PosY=PosY, PosZ=PosZ, Amp=Amp, Diameter=Diameter, RotationAngle=RotationAngle, RotationAxis=RotationAxis)
+        self.Inner_r = EntryTableParam(Inner_r, master=frame)
+        self.iterables.append(self.Inner_r)
+
 @dataclass
 class file_particle:
     '''
@@ -8,13 +8,12 @@ import pandas as pd
 import csv
 
 from calcs.magpy4c1 import runsim
-from calcs.magpy4c1_01 import _runsim
+from calcs.magpy4c1_01 import start_runsim_process
 from system.temp_manager import TEMPMANAGER_MANAGER, read_temp_file_dict, write_dict_to_temp
 from system.temp_file_names import manager_1, m1f1
 from events.events import Events
 
-import threading
-from multiprocessing import Manager
+from calcs.progress import ProgressChannel
 
 from Gui_tkinter.widgets.progress_window import calculate_progress_window
 from events.events import Events
@@ -129,15 +128,15 @@ def FieldCallback(event, value:ttk.Combobox, xcontainer:Entry, ycontainer:Entry,
 # after the popup closes, invoke the calculate callback function.
 from Gui_tkinter.widgets.output_file.output_config import output_popup
 from functools import partial
-def open_output_config(root, manager, params, bus, *args):
+def open_output_config(root, params, bus, *args):
     #get_output_name()
-    popup = output_popup(master=root, close_callable=partial(CalculateCallback,root, manager, params, bus, *args), params=params)
+    popup = output_popup(master=root, close_callable=partial(CalculateCallback,root, params, bus, *args), params=params)
     return popup
 
 
 # Run the simulation if you press calculate
 
-def CalculateCallback(root, manager, params, file_dir_var, bus):
+def CalculateCallback(root, params, file_dir_var, bus):
     '''
     When the calculate button is pressed, the GUI passes key information to
     the backend and starts the simulation.
@@ -190,12 +189,12 @@ def CalculateCallback(root, manager, params, file_dir_var, bus):
 
     #####################################################################################
     # STUFF FOR THE PROGRESS WINDOW (WHICH NEEDS RUNTIME DATA)
-        # a multiprocessing manager wraps the thread that creates the processpool.
-    queue = manager.Queue()
-    progress = calculate_progress_window(root, queue, params, graph_just_calculated_file)
-    process_thread = threading.Thread(target=_runsim, args=(queue, params), daemon=True)
-    process_thread.start()
-    progress.poll_queue()
+        # the run goes in a child process that reports to the window through shared memory (calcs.progress);
+        # the window's stop button asks it to stop.
+    channel = ProgressChannel(int(params.step.numsteps))
+    progress = calculate_progress_window(root, channel, params, graph_just_calculated_file)
+    progress.process = start_runsim_process(channel, params)
+    progress.poll_channel()
 
 
 def GatherParams(params:list):
@@ -25,6 +25,8 @@ import system.temp_file_names as names
 import h5py
 
 from Gui_tkinter.funcs.GuiEntryHelpers import File_to_Collection
+from files.hdf5.output_file_structure import particle_rows, n_particles
+from files.hdf5.tail import TrajectoryTail
 
 """
 the following r settings and callables that the classes will implement.
@@ -33,6 +35,9 @@ dpi = 100 # dpi of the graphs
 dropdown_font_textsize_proportion = 3
 trajectory_font_textsize_proportion = 4
 
+# how often a followed run's output file is polled for new rows (PlottingWindowObj.set_live), ms
+LIVE_POLL_MS = 2000
+
 # SETTINGS FOR NEW TOPLEVEL WINDOW GRAPH
 # these are in inches.
 toplevel_width = 8
@@ -126,9 +131,10 @@ def graph_b_corner(plot, c:mp.Collection, res=100):
 These functions expect a pre-labelled, empty subplot to draw on.
 Also, they do not call the draw function. That should be done externally.
 
-Pls note that right now, they will only graph the data of particle 0.
+The step graphs show one particle (kwargs 'particle', 0 by default); only its rows are read, through the
+particle index of the output file (files.hdf5.output_file_structure).
 """
-def Param_v_Step_callable(fig, plot, path, id, **kwargs):
+def Param_v_Step_callable(fig, plot, path, id, particle=0, **kwargs):
     """
     for tracking a single parameter involved in the simulation as a linegraph respective to the step count.
     used for the vel, b-mag, e-mag v, step graphs.
@@ -172,14 +178,15 @@ def Param_v_Step_callable(fig, plot, path, id, **kwargs):
 
 
     with h5py.File(path, 'r+') as f:
-        ds = f[h5_dct[id]['src']]
+        rows = particle_rows(f, particle)
+        ds = f[h5_dct[id]['src']][rows]
         x, y, z = ds[h5_dct[id]['xn']], ds[h5_dct[id]['yn']], ds[h5_dct[id]['zn']]
         coords = np.column_stack((x,y,z))
         #print(coords)
 
             # get the graphable components
             # 1. the magnitude of the component at each step.
-        step_mag = magnitude_at_each_step(coords, f, h5_dct[id]['src'], h5_dct[id]['mag_key'])[:-1]
+        step_mag = magnitude_at_each_step(coords, f, h5_dct[id]['src'], h5_dct[id]['mag_key'], rows)[:-1]
         #print(step_mag)
 
             # for now, b has only this line.
@@ -189,15 +196,15 @@ def Param_v_Step_callable(fig, plot, path, id, **kwargs):
             return True
         else:
             #print("hi")
-            b_ds = f[h5_dct['b']['src']]
+            b_ds = f[h5_dct['b']['src']][rows]
                 # everyone else gets parallel and perpendicular components also graphed, which are calculated relative to b.
             #bx,by,bz = dfslice["bx"].to_numpy(), dfslice["by"].to_numpy(), dfslice["bz"].to_numpy() # b components at each step to calculate v||, e||
             bx, by, bz = b_ds[h5_dct['b']['xn']], b_ds[h5_dct['b']['yn']], b_ds[h5_dct['b']['zn']]
             bs = np.column_stack((bx, by, bz)) # b coordinates all in one array.
 
                 # get the parallel and perpendicular components relative to b
-            step_parallel = np.abs(get_parallel(bs, coords, f, h5_dct[id]['src'], h5_dct[id]['par_key'])[:-1])
-            step_perpendicular = get_perpendicular(bs, coords, f, h5_dct[id]['src'], h5_dct[id]['perp_key'])[:-1]
+            step_parallel = np.abs(get_parallel(bs, coords, f, h5_dct[id]['src'], h5_dct[id]['par_key'], rows)[:-1])
+            step_perpendicular = get_perpendicular(bs, coords, f, h5_dct[id]['src'], h5_dct[id]['perp_key'], rows)[:-1]
 
                 # graph these guys.
             plot.plot(step_mag, label='mag', color='green')
@@ -211,41 +218,27 @@ def Param_v_Step_callable(fig, plot, path, id, **kwargs):
             plot.legend(bbox_to_anchor=(0, 1.15), loc='lower left', fontsize=8, ncol=3 )
 
 
-def Trajectory_callable(fig, plot, v1, v2, v3, path, c:mp.Collection, **kwargs):
+# palettes for multiple particles, taken in turn.
+trajectory_palettes = ["copper", "gist_heat"]
+
+def _scatter_trajectory(views, x, y, z, colors, c, **kwargs):
     """
-    for graphing the 3d trajectory of a single particle.
+    scatters one particle's points in the isometric view and the three planes.
+    c: colour of each point on the palette (0 to 1 over the run)
     """
-    palettes = ["copper", "gist_heat"] # supported palettes for multiple particles.
-
-    with h5py.File(path, 'r') as f:
-        # get the number of particles. Because 'id' is working with a 0 index, add 1.
-        #nump = df["id"].max() + 1
-        nump=1
-        # Graph trajectory for each particle
-        df = f['src/position']
-        for part in range(nump):
-            # extract data from dataframe
-            #dfslice = df[df["id"] == part] # only using info from the corresponding particle id.
-            #x, y, z = dfslice["px"].to_numpy(), dfslice["py"].to_numpy(), dfslice["pz"].to_numpy() #x, y, z coord points at each step
-            x, y, z = df["px"], df["py"], df["pz"]  # x, y, z coord points at each step
-            # make the matching index's color palette a colormap distributed across the steps.
-            colors = mpl.colormaps[palettes[part]]
+    for view in views:
+        view.scatter(x, y, z, cmap=colors, c=c, s=2.5, **kwargs)
 
-            # actually plot everything.
-                # isometric
-            plot.scatter(x,y,z, cmap=colors, c=np.linspace(0,1,len(x)), s=2.5)
-                # XY
-            v1.scatter(x,y,z, cmap=colors, c=np.linspace(0,1,len(x)), s=2.5)
-            v1.view_init(elev=90, azim=-90, roll=0)
-            v1.set_title("XY Plane", pad=0)
-                # YZ
-            v2.scatter(x, y, z, cmap=colors, c=np.linspace(0, 1, len(x)), s=2.5)
-            v2.view_init(elev=0, azim=0, roll=0)
-            v2.set_title("YZ Plane", pad=0)
-                # XZ
-            v3.scatter(x, y, z, cmap=colors, c=np.linspace(0, 1, len(x)), s=2.5)
-            v3.view_init(elev=0, azim=-90, roll=0)
-            v3.set_title("XZ Plane", pad=0)
+def _trajectory_frame(plot, v1, v2, v3, path, c:mp.Collection):
+    """
+    the coils, plane views and labels around the trajectory.
+    """
+    v1.view_init(elev=90, azim=-90, roll=0)
+    v1.set_title("XY Plane", pad=0)
+    v2.view_init(elev=0, azim=0, roll=0)
+    v2.set_title("YZ Plane", pad=0)
+    v3.view_init(elev=0, azim=-90, roll=0)
+    v3.set_title("XZ Plane", pad=0)
 
     canvases = [plot, v1, v2, v3]
     # Additionally, we want to also show the coil configuration.
@@ -274,6 +267,37 @@ def Trajectory_callable(fig, plot, v1, v2, v3, path, c:mp.Collection, **kwargs):
     v2.get_xaxis().set_ticks([])
     v3.get_yaxis().set_ticks([])
 
+def Trajectory_callable(fig, plot, v1, v2, v3, path, c:mp.Collection, **kwargs):
+    """
+    for graphing the 3d trajectory of each particle.
+    """
+    with h5py.File(path, 'r') as f:
+        nump = n_particles(f)
+        # Graph trajectory for each particle
+        ds = f['src/position']
+        for part in range(nump):
+            # extract the particle's rows (files.hdf5.output_file_structure)
+            df = ds[particle_rows(f, part)]
+            # make the matching index's color palette a colormap distributed across the steps.
+            colors = mpl.colormaps[trajectory_palettes[part % len(trajectory_palettes)]]
+            _scatter_trajectory([plot, v1, v2, v3], df["px"], df["py"], df["pz"], colors, np.linspace(0, 1, len(df)))
+
+    _trajectory_frame(plot, v1, v2, v3, path, c)
+
+def Trajectory_tail_callable(fig, plot, v1, v2, v3, tail:TrajectoryTail, **kwargs):
+    """
+    for following a run that is still going (OutputConfig.live): adds the rows written since the last call.
+    The points are coloured by how far into its preallocated rows each particle is, so the palette only
+    fills up as the run does. returns whether there was anything new.
+    """
+    new = tail.poll()
+    for part, (start, rows) in new.items():
+        df = rows['/src/position']
+        colors = mpl.colormaps[trajectory_palettes[part % len(trajectory_palettes)]]
+        c = (start + np.arange(len(df))) / tail.capacity(part)
+        _scatter_trajectory([plot, v1, v2, v3], df["px"], df["py"], df["pz"], colors, c, vmin=0, vmax=1)
+    return len(new) > 0
+
 '''
 the following r the actual classes that implement the previously established settings and functions.
 '''
@@ -424,11 +448,17 @@ class StaticFigure(tk.Frame):
         """
         self.prepareGraph()
         func(self.fig, self.plot, self.v1, self.v2, self.v3, df, **kwargs) # the graphing logic is being applied here.
+        self.refresh()
+        return True
+
+    """
+    Saves the figure as it is now and shows it (also used to add points to a live trajectory without a redraw).
+    """
+    def refresh(self):
         self.gs.tight_layout(self.fig)
         self.fig.savefig(self.png_full_path, bbox_inches='tight') # save to file. Will overwrite if file exists alr.
 
         self.displayImage() # after saving, display the image to self.img_label (tk.Label)
-        return True
 
 
 class CanvasFigure(tk.Frame):
@@ -621,6 +651,8 @@ class PlottingWindowObj(tk.Frame):
         self.path = label
         self._path = self.path.get()
         self._h_path = None
+        self.tail = None # files.hdf5.tail.TrajectoryTail while following a run (set_live)
+        self._live_job = None
         super().__init__(master)
         self.config(highlightbackground='black', highlightthickness='2') # visualize frame bounds
 
@@ -667,7 +699,10 @@ class PlottingWindowObj(tk.Frame):
         #print(self.df)
         # trajectory callable needs: the fig, plot, dataframe, collection.
         traj_args = {'c' : self.c}
-        self.trajectory.updateGraph(self._h_path, Trajectory_callable, **traj_args)
+        if self.tail is not None:
+            self.start_tail()
+        else:
+            self.trajectory.updateGraph(self._h_path, Trajectory_callable, **traj_args)
         # everything else's callable needs: the fig, plot, dataframe, id.
         # these are decided in the DropdownFigure object themselves.
         self.graph1.updateGraph(self._h_path, c=self.c)
@@ -727,6 +762,39 @@ class PlottingWindowObj(tk.Frame):
         
         self.update_all_graphs()'''
 
+    def set_live(self, on:bool):
+        """
+        Follow run: while on, the trajectory graph polls the selected output file every LIVE_POLL_MS and adds the
+        rows its run has written since (files.hdf5.tail), instead of being drawn once when the file is selected.
+        """
+        if self._live_job is not None:
+            self.after_cancel(self._live_job)
+            self._live_job = None
+        if not on:
+            self.tail = None
+            return
+        self.tail = TrajectoryTail(self._h_path)
+        if self._h_path is not None:
+            self.start_tail()
+
+    def start_tail(self):
+        """
+        redraws the trajectory graph from the start of the (live) output file and keeps polling it.
+        """
+        if self._live_job is not None:
+            self.after_cancel(self._live_job)
+        self.tail = TrajectoryTail(self._h_path)
+        self.trajectory.prepareGraph()
+        _trajectory_frame(self.trajectory.plot, self.trajectory.v1, self.trajectory.v2, self.trajectory.v3,
+                          self._h_path, self.c)
+        self.poll_tail()
+
+    def poll_tail(self):
+        if Trajectory_tail_callable(self.trajectory.fig, self.trajectory.plot, self.trajectory.v1,
+                                    self.trajectory.v2, self.trajectory.v3, self.tail):
+            self.trajectory.refresh()
+        self._live_job = self.after(LIVE_POLL_MS, self.poll_tail)
+
     def set_active(self):
         """
         binds to the configure event on window size change.
@@ -56,13 +56,13 @@ def build_field_tab(parent, params:AppConfig):
     b_field_labelFrame = ttk.LabelFrame(parent.frame, text="B-Field")
     e_field_labelFrame = ttk.LabelFrame(parent.frame, text="E-Field")
 
-    field_notebook = Field_Notebook(b_field_labelFrame, ['zero', 'magpy'],
-                                    [ZeroTableTab, RingTableTab],
+    field_notebook = Field_Notebook(b_field_labelFrame, ['zero', 'magpy', 'loop', 'annulus'],
+                                    [ZeroTableTab, RingTableTab, RingTableTab, DiskTab],
                                     collection_key="b.collection",
                                     tab_key="b.method",
-                                    dataclasses=[None, CircleCurrentConfig],
-                                    param_classes=[None, FieldConfig],
-                                    dir_names=[None, "CoilConfigurations"],
+                                    dataclasses=[None, CircleCurrentConfig, CircleCurrentConfig, AnnulusCurrentConfig],
+                                    param_classes=[None, FieldConfig, FieldConfig, AnnulusFieldConfig],
+                                    dir_names=[None, "CoilConfigurations", "CoilConfigurations", "AnnularCoils"],
                                     path_key="path.b",
                                     name_key='b.name',
                                     field="b",
@@ -157,6 +157,14 @@ def build_plot_tab(parent, main, DIR_Output, params):
     trajectoryGraph = PlottingWindowObj(plot_graph_traj, main, name_out_file_var)
     trajectoryGraph.grid(row=0, column=0)
 
+    # follow a run that is still writing its output file (OutputConfig.live)
+    live_var = tk.BooleanVar(value=False)
+    check_live = ttk.Checkbutton(plot_out_file,
+                                 text="Follow run (live)",
+                                 variable=live_var,
+                                 command=lambda: trajectoryGraph.set_live(live_var.get()))
+    check_live.grid(row=1, column=1)
+
     '''
     We need to keep watch on the selected data file value, and ensure that this button is active only when
     there is a valid data file selected.
@@ -223,13 +231,16 @@ def build_field_vis_tab(parent, params:AppConfig):
         "bob_e": GraphFactory(Bob_e_Solver, Bob_e_Grapher, field='e', params=params),
         "washer_potential" : GraphFactory(Washer_Potential_e_Solver, Washer_Potential_e_Grapher, field='e', params=params),
         "disk_e" : GraphFactory(Disk_e_Solver, Disk_e_Grapher, field='e', params=params),
-        'magpy' : GraphFactory(MagpySolver, MagpyGrapher, field='b', params=params)
+        'magpy' : GraphFactory(MagpySolver, MagpyGrapher, field='b', params=params),
+        'loop' : GraphFactory(Loop_b_Solver, MagpyGrapher, field='b', params=params),
+        'annulus' : GraphFactory(Annulus_b_Solver, Disk_e_Grapher, field='b', params=params),
         # "disk_e": GraphFactory(Bob_e_Solver, Bob_e_Grapher, **graph_args, collection=params.e.collection),
     }
     # extra keyword arguments to call when creating the grapher instance.
     make_args = {
         "washer_potential" : {'inners' : 'e.inner_r'},
-        "disk_e": {'inners': 'e.inner_r'}
+        "disk_e": {'inners': 'e.inner_r'},
+        "annulus": {'inners': 'b.inner_r'}
     }
 
 
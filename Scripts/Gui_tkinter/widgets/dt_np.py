@@ -15,6 +15,7 @@ from events.funcs import before_simulation_bob_dt
 
 from system.state_dict_main import AppConfig
 from system.state_dict import DynDtConfig
+from calcs.integrators import INTEGRATORS
 
 """
 Associated params for the bob timestep scaling.
@@ -147,6 +148,14 @@ class TimeStep_n_NumStep():
         self.numsteps.value.trace_add("write", self._Total_Sim_Time)
         self.numsteps.value.trace_add("write", self.update_numsteps)
 
+        # which push to use (calcs.integrators)
+        self.integrator = tk.StringVar(value=self.params.step.integrator)
+        tk.Label(self.frame2, text="Integrator: ", justify="left").grid(row=2, column=0, sticky="W")
+        self.integrator_box = ttk.Combobox(self.frame2, values=list(INTEGRATORS), textvariable=self.integrator,
+                                           state='readonly', width=17, justify='center')
+        self.integrator_box.grid(row=2, column=1, sticky="E")
+        self.integrator.trace_add("write", self.update_integrator)
+
         # display the simulation time
         self.simFrame = tk.Frame(self.master, bg="gray")
         self.simFrame.grid(row=0, column=1, sticky="NWES", columnspan=3)
@@ -261,6 +270,9 @@ class TimeStep_n_NumStep():
     def update_numsteps(self, *args):
         self.params.step.numsteps = int(self.numsteps.entry.get())
 
+    def update_integrator(self, *args):
+        self.params.step.integrator = self.integrator.get()
+
 
     def update_do_bob(self, *args):
         """
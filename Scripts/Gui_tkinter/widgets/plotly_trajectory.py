@@ -8,10 +8,11 @@ import h5py
 import magpylib as magpy
 import numpy as np
 from pathlib import Path
+from files.hdf5.output_file_structure import particle_rows
 
 def graph_trajectory_plotly(hdfpath, collection:magpy.Collection):
     with h5py.File(hdfpath, mode='r') as f:
-        df = f['src/position']
+        df = f['src/position'][particle_rows(f, 0)] # the first particle's rows
         x, y, z = df["px"], df["py"], df["pz"]  # x, y, z coord points at each step
 
     cut = int(x.shape[0] // 1000) #intervals for animation
@@ -5,18 +5,23 @@ from system.temp_file_names import manager_1, m1f1
 from Gui_tkinter.widgets.menu.text_styles import GUI_Label
 from settings.palettes import GUI_Fonts
 from files.create import get_unique_coil_collection_amps
-from calcs.magpy4c1_manager_queue_datatype import Manager_Data
+import numpy as np
+from calcs.progress import ProgressChannel
+
+# side of the mini trajectory canvas, pixels
+trajectory_px = 300
 
 """
 a pop-up window created right after the 'calculate' button is pressed.
 keeps track of simulation progress.
 """
 class calculate_progress_window(tk.Toplevel):
-    def __init__(self, parent: tk.Tk, queue, params, post_stop:callable = None):
+    def __init__(self, parent: tk.Tk, channel:ProgressChannel, params, post_stop:callable = None):
         tk.Toplevel.__init__(self, parent)
         self.post_func = post_stop
-            # multiprocessing manager
-        self.result_queue = queue
+            # shared memory the pusher reports to (calcs.progress)
+        self.channel = channel
+        self.process = None # the run's multiprocessing.Process, if it has one
         self.step_var = tk.StringVar()
             # window geometry
         self.parent = parent
@@ -24,6 +29,9 @@ class calculate_progress_window(tk.Toplevel):
 
             # window internals
         self.live = live_info(self, self.step_var)
+        self.stop_button = tk.Button(self.live, text="Stop run", command=self.stop)
+        self.stop_button.grid(row=4, column=0, columnspan=2)
+        self.protocol("WM_DELETE_WINDOW", self.stop) # closing the window stops the run too
         self.separator = ttk.Separator(self, orient='vertical')
         self.summary = param_summary(self, params)
 
@@ -32,24 +40,36 @@ class calculate_progress_window(tk.Toplevel):
         self.separator.pack(side=tk.LEFT, expand=True, fill="y")
         self.summary.pack(side=tk.LEFT, expand=True, fill="y")
 
-    def poll_queue(self):
+    def stop(self):
+        """
+        asks the run to stop after its current step. It flushes what it has and reports done, which closes the window.
+        """
+        self.channel.request_stop()
+        self.stop_button.config(text="Stopping...", state=tk.DISABLED)
+
+    def poll_channel(self):
+        """
+        reads the pusher's latest state every 100 ms until it says it's done.
+        """
         try:
-            while not self.result_queue.empty():
-                result:Manager_Data
-                result = self.result_queue.get_nowait()
-                #print(result)
-                self.step_var.set(str(result.step))
-
-                # close the window if you get the queue flag to do so
-                if result.do_stop:
-                    #print(f"should destroy progress window")
-                    if self.post_func is not None:
-                        self.post_func()
-                    self.destroy()
+            state = self.channel.read()
         except Exception as e:
-            print(f"Error reading from queue: {e}")
-        finally:
-            self.parent.after(100, self.poll_queue)
+            print(f"Error reading the progress channel: {e}")
+            self.parent.after(100, self.poll_channel)
+            return
+        self.step_var.set(f"{state['step']} / {state['num_points']}")
+        self.live.show(state)
+
+        # close the window once the pusher says it's done
+        if state['done']:
+            if self.process is not None:
+                self.process.join()
+            if self.post_func is not None:
+                self.post_func()
+            self.channel.close()
+            self.destroy()
+            return
+        self.parent.after(100, self.poll_channel)
 
 """
 the rightside section of the progress window, holds a summary of the parameters in use.
@@ -127,8 +147,43 @@ class live_info(tk.Frame):
         ###########################################################
             # MINIMUM VIABLE: JUST A LABEL SAYING THE CURRENT STEP
         self.step_var = step_var
+        self.time_var = tk.StringVar()
+        self.rate_var = tk.StringVar()
+
+        step_label_label = tk.Label(self, text='Step: ')
+        self.step_label = tk.Label(self, textvariable=self.step_var)
+        time_label_label = tk.Label(self, text='Sim time (s): ')
+        time_label = tk.Label(self, textvariable=self.time_var)
+        rate_label_label = tk.Label(self, text='Steps/sec: ')
+        rate_label = tk.Label(self, textvariable=self.rate_var)
+
+            # mini trajectory: the last positions of the first particle, XY plane
+        self.traj = tk.Canvas(self, width=trajectory_px, height=trajectory_px, background="white")
+
+        step_label_label.grid(row=0, column=0, sticky="w")
+        self.step_label.grid(row=0, column=1, sticky="w")
+        time_label_label.grid(row=1, column=0, sticky="w")
+        time_label.grid(row=1, column=1, sticky="w")
+        rate_label_label.grid(row=2, column=0, sticky="w")
+        rate_label.grid(row=2, column=1, sticky="w")
+        self.traj.grid(row=3, column=0, columnspan=2, pady=10)
+
+    def show(self, state:dict):
+        """
+        updates the labels and the mini trajectory from a ProgressChannel.read()
+        """
+        self.time_var.set(f"{state['sim_time']:.4g}")
+        self.rate_var.set(f"{state['rate']:.1f}")
 
-        step_label_label = tk.Label(self.master, text='Step: ')
-        self.step_label = tk.Label(self.master, textvariable=self.step_var)
-        step_label_label.pack(side=tk.LEFT)
-        self.step_label.pack(side=tk.LEFT)
+        xy = state['positions'][:, :2]
+        xy = xy[np.isfinite(xy).all(axis=1)]
+        self.traj.delete("all")
+        if len(xy) < 2:
+            return
+        # fit the points in the canvas, same scale on both axes
+        lo, hi = xy.min(axis=0), xy.max(axis=0)
+        scale = (trajectory_px - 20) / max((hi - lo).max(), 1e-30)
+        px = 10 + (xy - lo) * scale
+        px[:, 1] = trajectory_px - px[:, 1] # canvas y points down
+        self.traj.create_line(*px.reshape(-1).tolist(), fill="black")
+        self.traj.create_oval(*(px[-1] - 3), *(px[-1] + 3), fill="red", outline="")
@@ -3,6 +3,7 @@ from Alg.polarSpace import toCyl
 import magpylib as mp
 from magpylib import Collection
 from magpylib.current import Circle
+from calcs.coil_geometry import CoilGeometry
 
 
 def bob_e_at(coord, q=1, radius=1, resolution=100, convert=True):
@@ -53,57 +54,31 @@ def bob_e_at(coord, q=1, radius=1, resolution=100, convert=True):
 
     return E_zeta, E_rho
 
-def bob_e_from_collection(grid, collection:Collection):
-    # grid is assumed to be (n, n, n, 3) shaped
+def bob_e_from_collection(grid, collection:Collection, coils:CoilGeometry=None):
+    """
+    grid: (n, n, n, 3) points
+    coils: the collection's geometry, if the caller has it already
+    returns the E of the rings as (3, n, n, n)
+    """
+    if coils is None:
+        coils = CoilGeometry.from_collection(collection)
     grid_shape = grid.shape
-    #_grid = np.moveaxis(grid, -1, 0)
     _coords = grid.reshape(-1, 3) # shape: (N,3)
-    #_coords = np.column_stack([grid[0].ravel(), grid[1].ravel(), grid[2].ravel()])
-
-    output_grid = np.zeros(grid_shape, dtype=np.float64)
-    for coil in collection.children_all:
-        # looping over each coil is better than looping over all points in the meshgrid
-        # First, rotate all points in the provided grid
-        coords = coil.orientation.apply((_coords - coil.position), inverse=True)
-        #   reshape back
-        coords = coords.reshape(grid_shape)
-
-        # convert all parts of the grid into cylindrical
-        # Assume 'grid' is shaped (100, 100, 100, 3) = (x, y, z)
-        x, y, z = np.moveaxis(coords, -1, 0)
-
-        # Cylindrical conversion
-        r = np.sqrt(x ** 2 + y ** 2)
-        theta = np.arctan2(y, x)
-        z_cyl = z  # z remains the same
-
-        # Stack if needed: shape (3, 100, 100, 100)
-        cylindrical_grid = np.stack((r, theta, z_cyl), axis=-1)
-
-        #print(f"orientation: {coil.orientation.as_matrix()}")
-        #print("cylindrical_grid.shape:", cylindrical_grid.shape)
-
-        zeta, rho = bob_e_at(cylindrical_grid, q=coil.current, radius=coil.diameter/2, resolution=150, convert=False)
-
-        # convert back to cartesian
-        x = rho * np.cos(theta)
-        y = rho * np.sin(theta)
-        z = zeta
-
-        cartesian_grid = np.column_stack((x.ravel(), y.ravel(), z.ravel()))
-
-        #print("cartesian_grid.shape:", cartesian_grid.shape)
-
-        # we need to apply the forward rotation of the coil before done
-        #_out = cartesian_grid.reshape(-1, 3)
-        #_out = np.column_stack([cartesian_grid[0].ravel(), cartesian_grid[1].ravel(), cartesian_grid[2].ravel()])
-        out = coil.orientation.apply(cartesian_grid, inverse=False)
-        out = out.reshape(grid_shape)
-        #out = cartesian_grid.reshape((100, 100, 100, 3))
-
-        output_grid += out
 
-    #output_grid = np.moveaxis(output_grid, 0, -1)
+    # rotate all points in the provided grid into every coil's frame at once, as cylindrical (N, C) arrays
+    r, theta, z = coils.to_cylindrical(_coords)
+    e_zeta = np.empty_like(r)
+    e_rho = np.empty_like(r)
+    for k in range(len(coils)):
+        # the integral coil by coil: its (resolution, N) temporaries are the large part
+        cylindrical_grid = np.stack((r[:, k], theta[:, k], z[:, k]), axis=-1).reshape(grid_shape)
+        zeta, rho = bob_e_at(cylindrical_grid, q=coils.strengths[k], radius=coils.radii[k], resolution=150,
+                             convert=False)
+        e_zeta[:, k] = zeta.ravel()
+        e_rho[:, k] = rho.ravel()
+
+    # back to cartesian, through each coil's forward rotation, and summed over the coils
+    output_grid = coils.cylindrical_to_world(e_rho, e_zeta, theta).sum(axis=1).reshape(grid_shape)
     return np.moveaxis(output_grid, -1, 0) # returns (3, 100, 100, 100)
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+"""
+The 'annulus' B method (calcs.annulus_field) against the scipy quad integral the BFieldFJW scripts used, for one
+0.15..0.8 m annulus: the largest difference relative to the field, on random points and on points a given height
+above the winding, for a few quadrature orders, and the time per point of both (the reference quad runs over
+calcs.loop_field, slower than the scripts' own elliptic integrand).
+
+run from the project root with PYTHONPATH=.:Scripts
+"""
+import time
+
+import numpy as np
+from scipy.integrate import quad
+
+from calcs.annulus_field import AnnularCoils
+from calcs.coil_geometry import CoilGeometry
+from calcs.loop_field import loop_field
+
+R_IN, R_OUT, CURRENT = 0.15, 0.8, 1e6
+ORDERS = (8, 16, 32, 64)
+HEIGHTS = (0.05, 0.01, 0.002)
+POINTS = 50
+
+def quad_B(point) -> np.ndarray:
+    """
+    B [T] of the annulus (axis z, at the origin) at point, with scipy quad over the loops
+    (with a break at the point's radius, limit 200).
+    """
+    r, z = np.hypot(point[0], point[1]), point[2]
+    k = CURRENT / (R_OUT - R_IN)
+    br = quad(lambda rp: loop_field(rp, r, z, k)[0], R_IN, R_OUT, points=[r] if R_IN < r < R_OUT else None,
+              limit=200, epsabs=0, epsrel=1e-10)[0]
+    bz = quad(lambda rp: loop_field(rp, r, z, k)[1], R_IN, R_OUT, points=[r] if R_IN < r < R_OUT else None,
+              limit=200, epsabs=0, epsrel=1e-10)[0]
+    cos, sin = (point[0] / r, point[1] / r) if r > 0 else (1., 0.)
+    return np.array([br * cos, br * sin, bz])
+
+def rel_err(b, ref) -> float:
+    return np.max(np.linalg.norm(b - ref, axis=1) / np.linalg.norm(ref, axis=1))
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    coils = CoilGeometry.from_frames([0, 0, 0], [0, 0, 1], [1, 0, 0], R_OUT, CURRENT, R_IN)
+    sets = {'random': rng.uniform(-2, 2, (POINTS, 3))}
+    for h in HEIGHTS:
+        sets[f'z={h}'] = np.column_stack([rng.uniform(0.1, 0.85, POINTS), np.zeros(POINTS), np.full(POINTS, h)])
+
+    start = time.perf_counter()
+    refs = {name: np.array([quad_B(p) for p in points]) for name, points in sets.items()}
+    t_quad = (time.perf_counter() - start) / (POINTS * len(sets))
+
+    print(f"{'order':>6}" + "".join(f"{name:>12}" for name in sets) + f"{'us/pt':>10}")
+    for order in ORDERS:
+        annuli = AnnularCoils(coils, order)
+        annuli.getB(sets['random'][:1])
+        start = time.perf_counter()
+        errs = [rel_err(annuli.getB(points), refs[name]) for name, points in sets.items()]
+        t = (time.perf_counter() - start) / (POINTS * len(sets))
+        print(f"{order:>6}" + "".join(f"{e:>12.1e}" for e in errs) + f"{t * 1e6:>10.1f}")
+    print(f"{'quad':>6}" + " " * 12 * len(sets) + f"{t_quad * 1e6:>10.1f}")
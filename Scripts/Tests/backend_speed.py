@@ -0,0 +1,74 @@
+"""
+Steps/sec of borisPush for every execution backend, per field method.
+Used to pick the defaults in calcs.backends.METHOD_BACKENDS.
+The particle gyrates inside a mirror, between two charged washers it never reaches, so it stays in for every
+step; the rate is still the steps read back from the output file (a lost particle would stop early).
+
+run from the project root with PYTHONPATH=.:Scripts
+"""
+import os
+import tempfile
+import time
+
+import magpylib as mp
+import h5py
+import numpy as np
+import pandas as pd
+
+from settings.configs.funcs.config_reader import runtime_configs
+from system.state_dict_main import AppConfig
+from system.state_dict import WasherFieldConfig
+from files.hdf5.output_file_structure import create_h5_output_file, particle_index
+from calcs.magpy4c1_01 import borisPush
+from calcs.backends import BACKENDS, make_executor
+
+NUMSTEPS = 2000
+
+def make_params(tmp, e_method):
+    params = AppConfig()
+    params.step.numsteps = NUMSTEPS
+    params.step.dt = 1e-9
+
+    params.b.method = "magpy"
+    params.b.collection = mp.Collection(
+        mp.current.Circle(position=(0, 0, 0.1), current=1e4, diameter=0.2),
+        mp.current.Circle(position=(0, 0, -0.1), current=1e4, diameter=0.2))
+
+    if e_method == "disk_e":
+        # on the mirror's axis, their holes wider than the orbit (gyroradius ~2.4 cm, centred 2.4 cm off axis)
+        params.e = WasherFieldConfig(method=e_method, inner_r=[0.06, 0.06])
+        params.e.collection = mp.Collection(
+            mp.current.Circle(position=(0, 0, 0.05), current=1e-9, diameter=0.16),
+            mp.current.Circle(position=(0, 0, -0.05), current=1e-9, diameter=0.16))
+    else:
+        params.e.method = e_method
+
+    params.path.particle = os.path.join(tmp, "particle.csv")
+    pd.DataFrame({'px': [0.], 'py': [0.], 'pz': [0.], 'vx': [1e5], 'vy': [0.], 'vz': [0.]}).to_csv(params.path.particle, index=False)
+    params.path.hdf5 = os.path.join(tmp, "data.hdf5")
+    params.particle.count = 1
+    create_h5_output_file(params.path.hdf5, NUMSTEPS + 1)
+    return params
+
+def steps_taken(params) -> int:
+    # rows of the particle, less the initial state
+    with h5py.File(params.path.hdf5, 'r') as f:
+        return int(particle_index(f)[0]['length']) - 1
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        runtime_configs.read_dict({'Paths': {'outputs': tmp}})
+        results = []
+        for e_method in ("zero", "disk_e"):
+            for backend in BACKENDS:
+                params = make_params(tmp, e_method)
+                start = time.perf_counter()
+                with make_executor(backend) as executor:
+                    borisPush(executor, params, None, backend=backend)
+                elapsed = time.perf_counter() - start
+                steps = steps_taken(params)
+                results.append((e_method, backend, steps, steps / elapsed))
+
+    print(f"\n{'E method':<12}{'backend':<12}{'steps':>8}{'steps/sec':>12}")
+    for e_method, backend, steps, rate in results:
+        print(f"{e_method:<12}{backend:<12}{steps:>8}{rate:>12.1f}")
@@ -0,0 +1,80 @@
+"""
+Time per flush of an ensemble's trajectory buffer into the output file (files.trajectory_buffer.append_buffer_to_hdf5),
+for growing particle counts, with the buffer sized from the default memory budget like ensemble_push's
+(so the more particles, the fewer rows per flush). Each particle's block is apart in the file, so a flush
+writes one block per particle into every per-step dataset; in the lossy case 1% of the particles are lost
+half way through every flush (shorter blocks) and stay lost.
+Also times grow_capacity, which moves every block apart when a run outgrows them (a resume with --extend).
+
+run from the project root with PYTHONPATH=.:Scripts
+"""
+import os
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from files.hdf5.output_file_structure import create_h5_output_file, grow_capacity, particle_index, storage_options
+from files.trajectory_buffer import ROW_BYTES, TrajectoryBuffer, append_buffer_to_hdf5, rows_from_budget
+from system.state_dict import OutputConfig
+
+PARTICLES = (1_000, 10_000, 100_000)
+FLUSHES = 10
+BUFFER_MB = 32 # the default buffer_mb of 64, split over the double buffer
+
+def fill(buffer:TrajectoryBuffer, rng, step0:int, lost:np.ndarray, lose:np.ndarray):
+    """
+    fills the buffer with steps step0 + 1...; particles in lost are lost already, those in lose at the middle row.
+    """
+    buffer.reset()
+    n = buffer.n
+    for i in range(buffer.rows):
+        dt = np.full(n, 1e-9)
+        dt[lost] = 0.
+        if i >= buffer.rows // 2:
+            dt[lose] = 0.
+        buffer.append(rng.normal(size=(n, 3)), rng.normal(size=(n, 3)), rng.normal(size=(n, 3)),
+                      rng.normal(size=(n, 3)), np.full(n, (step0 + i + 1) * 1e-9), dt)
+
+def last_rows(f, index, k, rows):
+    end = int(index['offset'][k] + index['length'][k])
+    return f['/src/position'][end - rows:end]
+
+def run(path, n, lossy:bool, rng):
+    output = OutputConfig()
+    rows = rows_from_budget(BUFFER_MB, n)
+    create_h5_output_file(path, FLUSHES * rows + 1, n, **storage_options(output, rows))
+    buffer = TrajectoryBuffer(rows, n)
+    lost = np.zeros(n, dtype=bool)
+    seconds = 0.
+    with h5py.File(path, 'a') as f:
+        for k in range(FLUSHES):
+            lose = (rng.random(n) < 0.01) & ~lost if lossy else np.zeros(n, dtype=bool)
+            fill(buffer, rng, k * rows, lost, lose)
+            start = time.perf_counter()
+            append_buffer_to_hdf5(f, buffer)
+            seconds += time.perf_counter() - start
+            lost |= lose
+        # the blocks hold what was written
+        index = particle_index(f)
+        k = int(np.argmax(~lost))
+        assert index['length'][k] == FLUSHES * rows
+        assert np.array_equal(last_rows(f, index, k, rows), buffer.position[:, k])
+        start = time.perf_counter()
+        grow_capacity(f, 2 * int(index['capacity'].max()))
+        grow = time.perf_counter() - start
+        assert np.array_equal(last_rows(f, particle_index(f), k, rows), buffer.position[:, k])
+    return rows, seconds / FLUSHES, grow
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"{'particles':>10}{'lossy':>7}{'rows/flush':>12}{'ms/flush':>10}{'MB/s':>8}{'grow s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in PARTICLES:
+            for lossy in (False, True):
+                path = os.path.join(tmp, f"flush{n}.hdf5")
+                rows, per_flush, grow = run(path, n, lossy, rng)
+                mb = rows * n * ROW_BYTES / 2 ** 20
+                print(f"{n:>10}{str(lossy):>7}{rows:>12}{per_flush * 1e3:>10.1f}{mb / per_flush:>8.0f}{grow:>8.2f}")
+                os.remove(path)
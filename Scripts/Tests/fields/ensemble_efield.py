@@ -0,0 +1,41 @@
+"""
+The ensemble's batched E (calcs.ensemble.Efield_batch) against the single particle pusher's (magpy4c1_01.EfieldX,
+point by point) for every ungridded E method, on random points around two tilted, charged washers: the largest
+difference relative to the field. Gridded fields (and washer_potential, which always is) share the interpolator.
+
+run from the project root with PYTHONPATH=.:Scripts
+"""
+import builtins
+builtins.transparent = '' # (magpy4c1_01 reads it at import, for the GUI)
+from concurrent.futures import ThreadPoolExecutor
+
+import magpylib as mp
+import numpy as np
+
+from calcs.coil_geometry import CoilGeometry
+from calcs.ensemble import Efield_batch
+from calcs.magpy4c1_01 import EfieldX
+from system.state_dict import WasherFieldConfig
+from system.state_dict_main import AppConfig
+
+METHODS = ("zero", "bob_e", "disk_e", "fw_e")
+POINTS = 20
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    rings = mp.Collection(mp.current.Circle(current=1e-9, diameter=0.2, position=(0, 0, 0.12)),
+                          mp.current.Circle(current=-2e-9, diameter=0.18, position=(0.01, 0, -0.1)))
+    rings[0].rotate_from_angax(20, 'x')
+    rings[1].rotate_from_angax(35, 'y')
+    xs = rng.uniform(-0.15, 0.15, (POINTS, 3))
+
+    print(f"{'method':>8}{'rel diff':>10}")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for method in METHODS:
+            params = AppConfig()
+            params.e = WasherFieldConfig(method=method, collection=rings, res=99, inner_r=[0.02, 0.03])
+            coils = CoilGeometry.from_config(params.e)
+            batch = Efield_batch(xs, params, None, coils)
+            single = np.array([EfieldX(x, params, executor, None, {'coils' : coils}) for x in xs])
+            scale = max(np.max(np.linalg.norm(single, axis=1)), 1e-300)
+            print(f"{method:>8}{np.max(np.linalg.norm(batch - single, axis=1)) / scale:>10.1e}")
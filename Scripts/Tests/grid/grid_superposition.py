@@ -0,0 +1,56 @@
+"""
+The per-coil unit grid cache (grid.superposition) for six inward loops on the faces of a cube, with the 'loop'
+B method: the first build, the same coils with another current on every coil (in this process and read back
+from disk), and one coil moved, against building the whole grid directly; and the largest difference of the
+summed grid from the direct one.
+
+run from the project root with PYTHONPATH=.:Scripts
+"""
+import tempfile
+import time
+
+import numpy as np
+
+from calcs.coil_geometry import CoilGeometry
+from calcs.loop_field import CircleLoops
+from grid._3d_mesh import grid_axis
+from grid.superposition import CoilGridCache, _UNITS
+
+RES = 100
+
+def rel_diff(values, ref) -> float:
+    return np.max(np.linalg.norm(values - ref, axis=-1)) / np.max(np.linalg.norm(ref, axis=-1))
+
+def timed(f):
+    start = time.perf_counter()
+    out = f()
+    return out, time.perf_counter() - start
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    faces = np.concatenate([np.eye(3), -np.eye(3)])
+    coils = CoilGeometry.from_frames(faces, -faces, np.roll(faces, 1, axis=1), 0.4, 1e4)
+    axis = grid_axis(1.0, RES)
+    mesh = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = CoilGridCache(directory, 'b', 'loop', axis, lambda points, coils: CircleLoops(coils).getB(points))
+        CircleLoops(coils).getB(mesh[:1, :1, :1]) # (compile)
+        ref, t_direct = timed(lambda: CircleLoops(coils).getB(mesh))
+        values, t_first = timed(lambda: cache.total(coils))
+        print(f"{'direct grid':>28}{t_direct:>8.2f} s")
+        print(f"{'first build':>28}{t_first:>8.2f} s  rel diff {rel_diff(values, ref):.1e}")
+
+        coils.strengths[:] = rng.uniform(-2e4, 2e4, len(coils))
+        ref = CircleLoops(coils).getB(mesh)
+        values, t_sum = timed(lambda: cache.total(coils))
+        print(f"{'new currents':>28}{t_sum:>8.2f} s  rel diff {rel_diff(values, ref):.1e}")
+        _UNITS.clear()
+        values, t_read = timed(lambda: cache.total(coils))
+        print(f"{'new currents, from disk':>28}{t_read:>8.2f} s  rel diff {rel_diff(values, ref):.1e}")
+
+        # one coil off its face's centre: only it is computed (and without the symmetries of the axis)
+        coils.centres[2] += [0.1, 0.05, 0]
+        ref = CircleLoops(coils).getB(mesh)
+        values, t_edit = timed(lambda: cache.total(coils))
+        print(f"{'one coil moved':>28}{t_edit:>8.2f} s  rel diff {rel_diff(values, ref):.1e}")
@@ -0,0 +1,76 @@
+"""
+Symmetry reduced grids (grid.symmetry) against full ones, for a few polyhedral coil sets: the group found, how
+many nodes are computed and stored, the largest difference of the interpolated fields, and the build times.
+
+run from the project root with PYTHONPATH=.:Scripts
+"""
+import time
+
+import magpylib as mp
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from MakeCurrent import Circle
+from calcs.coil_geometry import CoilGeometry
+from grid.symmetry import GridSymmetry, SymmetricGrid
+
+RES = 100
+PAD = 1.5
+QUERIES = 20_000
+
+def facing(position, current, diameter) -> mp.current.Circle:
+    """
+    a loop at position whose axis points at the origin.
+    """
+    n = -np.asarray(position, dtype=np.float64) / np.linalg.norm(position)
+    loop = mp.current.Circle(current=current, diameter=diameter, position=position)
+    axis = np.cross([0, 0, 1], n)
+    if np.linalg.norm(axis) > 1e-12:
+        loop.rotate_from_angax(np.degrees(np.arccos(n[2])), axis, anchor=position)
+    elif n[2] < 0:
+        loop.rotate_from_angax(180, [1, 0, 0], anchor=position)
+    return loop
+
+def cube() -> mp.Collection:
+    return mp.Collection(*[facing(p, 1e4, 0.8) for p in np.concatenate([np.eye(3), -np.eye(3)])])
+
+def dodecahedron() -> mp.Collection:
+    phi = (1 + np.sqrt(5)) / 2
+    v = np.array([[1, phi, 0], [0, 1, phi], [phi, 0, 1], [1, -phi, 0], [0, -1, phi], [-phi, 0, 1]])
+    v = np.concatenate([v, -v]) / np.linalg.norm(v[0])
+    return mp.Collection(*[facing(p * 1.2, 1e4, 0.7) for p in v])
+
+def build(getB, symmetry:GridSymmetry):
+    """
+    the field on a RES^3 cube, reduced by symmetry (None: the full cube).
+    """
+    axis = np.linspace(-PAD, PAD, RES)
+    if symmetry is None:
+        nodes = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1)
+        return RegularGridInterpolator((axis,) * 3, getB(nodes))
+    shape, reps, src, op = symmetry.representatives(RES)
+    axes = [axis[lo:] for lo in symmetry.box(RES)]
+    nodes = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    values = symmetry.fill(getB(nodes[reps]), src, op).reshape(*shape, 3)
+    return SymmetricGrid.from_arrays(axes, values, symmetry, RES)
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    sets = {'MakeCurrent.Circle': Circle(1e4, 0.8, 1.0, 0.), 'cube (inward)': cube(), 'dodecahedron': dodecahedron()}
+    print(f"{'coil set':>20}{'|G|':>5}{'computed':>10}{'stored':>10}{'rel diff':>10}{'full s':>8}{'reduced s':>10}")
+    for name, collection in sets.items():
+        symmetry = GridSymmetry.detect(CoilGeometry.from_collection(collection), pseudovector=True)
+        getB = collection.getB # the grid's default 'magpy' method
+        start = time.perf_counter()
+        full = build(getB, None)
+        t_full = time.perf_counter() - start
+        start = time.perf_counter()
+        reduced = build(getB, symmetry)
+        t_reduced = time.perf_counter() - start
+
+        points = rng.uniform(-PAD, PAD, (QUERIES, 3))
+        a = full(points)
+        diff = np.max(np.linalg.norm(reduced(points) - a, axis=1)) / np.max(np.linalg.norm(a, axis=1))
+        computed = len(symmetry.representatives(RES)[1])
+        print(f"{name:>20}{len(symmetry):>5}{computed:>10}{reduced.box.values.size // 3:>10}"
+              f"{diff:>10.1e}{t_full:>8.2f}{t_reduced:>10.2f}")
@@ -0,0 +1,146 @@
+"""
+Accuracy vs steps/sec of each integrator in calcs.integrators: a uniform B, a uniform B with a crossed E
+(E x B drift) and a gridded two coil mirror.
+
+For each integrator and each dt (in steps per gyration at the centre) a proton is pushed for
+the same amount of simulated time, from the half step start the pushers use (calcs.integrators.initial_half_step).
+It reports:
+    pos err: largest distance from a reference orbit over the run (every step), in gyroradii
+             (uniform, E x B: the analytic orbit; mirror: boris at 2000 steps/gyration, which itself is only good
+             to ~1e-3 gyroradii because of the trilinear grid). Not only at the end: at a whole number of
+             gyrations the orbit polygon of the exact rotation closes on the true orbit and hides its error.
+    KE err: largest |v^2 - v_ref^2| / v0^2 over the run, v at the half steps. In pure B every integrator keeps
+            |v| to roundoff, so only the E x B case tells them apart.
+    steps/sec: numpy step (calcs.integrators) and the compiled grid kernel (calcs.jit_kernel), if numba is installed
+
+run from the project root with PYTHONPATH=.:Scripts
+"""
+import time
+
+import magpylib as mp
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from calcs.integrators import INTEGRATORS, initial_half_step
+from calcs.jit_kernel import GridKernel, NUMBA_AVAILABLE
+from calcs.walls import Walls
+from files.trajectory_buffer import TrajectoryBuffer
+from settings.constants import proton
+
+Q_M = proton.q / proton.mass
+GYRATIONS = 20
+STEPS_PER_GYRATION = (10, 20, 50, 100)
+REFERENCE = 2000
+DRIFT = 5e4 # [m/s] E x B drift speed of the crossed field case
+
+def mirror_grid(n=81, half=0.08):
+    c = mp.Collection(mp.current.Circle(position=(0, 0, 0.1), current=1e5, diameter=0.2),
+                      mp.current.Circle(position=(0, 0, -0.1), current=1e5, diameter=0.2))
+    axis = np.linspace(-half, half, n)
+    X, Y, Z = np.meshgrid(axis, axis, axis, indexing='ij')
+    B = c.getB(np.stack([X, Y, Z], axis=-1).reshape(-1, 3)).reshape(n, n, n, 3)
+    return RegularGridInterpolator((axis, axis, axis), B)
+
+def uniform_grid(field, half=1.0):
+    axis = np.linspace(-half, half, 2)
+    values = np.zeros((2, 2, 2, 3))
+    values[...] = field
+    return RegularGridInterpolator((axis, axis, axis), values)
+
+def helix(x, v, bz, ex, t):
+    """
+    exact orbit in a uniform B along z and E along x: gyration about a centre drifting at E x B / B^2 = -ex/bz y
+    (a proton gyrates clockwise seen from +z).
+    returns (positions (len(t), 3), velocities (len(t), 3))
+    """
+    w = Q_M * bz
+    t = np.asarray(t)[:, None]
+    drift = np.array([0., -ex / bz, 0.])
+    ux, uy = v[0] - drift[0], v[1] - drift[1]
+    c, s = np.cos(w * t), np.sin(w * t)
+    pos = x + drift * t + np.concatenate([(ux * s + uy * (1 - c)) / w, (uy * s - ux * (1 - c)) / w, v[2] * t], axis=1)
+    vel = drift + np.concatenate([ux * c + uy * s, uy * c - ux * s, np.full_like(t, v[2])], axis=1)
+    return pos, vel
+
+def run_numpy(push, b_interp, e_interp, x, v, dt, nsteps):
+    """
+    returns (positions (nsteps + 1, 3), velocities (nsteps, 3) at the half steps dt/2, 3dt/2, ...)
+    """
+    e = e_interp(x)[0]
+    b = b_interp(x)[0]
+    v = initial_half_step(push, x, v, e, b, dt, Q_M)
+    xs, vs = [x], []
+    for _ in range(nsteps):
+        x, v = push(x, v, e, b, dt, Q_M)
+        e, b = e_interp(x)[0], b_interp(x)[0]
+        xs.append(x)
+        vs.append(v)
+    return np.array(xs), np.array(vs)
+
+def run_kernel(name, b_interp, e_interp, x, v, dt, nsteps):
+    kernel = GridKernel(b_interp, e_interp, Q_M, Walls.box(1.0), integrator=name)
+    X = x.reshape(1, 3).copy()
+    B, E = b_interp(X), e_interp(X)
+    V = initial_half_step(INTEGRATORS[name], X, v.reshape(1, 3), E, B, dt, Q_M)
+    buffer = TrajectoryBuffer(nsteps, 1)
+    kernel.run(X, V, B, E, np.ones(1, dtype=bool), np.full(1, -1), np.full(1, -1), np.zeros((1, 3)),
+               np.zeros(1), np.full(1, dt), 0, nsteps, buffer)
+    return X[0]
+
+def compare(label, b_interp, e_interp, reference, x0, v0, period, r_gyro):
+    """
+    reference(n): (positions, half step v^2) of the true orbit at the steps of a run with n steps per gyration
+    """
+    print(f"\n{label}: gyroperiod = {period:.3e} s, gyroradius = {r_gyro:.3e} m, {GYRATIONS} gyrations")
+    print(f"{'integrator':<14}{'steps/gyr':>10}{'pos err':>12}{'KE err':>12}{'numpy st/s':>14}{'numba st/s':>14}")
+    for name, push in INTEGRATORS.items():
+        for n in STEPS_PER_GYRATION:
+            dt = period / n
+            nsteps = GYRATIONS * n
+
+            start = time.perf_counter()
+            xs, vs = run_numpy(push, b_interp, e_interp, x0, v0, dt, nsteps)
+            numpy_rate = nsteps / (time.perf_counter() - start)
+
+            numba_rate = float('nan')
+            if NUMBA_AVAILABLE:
+                start = time.perf_counter()
+                xk = run_kernel(name, b_interp, e_interp, x0, v0, dt, nsteps)
+                numba_rate = nsteps / (time.perf_counter() - start)
+                assert np.allclose(xk, xs[-1], rtol=0, atol=1e-9), f"kernel and numpy {name} disagree"
+
+            ref_x, ref_v2 = reference(n)
+            err = np.max(np.linalg.norm(xs - ref_x, axis=1)) / r_gyro
+            ke = np.max(np.abs(np.sum(vs * vs, axis=1) - ref_v2)) / (v0 @ v0)
+            print(f"{name:<14}{n:>10}{err:>12.3e}{ke:>12.3e}{numpy_rate:>14.1f}{numba_rate:>14.1f}")
+
+if __name__ == "__main__":
+    mirror = mirror_grid()
+    zero = uniform_grid(np.zeros(3))
+    x0 = np.array([0.005, 0., 0.])
+    v0 = np.array([0., 2e5, 1e5])
+    b0 = np.linalg.norm(mirror(np.zeros(3))[0])
+    period = 2 * np.pi / (Q_M * b0)
+    r_gyro = np.linalg.norm(v0[:2]) / (Q_M * b0)
+
+    if NUMBA_AVAILABLE:
+        # compile every integrator before timing anything
+        for name in INTEGRATORS:
+            run_kernel(name, mirror, zero, x0, v0, period / 10, 10)
+
+    def analytic(ex):
+        def reference(n):
+            dt = period / n
+            pos, _ = helix(x0, v0, b0, ex, dt * np.arange(GYRATIONS * n + 1))
+            _, vel = helix(x0, v0, b0, ex, dt * (np.arange(GYRATIONS * n) + 0.5))
+            return pos, np.sum(vel * vel, axis=1)
+        return reference
+
+    uniform = uniform_grid(np.array([0., 0., b0]))
+    compare("uniform B", uniform, zero, analytic(0.), x0, v0, period, r_gyro)
+    ex = DRIFT * b0
+    compare(f"uniform B, crossed E ({DRIFT:.0e} m/s drift)", uniform, uniform_grid(np.array([ex, 0., 0.])),
+            analytic(ex), x0, v0, period, r_gyro)
+
+    fine, _ = run_numpy(INTEGRATORS["boris"], mirror, zero, x0, v0, period / REFERENCE, GYRATIONS * REFERENCE)
+    compare("mirror", mirror, zero, lambda n: (fine[::REFERENCE // n], v0 @ v0), x0, v0, period, r_gyro)
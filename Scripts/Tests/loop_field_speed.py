@@ -0,0 +1,52 @@
+"""
+The 'loop' B method (calcs.loop_field) against magpylib's Collection.getB, for Circle collections of a few
+sizes: the largest difference relative to the field, and the time per call for one point (a step of the python
+loop pushers) and for a block of points (an ensemble step, a grid).
+
+run from the project root with PYTHONPATH=.:Scripts
+"""
+import time
+
+import magpylib as mp
+import numpy as np
+
+from calcs.loop_field import CircleLoops
+
+COILS = (1, 2, 6, 20)
+BLOCK = 10_000
+CALLS = 200
+
+def collection(n:int, rng) -> mp.Collection:
+    """
+    n loops of random radius, position, orientation and current.
+    """
+    c = mp.Collection()
+    for _ in range(n):
+        loop = mp.current.Circle(current=rng.uniform(1e3, 1e4), diameter=rng.uniform(0.05, 0.2),
+                                 position=rng.uniform(-0.1, 0.1, 3))
+        c.add(loop.rotate_from_angax(rng.uniform(0, 180), rng.normal(size=3)))
+    return c
+
+def per_call(f, calls:int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        f()
+    return (time.perf_counter() - start) / calls
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"{'coils':>6}{'rel err':>10}{'1 pt magpy us':>15}{'1 pt loop us':>14}"
+          f"{f'{BLOCK} pts magpy ms':>20}{f'{BLOCK} pts loop ms':>19}")
+    for n in COILS:
+        c = collection(n, rng)
+        loops = CircleLoops.from_collection(c)
+        points = rng.uniform(-0.3, 0.3, (BLOCK, 3))
+        b_magpy, b_loop = c.getB(points), loops.getB(points)
+        err = np.max(np.linalg.norm(b_magpy - b_loop, axis=1) / np.linalg.norm(b_magpy, axis=1))
+
+        one = points[0]
+        t_magpy = per_call(lambda: c.getB(one, squeeze=True), CALLS)
+        t_loop = per_call(lambda: loops.getB(one), CALLS)
+        T_magpy = per_call(lambda: c.getB(points), 5)
+        T_loop = per_call(lambda: loops.getB(points), 5)
+        print(f"{n:>6}{err:>10.1e}{t_magpy * 1e6:>15.1f}{t_loop * 1e6:>14.1f}{T_magpy * 1e3:>20.1f}{T_loop * 1e3:>19.1f}")
@@ -0,0 +1,120 @@
+"""
+Write speed, read speed and file size of the output file for each storage setting
+(chunking, lzf/gzip, shuffle, quantization; see files.hdf5.output_file_structure).
+
+A proton orbit in a gridded two coil mirror is pushed with the compiled kernel (or boris_step without numba)
+into a trajectory buffer, then written to a fresh output file flush by flush, for every setting:
+    write MB/s: raw bytes of the per-step rows / time to create, fill and close the file
+    size: file size on disk, and its ratio to the raw bytes
+    read MB/s: reading every per-step dataset back in full
+    stride read: reading every 100th position (the plotting window's default stride), ms
+    pos err, B err: largest quantization error of the read-back positions [m] and B [T]
+
+run from the project root with PYTHONPATH=.:Scripts
+"""
+import os
+import tempfile
+import time
+from dataclasses import replace
+
+import h5py
+import numpy as np
+
+from calcs.jit_kernel import GridKernel, NUMBA_AVAILABLE
+from calcs.integrators import INTEGRATORS
+from calcs.walls import Walls
+from files.hdf5.output_file_structure import SRC_DATASETS, create_h5_output_file, storage_options, trim_to_filled
+from files.trajectory_buffer import TrajectoryBuffer, append_buffer_to_hdf5, rows_from_budget
+from system.state_dict import OutputConfig
+from Tests.integrator_accuracy import mirror_grid, Q_M
+
+NUMSTEPS = 1_000_000
+FLUSH_MB = 32 # the default buffer_mb of 64, split over the double buffer
+DT = 2e-11
+
+SETTINGS = {
+    "h5py chunks" : None,
+    "plain" : OutputConfig(),
+    "lzf" : OutputConfig(compression="lzf"),
+    "shuffle+lzf" : OutputConfig(compression="lzf", shuffle=True),
+    "gzip 4" : OutputConfig(compression="gzip"),
+    "shuffle+gzip 4" : OutputConfig(compression="gzip", shuffle=True),
+    "shuffle+gzip 9" : OutputConfig(compression="gzip", compression_level=9, shuffle=True),
+    "1nm/1nT+shuffle+lzf" : OutputConfig(compression="lzf", shuffle=True, max_error_position=1e-9, max_error_b=1e-9),
+    "1nm/1nT+shuffle+gzip" : OutputConfig(compression="gzip", shuffle=True, max_error_position=1e-9, max_error_b=1e-9),
+    "1um/1uT+shuffle+gzip" : OutputConfig(compression="gzip", shuffle=True, max_error_position=1e-6, max_error_b=1e-6),
+}
+
+def trajectory():
+    """
+    NUMSTEPS steps of a mirror orbit, in a TrajectoryBuffer.
+    """
+    interp = mirror_grid()
+    buffer = TrajectoryBuffer(NUMSTEPS)
+    x, v = np.array([[0.005, 0., 0.]]), np.array([[0., 2e5, 1e5]])
+    b, e = interp(x), np.zeros((1, 3))
+    if NUMBA_AVAILABLE:
+        kernel = GridKernel(interp, None, Q_M, Walls.box(1.0))
+        kernel.run(x, v, b, e, np.ones(1, dtype=bool), np.full(1, -1), np.full(1, -1), np.zeros((1, 3)),
+                   np.zeros(1), np.full(1, DT), 0, NUMSTEPS, buffer)
+    else:
+        push = INTEGRATORS["boris"]
+        for i in range(NUMSTEPS):
+            x, v = push(x, v, e, b, DT, Q_M)
+            b = interp(x)
+            buffer.append(x, v, b, e, (i + 1) * DT, DT)
+    return buffer
+
+def write(path, buffer:TrajectoryBuffer, create_kwargs:dict, flush_rows:int):
+    """
+    writes the buffer flush_rows at a time, like the pusher does. returns the seconds it took.
+    """
+    start = time.perf_counter()
+    create_h5_output_file(path, NUMSTEPS, **create_kwargs)
+    piece = TrajectoryBuffer(flush_rows)
+    with h5py.File(path, 'a') as f:
+        for lo in range(0, NUMSTEPS, flush_rows):
+            n = min(flush_rows, NUMSTEPS - lo)
+            for name in ('position', 'velocity', 'field_b', 'field_e', 'time'):
+                getattr(piece, name)[:n] = getattr(buffer, name)[lo:lo + n]
+            piece.count = n
+            append_buffer_to_hdf5(f, piece)
+        trim_to_filled(f)
+    return time.perf_counter() - start
+
+def read(path):
+    """
+    returns (seconds for a full read of every per-step dataset, seconds for a stride 100 position read, arrays)
+    """
+    with h5py.File(path, 'r') as f:
+        start = time.perf_counter()
+        data = {key : f[key][:] for key in SRC_DATASETS}
+        full = time.perf_counter() - start
+        start = time.perf_counter()
+        f['/src/position'][::100]
+        strided = time.perf_counter() - start
+    return full, strided, data
+
+if __name__ == "__main__":
+    print(f"pushing {NUMSTEPS} steps...")
+    buffer = trajectory()
+    raw = sum(a.nbytes for a in buffer.filled().values())
+    flush_rows = rows_from_budget(FLUSH_MB)
+    print(f"{raw / 2 ** 20:.1f} MB of rows, flushed {min(flush_rows, NUMSTEPS)} rows at a time\n")
+
+    print(f"{'setting':<22}{'chunk rows':>11}{'write MB/s':>12}{'size MB':>9}{'ratio':>7}{'read MB/s':>11}"
+          f"{'stride ms':>11}{'pos err':>10}{'B err':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, config in SETTINGS.items():
+            kwargs = {} if config is None else storage_options(config, flush_rows)
+            path = os.path.join(tmp, "data.hdf5")
+            wrote = write(path, buffer, kwargs, flush_rows)
+            size = os.path.getsize(path)
+            full, strided, data = read(path)
+
+            pos_err = np.abs(data['/src/position'].view(np.float64) - buffer.x[:, 0].reshape(-1)).max()
+            b_err = np.abs(data['/src/fields/b'].view(np.float64).reshape(-1, 7)[:, :3] - buffer.b[:, 0]).max()
+            print(f"{label:<22}{kwargs.get('chunk_rows') or 'auto':>11}{raw / 2 ** 20 / wrote:>12.1f}"
+                  f"{size / 2 ** 20:>9.1f}{size / raw:>7.3f}{raw / 2 ** 20 / full:>11.1f}{strided * 1e3:>11.1f}"
+                  f"{pos_err:>10.1e}{b_err:>10.1e}")
+            os.remove(path)
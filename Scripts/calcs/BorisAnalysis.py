@@ -5,40 +5,45 @@ Holds functions for calculating loss, moment, etc.
 import numpy as np
 import h5py
 
-def magnitude_at_each_step(arr, f, ds_key, col_key):
+def magnitude_at_each_step(arr, f, ds_key, col_key, rows=slice(None)):
     """
     takes in a 2D input array and returns a 1D array containing the magnitudes at axis 1.
     in: [[x1,y1,z1],[x2,y2,z2],...[xn,yn,zn]]
     out: [mag1, mag2, mag3]
+
+    rows: the rows of the dataset arr is from, e.g. one particle's
+    (files.hdf5.output_file_structure.particle_rows); only those are read and filled in.
     """
         # if any of the selected magnitude dataset column has a None value,
         # then it is a sign to calculate and populate it.
     #print(f[ds_key][col_key])
-    if np.isnan(f[ds_key][col_key]).any():
+    if np.isnan(f[ds_key][rows, col_key]).any():
         #print("yes")
         mag = np.linalg.norm(arr, axis=1)
-        f[ds_key][col_key] = np.where(mag == 0, 1e-12, mag)
-    return f[ds_key][col_key]
+        f[ds_key][rows, col_key] = np.where(mag == 0, 1e-12, mag)
+    return f[ds_key][rows, col_key]
 
     #return np.linalg.norm(arr, axis=1)
 
-def get_parallel(bs, arr, f, ds_key, col_key):
+def get_parallel(bs, arr, f, ds_key, col_key, rows=slice(None)):
     """
     Returns the parallel decomposition of the arr 'arr' that is travelling in the 'bs' direction.
 
     out = (arr dot bs / mag(bs)) * bs
+    rows: as in magnitude_at_each_step
     """
     #print(f"parallel called")
         # since all the reasons this function will be called will involve the magnitude of b,
         # I can hard code its reference in the h5 file.
-    if np.isnan(f['src/fields/b']['bmag']).any():
-        f['src/fields/b']['bmag'] = magnitude_at_each_step(bs, f, 'src/fields/b', 'bmag')
+    b = f['src/fields/b']
+    if np.isnan(b[rows, 'bmag']).any():
+        b[rows, 'bmag'] = magnitude_at_each_step(bs, f, 'src/fields/b', 'bmag', rows)
 
     #print(f"bmag finished")
-    if np.isnan(f['src/fields/b']['bhx']).any():
+    if np.isnan(b[rows, 'bhx']).any():
         #print(f"calculating bhat")
-        mag = f['src/fields/b']['bmag']
-        f['src/fields/b']['bmag'] = np.where(mag == 0, 1e-12, mag)
+        mag = b[rows, 'bmag']
+        b[rows, 'bmag'] = np.where(mag == 0, 1e-12, mag)
         #print(bs.shape, mag.shape)
         #print(bs / np.array(mag)[:, np.newaxis])
         bhat = bs / np.array(mag)[:, np.newaxis]
@@ -49,35 +54,37 @@ def get_parallel(bs, arr, f, ds_key, col_key):
         # (n, 3) / (n, )
         # (n, )
 
-        f['src/fields/b']['bhx'] = bhx.reshape(bhx.shape[0],)
-        f['src/fields/b']['bhy'] = bhy.reshape(bhy.shape[0],)
-        f['src/fields/b']['bhz'] = bhz.reshape(bhz.shape[0],)
+        b[rows, 'bhx'] = bhx.reshape(bhx.shape[0],)
+        b[rows, 'bhy'] = bhy.reshape(bhy.shape[0],)
+        b[rows, 'bhz'] = bhz.reshape(bhz.shape[0],)
     #print(f"bhat finished")
         # if any of the selected magnitude dataset column has a None value,
         # then it is a sign to calculate and populate it.
-    if np.isnan(f[ds_key][col_key]).any():
-        bhat = np.stack((f['src/fields/b']['bhx'], f['src/fields/b']['bhy'], f['src/fields/b']['bhz']), axis=1)
+    if np.isnan(f[ds_key][rows, col_key]).any():
+        bhat = np.stack((b[rows, 'bhx'], b[rows, 'bhy'], b[rows, 'bhz']), axis=1)
         #print(bhat.shape, arr.shape)
         dot = np.einsum('ij,ij->i',bhat,arr)
         #print(dot.shape)
-        f[ds_key][col_key] = dot.reshape(dot.shape[0],)
+        f[ds_key][rows, col_key] = dot.reshape(dot.shape[0],)
     #print(f"Parallel is: {f[ds_key][col_key]}")
-    return f[ds_key][col_key]
+    return f[ds_key][rows, col_key]
 
 
-def get_perpendicular(bs, arr, f, ds_key, col_key):
+def get_perpendicular(bs, arr, f, ds_key, col_key, rows=slice(None)):
     """
     returns the cross product's magnitude of the two arrays.
+    rows: as in magnitude_at_each_step
     """
     # since all the reasons this function will be called will involve the magnitude of b,
         # I can hard code its reference in the h5 file.
-    if np.isnan(f['src/fields/b']['bmag']).any():
-        f['src/fields/b']['bmag'] = magnitude_at_each_step(bs, f, 'src/fields/b', 'bmag')
+    b = f['src/fields/b']
+    if np.isnan(b[rows, 'bmag']).any():
+        b[rows, 'bmag'] = magnitude_at_each_step(bs, f, 'src/fields/b', 'bmag', rows)
     #print('bmag obtained')
 
-    bhat = np.stack((f['src/fields/b']['bhx'], f['src/fields/b']['bhy'], f['src/fields/b']['bhz']), axis=1)
+    bhat = np.stack((b[rows, 'bhx'], b[rows, 'bhy'], b[rows, 'bhz']), axis=1)
     #print(magnitude_at_each_step((np.cross(arr, bhat)), f, ds_key, col_key))
-    return magnitude_at_each_step((np.cross(arr, bhat)), f, ds_key, col_key)
+    return magnitude_at_each_step((np.cross(arr, bhat)), f, ds_key, col_key, rows)
 
 def CalculateLoss(vels:np.ndarray, bs:np.ndarray, intervals:int):
     '''
@@ -0,0 +1,140 @@
+import numpy as np
+
+from calcs.coil_geometry import CoilGeometry
+from calcs.loop_field import loop_field, _loop_rz
+from calcs.jit_kernel import njit, NUMBA_AVAILABLE
+
+"""
+B field of flat, multi-turn annular coils: the 'annulus' B method (FieldConfig.method).
+
+An annular winding (the face and corner coils of BFieldFJW/flatBcoilsFacesCorners) spreads its total current
+I = N turns x current evenly over the radii r_in..r_out, as a surface current K = I / (r_out - r_in). Its field
+is that of the coaxial loops it is made of,
+    B(r, z) = integral over r' from r_in to r_out of loop_field(r', r, z, K dr'),
+which the BFieldFJW scripts integrated with two scipy quad calls (of elliptic integrals) per coil per point.
+AnnularCoils takes the integral as a fixed order Gauss-Legendre sum instead: the winding is cut at the point's
+own radius (r_in..r, r..r_out, when r is between them) and each piece becomes `order` coaxial loops at the
+Gauss-Legendre nodes, carrying their share of the current, so the field is the closed form loop field of
+calcs.loop_field summed over points x coils x nodes in one numpy pass (or compiled, with numba).
+
+The cut puts nodes close to the point on both sides, where the integrand peaks for points near the winding
+plane: against a 4000 node reference, 64 nodes per piece are good to ~1e-12 relative 1 cm off a 0.65 m wide
+winding and to ~1e-5 at 2 mm, where a single uncut 64 node sum (or the scipy quad with its default 50
+subintervals) is off by O(1). Points with r outside the winding take one piece, inside it two.
+
+The coils come from a coil file like the washers' (read_inputs.read_coil_file): the Diameter is the outer
+diameter, Inner_r the inner radius, Amp the total current. An annulus with r_in = r_out is a plain loop.
+The order is the config's res (AnnulusFieldConfig).
+"""
+# points x coils x nodes per numpy pass (keeps the temporaries at tens of MB for grids)
+CHUNK = 2 ** 20
+
+class AnnularCoils:
+    def __init__(self, coils:CoilGeometry, order:int=32):
+        """
+        coils: the annuli's geometry; radii are the outer radii, strengths the total currents [A]
+        order: Gauss-Legendre nodes per piece of each winding
+        """
+        if np.any(coils.inner_radii > coils.radii) or np.any(coils.inner_radii < 0):
+            raise ValueError(f"annular coils need 0 <= inner radius <= outer radius")
+        self.coils = coils
+        self.order = int(order)
+        # nodes and weights on [0, 1], the fraction of the way across the winding
+        x, w = np.polynomial.legendre.leggauss(self.order)
+        self.nodes, self.weights = (x + 1) / 2, w / 2
+
+    @classmethod
+    def from_collection(cls, collection, inner_r, order:int=32):
+        """
+        collection: Circles whose diameters are the outer diameters
+        inner_r: inner radius per coil
+        """
+        if inner_r is None or len(inner_r) != len(collection.sources_all):
+            raise ValueError(f"the 'annulus' B method needs an inner radius for every coil (an Inner_r column)")
+        return cls(CoilGeometry.from_collection(collection, inner_r), order)
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls.from_collection(cfg.collection, cfg.inner_r, cfg.res)
+
+    def getB(self, points, squeeze=True) -> np.ndarray:
+        """
+        B [T] at points ((3,) or (..., 3) [m], e.g. a (res, res, res, 3) grid) in the points' shape,
+        or (3,) for a single point when squeeze is set.
+        """
+        coils = self.coils
+        points = np.asarray(points, dtype=np.float64)
+        single, shape = points.ndim == 1, points.shape
+        points = points.reshape(-1, 3)
+        b = np.empty_like(points)
+        if NUMBA_AVAILABLE:
+            _annuli_getB(np.ascontiguousarray(points), coils.centres, coils.rotations, coils.inner_radii,
+                         coils.radii, coils.strengths, self.nodes, self.weights, b)
+        else:
+            step = max(CHUNK // (2 * len(coils) * self.order), 1)
+            for start in range(0, len(points), step):
+                r, phi, z = coils.to_cylindrical(points[start:start + step]) # (n, C)
+                br, bz = self._rz(r, z)
+                b[start:start + step] = coils.cylindrical_to_world(br, bz, phi).sum(axis=1)
+        if single:
+            return b[0] if squeeze else b
+        return b.reshape(shape)
+
+    def _rz(self, r, z):
+        """
+        (B_r, B_z) of each coil at its (r, z), each (n, C): the two pieces' sums, the empty one with no current.
+        """
+        inner, width = self.coils.inner_radii, self.coils.radii - self.coils.inner_radii
+        # the cut, as a fraction of the width (a plain loop is all in the first piece)
+        cut = np.clip((r - inner) / np.where(width > 0, width, 1), 0, 1)
+        cut = np.where(width > 0, cut, 1)
+        br = bz = 0
+        for lo, hi in ((np.zeros_like(cut), cut), (cut, np.ones_like(cut))):
+            t = lo[..., None] + (hi - lo)[..., None] * self.nodes # (n, C, order)
+            radii = np.where((hi > lo)[..., None], inner[:, None] + width[:, None] * t, self.coils.radii[:, None])
+            currents = self.coils.strengths[:, None] * (hi - lo)[..., None] * self.weights
+            Br, Bz = loop_field(radii, r[..., None], z[..., None], currents)
+            br, bz = br + Br.sum(axis=-1), bz + Bz.sum(axis=-1)
+        return br, bz
+
+@njit(cache=True)
+def _annuli_getB(points, centres, rotations, inner, outer, strengths, nodes, weights, out):
+    """
+    AnnularCoils.getB compiled: the pieces' sums of _loop_rz and the frame changes, point by point, coil by coil.
+    """
+    for n in range(points.shape[0]):
+        bx = by = bz = 0.
+        for c in range(centres.shape[0]):
+            R = rotations[c]
+            dx = points[n, 0] - centres[c, 0]
+            dy = points[n, 1] - centres[c, 1]
+            dz = points[n, 2] - centres[c, 2]
+            # into the coil's frame (R transposed)
+            lx = R[0, 0] * dx + R[1, 0] * dy + R[2, 0] * dz
+            ly = R[0, 1] * dx + R[1, 1] * dy + R[2, 1] * dz
+            lz = R[0, 2] * dx + R[1, 2] * dy + R[2, 2] * dz
+            rho = np.sqrt(lx * lx + ly * ly)
+
+            width = outer[c] - inner[c]
+            cut = 1.
+            if width > 0:
+                cut = min(max((rho - inner[c]) / width, 0.), 1.)
+            br = bl = 0.
+            for piece in range(2):
+                lo, hi = (0., cut) if piece == 0 else (cut, 1.)
+                if hi <= lo:
+                    continue
+                for k in range(nodes.shape[0]):
+                    br_k, bz_k = _loop_rz(inner[c] + width * (lo + (hi - lo) * nodes[k]), rho, lz,
+                                          strengths[c] * (hi - lo) * weights[k])
+                    br += br_k
+                    bl += bz_k
+
+            cos, sin = (lx / rho, ly / rho) if rho > 0 else (1., 0.)
+            ux, uy = br * cos, br * sin
+            bx += R[0, 0] * ux + R[0, 1] * uy + R[0, 2] * bl
+            by += R[1, 0] * ux + R[1, 1] * uy + R[1, 2] * bl
+            bz += R[2, 0] * ux + R[2, 1] * uy + R[2, 2] * bl
+        out[n, 0] = bx
+        out[n, 1] = by
+        out[n, 2] = bz
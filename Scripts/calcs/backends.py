@@ -0,0 +1,58 @@
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+import os
+
+"""
+Execution backends for the field solvers.
+
+The push loop itself is synchronous; the only thing still handed an executor is the E method
+(e.g. disk_e fans its coils out over it). Which executor is best depends on the method:
+    - serial: cheap per-step work (magpy, zero, interpolated grids), where pool overhead dominates.
+    - threads: solvers whose per-coil work is big NumPy calls that release the GIL.
+    - processes: pure Python per-coil work that holds the GIL.
+
+The backend is chosen from FieldConfig.backend when set; otherwise from METHOD_BACKENDS by method name.
+"""
+
+class SerialExecutor(Executor):
+    """
+    An Executor that runs submitted work inline and hands back an already finished Future.
+    Lets code written against the executor interface run with zero scheduling overhead.
+    """
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+BACKENDS = {
+    "serial" : SerialExecutor,
+    "threads" : ThreadPoolExecutor,
+    "processes" : ProcessPoolExecutor,
+}
+
+# default backend per field method; anything not listed runs serially.
+# Empty: in Tests/backend_speed.py no method runs faster on threads or processes than serially (disk_e, the only
+# method that still fans out over the executor, is ~2% slower on threads and ~20% slower on processes),
+# and fw_e no longer takes the executor at all (EFieldFJW.efieldring_4.fwysr_e).
+METHOD_BACKENDS = {}
+
+def pick_backend(field_config) -> str:
+    """
+    returns the name of the backend to use for the given FieldConfig.
+    """
+    backend = getattr(field_config, "backend", None)
+    if backend:
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown execution backend '{backend}', expected one of {list(BACKENDS)}")
+        return backend
+    return METHOD_BACKENDS.get(field_config.method, "serial")
+
+def make_executor(name:str, max_workers:int=None) -> Executor:
+    """
+    creates the executor for the named backend. Use it as a context manager.
+    """
+    if name == "serial":
+        return SerialExecutor()
+    return BACKENDS[name](max_workers=max_workers or os.cpu_count())
@@ -1,7 +1,13 @@
 import numpy as np
 
 """
-Implementation of Bob's variable time step
+Implementation of Bob's variable time step, plus gyro-period stepping.
+
+Both rules pick dt inversely proportional to the local |B|:
+    bob:  dt = (B0 / |B|) * dt0                    (dt0 = 1/f0 at the reference point B0)
+    gyro: dt = (2 pi / (|q/m| |B|)) / steps_per_gyration
+so both come down to dt = c / |B|, clipped to [lo, hi]. dt_rule() works out (c, lo, hi) once per run and
+adaptive_dt() applies it to one (3,) or many (N, 3) field vectors, so the ensemble can keep one dt per particle.
 
 # PARAMETERS
 Bp, Ep (arrays) : container with shape of 3, represents the B (in T) and E (V/m) at the target point
@@ -11,12 +17,34 @@ drange (int, default = 10) : controls the factor of the timestep's range of allo
 # As you will see, ion info is hard coded to be protons right now.
 # It is hella expandable though if you want to add more ions.
 def bob_dt_step(Bp, B0_mag, dt0, min, max):
-    Bp_mag = np.linalg.norm(Bp)
-
-    # get dtp
-    dtp = (B0_mag / Bp_mag) * dt0
+    return adaptive_dt(Bp, B0_mag * dt0, min, max)
 
-    # check dtp
-    dtp = np.max(((min), np.min((dtp, max))))
+def adaptive_dt(Bp, c, lo, hi):
+    """
+    dt = c / |B| clipped to [lo, hi]; |B| = 0 gives hi.
+    Bp: (3,) -> float, (N, 3) -> (N,)
+    """
+    Bp_mag = np.linalg.norm(Bp, axis=-1)
+    with np.errstate(divide='ignore'):
+        dtp = np.where(Bp_mag > 0, c / np.where(Bp_mag > 0, Bp_mag, 1.), hi)
+    dtp = np.clip(dtp, lo, hi)
+    return float(dtp) if np.ndim(dtp) == 0 else dtp
 
-    return dtp
\ No newline at end of file
+def dt_rule(dynamic, q_m):
+    """
+    (c, lo, hi) of the run's adaptive rule, from the DynDtConfig (consts filled in by
+    events.funcs.before_simulation_bob_dt).
+    None if the run uses a fixed dt (dynamic dt off, or no B field to scale with).
+    """
+    consts = dynamic.consts
+    if not dynamic.on or consts.B0.b_norm is None:
+        return None
+    match dynamic.mode:
+        case "bob":
+            return consts.B0.b_norm * consts.dt0, consts.dt_min, consts.dt_max
+        case "gyro":
+            c = 2 * np.pi / (abs(q_m) * dynamic.steps_per_gyration)
+            # same dynamic range as bob's, around the gyro dt at the reference point
+            dt_ref = c / consts.B0.b_norm
+            return c, dt_ref / dynamic.dynamic_range, dt_ref * dynamic.dynamic_range
+    raise ValueError(f"unknown dynamic dt mode '{dynamic.mode}'")
@@ -0,0 +1,29 @@
+import numpy as np
+
+"""
+The fused Boris step.
+
+borisPush used to submit the tt/ss and v_minus pieces of the push to a thread pool every step.
+Those are a handful of flops each, so the future/lock bookkeeping cost more than the math and the GIL
+serialized the work anyway. Everything is now done in one synchronous call.
+
+Works on a single particle (shape (3,)) or on an ensemble (shape (N, 3)).
+"""
+def boris_step(x, v, Ef, Bf, dt, q_m):
+    """
+    # PARAMETERS
+    x, v (arrays): position (m) and velocity (m/s), shape (3,) or (N, 3)
+    Ef, Bf (arrays): E (V/m) and B (T) at x, same shape as x
+    dt (float or (N, 1) array): the timestep
+    q_m (float): charge to mass ratio of the particle
+
+    returns the new position and velocity.
+    """
+    half = q_m * 0.5 * dt
+    tt = half * Bf
+    ss = 2. * tt / (1. + np.sum(tt * tt, axis=-1, keepdims=True))
+    v_minus = v + half * Ef
+    v_prime = v_minus + np.cross(v_minus, tt)
+    v_plus = v_minus + np.cross(v_prime, ss)
+    v_new = v_plus + half * Ef
+    return x + v_new * dt, v_new
@@ -0,0 +1,133 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+"""
+The geometry of a coil collection as flat arrays, shared by the B and E solvers.
+
+The solvers used to walk the magpylib Collection at every call, moving each point into each coil's frame with
+that coil's scipy Rotation (Rotation.apply, inverse=True) and the result back out with another apply, and
+getting coil normals by rotating [0, 0, 1] coil by coil. CoilGeometry reads the collection once (per run, or per
+grid) and does those transforms for every point and every coil at once, with the orientations stacked as
+(C, 3, 3) matrices:
+    to_local(points): (n, 3) world points -> (n, C, 3) in each coil's frame (coil centre at the origin, axis z)
+    to_cylindrical(points): the same as (r, phi, z), each (n, C)
+    to_world(vectors): (n, C, 3) vectors in each coil's frame -> world
+    cylindrical_to_world(v_r, v_z, phi): (n, C) r and z components at angle phi -> (n, C, 3) world vectors
+Summing the last over the coils axis gives the collection's field.
+
+Who builds it: the pushers, with the rest of their per-run setup (calcs.magpy4c1_01.calc_e_consts puts the E
+field's in e_args['coils'], calcs.ensemble passes it to Efield_batch), and the grid builders once per grid.
+The solvers also take the collection alone and build it themselves, for the GUI's graphs.
+"""
+@dataclass
+class CoilGeometry:
+    """
+    centres: (C, 3) coil centres [m]
+    rotations: (C, 3, 3) coil orientations as matrices (coil frame -> world)
+    normals: (C, 3) unit coil axes in the world (rotations[:, :, 2])
+    radii: (C,) coil (outer) radii [m]
+    inner_radii: (C,) inner radii of washers/annuli [m] (0 for plain rings)
+    strengths: (C,) the sources' 'current' column: a current [A] for B coils, a charge [C] for E rings/washers
+    """
+    centres : np.ndarray
+    rotations : np.ndarray
+    normals : np.ndarray
+    radii : np.ndarray
+    inner_radii : np.ndarray
+    strengths : np.ndarray
+
+    @classmethod
+    def from_collection(cls, collection, inner_r=None):
+        """
+        collection: a magpylib Collection (or a single source) of coils with diameter and current
+        inner_r: inner radius per coil (WasherFieldConfig.inner_r); None for none
+        """
+        coils = collection.sources_all if hasattr(collection, 'sources_all') else [collection]
+        # (the last position/orientation of coils that have a path)
+        centres = [np.reshape(coil.position, (-1, 3))[-1] for coil in coils]
+        rotations = [np.reshape(coil.orientation.as_matrix(), (-1, 3, 3))[-1] for coil in coils]
+        rotations = np.array(rotations, dtype=np.float64).reshape(-1, 3, 3)
+        inner = np.zeros(len(coils))
+        if inner_r is not None and len(inner_r):
+            inner_r = np.asarray(inner_r, dtype=np.float64)[:len(coils)]
+            inner[:len(inner_r)] = inner_r
+        return cls(centres=np.array(centres, dtype=np.float64).reshape(-1, 3),
+                   rotations=rotations,
+                   normals=np.ascontiguousarray(rotations[:, :, 2]),
+                   radii=np.array([coil.diameter / 2 for coil in coils], dtype=np.float64),
+                   inner_radii=inner,
+                   strengths=np.array([coil.current for coil in coils], dtype=np.float64))
+
+    @classmethod
+    def from_frames(cls, centres, z_axes, x_axes, radii, strengths, inner_radii=None):
+        """
+        Coils given by their local axes (as in the BFieldFJW scripts' face/corner manifests):
+        z_axes the coil normals, x_axes any unit vectors perpendicular to them; y = z cross x.
+        """
+        z_axes = np.asarray(z_axes, dtype=np.float64).reshape(-1, 3)
+        x_axes = np.asarray(x_axes, dtype=np.float64).reshape(-1, 3)
+        rotations = np.stack([x_axes, np.cross(z_axes, x_axes), z_axes], axis=-1)
+        radii = np.asarray(radii, dtype=np.float64) * np.ones(len(z_axes))
+        return cls(centres=np.asarray(centres, dtype=np.float64).reshape(-1, 3),
+                   rotations=rotations,
+                   normals=np.ascontiguousarray(z_axes),
+                   radii=radii,
+                   inner_radii=np.zeros(len(radii)) if inner_radii is None
+                               else np.asarray(inner_radii, dtype=np.float64) * np.ones(len(radii)),
+                   strengths=np.asarray(strengths, dtype=np.float64) * np.ones(len(radii)))
+
+    @classmethod
+    def from_config(cls, cfg):
+        """
+        The geometry of a FieldConfig's collection (with its inner_r, if it has one).
+        """
+        return cls.from_collection(cfg.collection, getattr(cfg, 'inner_r', None))
+
+    def __len__(self):
+        return len(self.radii)
+
+    def unit(self, k) -> 'CoilGeometry':
+        """
+        Coil k alone, at unit strength (1 A, or 1 C).
+        """
+        return CoilGeometry(centres=self.centres[k:k + 1], rotations=self.rotations[k:k + 1],
+                            normals=self.normals[k:k + 1], radii=self.radii[k:k + 1],
+                            inner_radii=self.inner_radii[k:k + 1], strengths=np.ones(1))
+
+    def to_collection(self):
+        """
+        The coils as a magpylib Collection of Circles (the inner radii are dropped).
+        """
+        import magpylib as mp
+        from scipy.spatial.transform import Rotation
+        return mp.Collection(*[mp.current.Circle(current=q, diameter=2 * r, position=c,
+                                                 orientation=Rotation.from_matrix(R))
+                               for c, R, r, q in zip(self.centres, self.rotations, self.radii, self.strengths)])
+
+    #=== transforms ===#
+    def to_local(self, points) -> np.ndarray:
+        """
+        (n, 3) (or (3,)) world points -> (n, C, 3) points in each coil's frame.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        return np.einsum('cji,ncj->nci', self.rotations, points[:, None, :] - self.centres)
+
+    def to_cylindrical(self, points):
+        """
+        (n, 3) world points -> (r, phi, z) in each coil's frame, each (n, C).
+        """
+        local = self.to_local(points)
+        return (np.hypot(local[..., 0], local[..., 1]), np.arctan2(local[..., 1], local[..., 0]), local[..., 2])
+
+    def to_world(self, vectors) -> np.ndarray:
+        """
+        (n, C, 3) vectors in each coil's frame -> (n, C, 3) in the world.
+        """
+        return np.einsum('cij,ncj->nci', self.rotations, vectors)
+
+    def cylindrical_to_world(self, v_r, v_z, phi) -> np.ndarray:
+        """
+        (n, C) radial and axial components in each coil's frame, at angle phi -> (n, C, 3) world vectors.
+        """
+        return self.to_world(np.stack([v_r * np.cos(phi), v_r * np.sin(phi), v_z], axis=-1))
@@ -0,0 +1,369 @@
+##########################################################################
+# ENSEMBLE BORIS PUSHER                                                  #
+#     - Pushes every particle in the particle file at the same time      #
+##########################################################################
+"""
+borisPush() in calcs.magpy4c1_01 only ever looks at the first row of the particle file.
+For loss-fraction studies we need thousands of ions per coil configuration, so this module
+keeps the whole ensemble in (N, 3) position/velocity arrays and pushes them together.
+
+Per step there is exactly ONE batched B evaluation and ONE batched E evaluation for all
+particles that are still alive. Particles that hit a wall (calcs.walls: the bounding box, coils, washers)
+are masked off and stop being pushed; their rows in the output end there.
+
+# OUTPUT LAYOUT
+The ensemble writes to the same /src datasets as the single particle pusher, one block of rows per particle
+(see files.hdf5.output_file_structure): '/src/particles' has where particle k's rows are, how many there are
+and when/where it was lost. Row j of a particle's block is step j, starting with the initial state; a particle's
+rows end at the step it was lost. '/src/exit_step' holds the step each particle was lost at (-1 if it never was)
+as a plain array, and '/src/events' where and on what (calcs.walls).
+'/src/time' holds each particle's own time and dt per row; with dynamic dt on they drift apart,
+since every particle scales its step to the field it is in (calcs.bob_dt.adaptive_dt).
+With a decimating output policy (files.output_policy) only some steps are written; '/src/step' then holds
+the step number of each written step, row j of every particle's block being step '/src/step'[j].
+"""
+import copy
+import os
+import time as t
+from dataclasses import dataclass
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from files.trajectory_buffer import TrajectoryBuffer, rows_from_budget
+from files.output_policy import OutputPolicy
+from files.async_writer import AsyncWriter
+from files.hdf5.output_file_structure import trim_to_filled, set_particles, n_particles
+from files.checkpoint import write_checkpoint, read_checkpoint, truncate_to_checkpoint, reserve_checkpoint
+from calcs.progress import ProgressChannel
+from calcs.timing import PhaseTimer, write_timing
+from calcs.integrators import get_integrator, initial_half_step
+from calcs.bob_dt import adaptive_dt, dt_rule
+from calcs.jit_kernel import GridKernel, use_compiled_kernel
+from calcs.walls import Walls, EVENT_DT, append_events, off_grid
+from calcs.loop_field import field_source
+from calcs.coil_geometry import CoilGeometry
+from settings.configs.funcs.config_reader import runtime_configs
+from settings.constants import proton
+from system.state_dict_main import AppConfig
+
+
+#==================#
+# ENSEMBLE STATE   #
+#==================#
+@dataclass
+class EnsembleState:
+    """
+    Everything that changes during an ensemble run.
+
+    x, v: (N, 3) positions and velocities
+    b, e: (N, 3) fields at the current positions
+    alive: (N,) mask of particles that haven't hit a wall
+    exit_step: (N,) step at which each particle left; -1 while still alive
+    t: (N,) simulated time of each particle
+    dt: (N,) the timestep each particle takes next
+    """
+    x : np.ndarray
+    v : np.ndarray
+    b : np.ndarray
+    e : np.ndarray
+    alive : np.ndarray
+    exit_step : np.ndarray
+    t : np.ndarray
+    dt : np.ndarray
+
+    @property
+    def n(self):
+        return self.x.shape[0]
+
+    @classmethod
+    def from_dataframe(cls, df:pd.DataFrame, dt:float):
+        """
+        builds the initial state from the particle file's dataframe (px, py, pz, vx, vy, vz columns).
+        """
+        x = np.ascontiguousarray(df[['px', 'py', 'pz']].to_numpy(dtype=np.float64))
+        v = np.ascontiguousarray(df[['vx', 'vy', 'vz']].to_numpy(dtype=np.float64))
+        n = x.shape[0]
+        return cls(x=x, v=v,
+                   b=np.zeros((n, 3)), e=np.zeros((n, 3)),
+                   alive=np.ones(n, dtype=bool),
+                   exit_step=np.full(n, -1, dtype=np.int64),
+                   t=np.zeros(n), dt=np.full(n, dt))
+
+
+#=================#
+# BATCHED FIELDS  #
+#=================#
+"""
+Batched versions of magpy4c1_01.Bfield and magpy4c1_01.EfieldX.
+Both take (n, 3) cartesian points and give back (n, 3) cartesian fields, the same as the single particle
+pusher's for each point (Tests/fields/ensemble_efield.py). E methods without a batched form go through EfieldX
+point by point.
+"""
+def Bfield_batch(xs:np.ndarray, method, c, interp):
+    if interp is not None:
+        return interp(xs)
+    if method == "zero":
+        return np.zeros_like(xs)
+    return np.asarray(c.getB(xs)).reshape(-1, 3)
+
+def Efield_batch(xs:np.ndarray, from_temp:AppConfig, interp, coils:CoilGeometry=None):
+    """
+    coils: the E collection's geometry (built once per run in ensemble_push)
+    """
+    if interp is not None:
+        return interp(xs)
+
+    method = from_temp.e.method
+    match method:
+        case "zero":
+            return np.zeros_like(xs)
+        case "bob_e":
+            from calcs.magpy4c1_01 import Bob_e
+            return Bob_e(xs, from_temp.e.res, from_temp.e.collection, coils)
+        case "disk_e":
+            from EFieldFJW.e_solvers import Disk_e_Solver
+            return Disk_e_Solver().solve({'coords' : xs,
+                                          'collection' : from_temp.e.collection,
+                                          'inners' : from_temp.e.inner_r,
+                                          'coils' : coils})
+    from calcs.magpy4c1_01 import EfieldX
+    return np.array([EfieldX(x, from_temp, None, None, {'coils' : coils}) for x in xs]).reshape(-1, 3)
+
+
+#===========#
+# HELPERS   #
+#===========#
+def loss_events(particles, step, t, points, surfaces):
+    """
+    EVENT_DT rows for the particles (indices) lost at step(s).
+    """
+    rows = np.zeros(len(particles), dtype=EVENT_DT)
+    rows['particle'] = particles
+    rows['step'] = step
+    rows['t'] = t
+    rows['x'], rows['y'], rows['z'] = points[:, 0], points[:, 1], points[:, 2]
+    rows['surface'] = surfaces
+    return rows
+
+def write_exit_step(f:h5py.File, exit_step:np.ndarray):
+    """
+    '/src/exit_step' of an open output file (in place if it's there already).
+    """
+    if '/src/exit_step' in f and f['/src/exit_step'].shape == exit_step.shape:
+        f['/src/exit_step'][...] = exit_step
+    else:
+        if '/src/exit_step' in f:
+            del f['/src/exit_step']
+        f.create_dataset('/src/exit_step', data=exit_step)
+
+#==============#
+# THE PUSHER   #
+#==============#
+def ensemble_push(from_temp:AppConfig=None, progress:ProgressChannel=None, b_interp=None, e_interp=None,
+                  timer:PhaseTimer=None):
+    """
+    Pushes every particle in from_temp.path.particle together.
+    timer: where the phases of the run are timed (calcs.timing); written to /diag/timing of the output file.
+    """
+    if timer is None:
+        timer = PhaseTimer()
+    mass = proton.mass
+    charge = proton.q
+    q_m = charge / mass
+
+    dt = from_temp.step.dt
+    num_points = int(from_temp.step.numsteps)
+    walls = Walls.from_config(from_temp)
+    mag_c = field_source(from_temp.b)
+    e_coils = CoilGeometry.from_config(from_temp.e) if from_temp.e.method in ('bob_e', 'disk_e', 'fw_e') else None
+    rule = dt_rule(from_temp.step.dynamic, q_m)
+    push = get_integrator(from_temp.step.integrator)
+    path = os.path.join(str(runtime_configs['Paths']['outputs']), from_temp.path.hdf5)
+
+    if from_temp.step.guiding_centre.on:
+        print(f"guiding centre mode is single particle only (calcs.guiding_centre); pushing the ensemble full orbit")
+
+    ckpt = read_checkpoint(path) if from_temp.step.resume else None
+    if ckpt is not None:
+        # resuming: continue from the output file's last checkpoint, appending to its datasets.
+        truncate_to_checkpoint(path, ckpt, rows=num_points + 1)
+        ckpt.restore_rng()
+        state = EnsembleState(x=ckpt.x, v=ckpt.v, b=ckpt.b, e=ckpt.e, alive=ckpt.alive.astype(bool),
+                              exit_step=ckpt.exit_step.astype(np.int64), t=ckpt.t, dt=ckpt.dt)
+        print(f"resuming from step {ckpt.step} of {num_points}")
+    else:
+        df = pd.read_csv(from_temp.path.particle, dtype=np.float64)
+        state = EnsembleState.from_dataframe(df, dt)
+    n = state.n
+    step = 0 if ckpt is None else ckpt.step
+    every = from_temp.output.checkpoint_steps
+
+    # (steps, N) SoA buffers, a pair sized from the output memory budget: one fills while the other is written
+    rows = rows_from_budget(from_temp.output.buffer_mb / 2, n)
+    buffer = TrajectoryBuffer(rows, n)
+    policy = OutputPolicy(from_temp.output, n) # which of its steps are written (files.output_policy)
+    if ckpt is not None:
+        policy.restore_state(path, ckpt.step)
+    events = [] # loss events since the last flush
+
+    def record():
+        # the initial row; no step was taken to get there
+        buffer.append(state.x, state.v, state.b, state.e, state.t, np.zeros(n))
+        if buffer.full:
+            flush()
+
+    def flush(final=False):
+        # everything but the buffer is copied: the writer thread works on it while the push carries on
+        nonlocal buffer
+        print(f"Flushing to h5 file")
+        flush_start = t.perf_counter()
+        at = step
+        saved = copy.deepcopy(state)
+        rng = np.random.get_state()
+        event_rows = np.concatenate(events) if events else None
+        events.clear()
+
+        def job(f):
+            policy.write(f, buffer_out, at, final=final)
+            if event_rows is not None:
+                append_events(f, event_rows, walls.names)
+            write_checkpoint(f, at, saved.t, saved.dt, saved.x, saved.v, saved.b, saved.e,
+                             saved.alive, saved.exit_step, config=from_temp, rng=rng)
+            policy.save_state(f)
+            if final:
+                trim_to_filled(f)
+                write_exit_step(f, saved.exit_step)
+        buffer_out = buffer
+        buffer = writer.submit(job, buffer)
+        timer.add('flush', t.perf_counter() - flush_start)
+
+    def report(step):
+        if progress is not None:
+            progress.update(step, float(state.t[0]), buffer)
+        print(f"boris calc * {step}, {int(state.alive.sum())}/{n} particles alive")
+
+    if ckpt is None:
+        with h5py.File(path, 'a') as f:
+            if '/src/particles' in f and n_particles(f) != n:
+                # the file was made for another particle count
+                set_particles(f, n, int(f['/src/particles'][0]['capacity']))
+    exit_start = state.exit_step.copy()
+    def prepare(f):
+        # everything the flushes write to, made before a live file switches to SWMR mode (files.async_writer)
+        append_events(f, [], walls.names)
+        policy.prepare(f)
+        write_exit_step(f, exit_start)
+        if '/checkpoint' not in f:
+            reserve_checkpoint(f, n, from_temp)
+
+    # the output file stays open on the writer thread for the rest of the run (files.async_writer)
+    live = from_temp.output.live
+    writer = AsyncWriter(path, TrajectoryBuffer(rows, n), threaded=from_temp.output.async_write, swmr=live,
+                         prepare=prepare, flush_seconds=from_temp.output.live_seconds if live else 0., timer=timer)
+
+    print(f"setup complete, beginning steps for {n} particles")
+    comp_start = t.time()
+
+    # fields at the starting positions; row 0 of the output is the initial state.
+    if ckpt is None:
+        state.e[:] = Efield_batch(state.x, from_temp, e_interp, e_coils)
+        state.b[:] = Bfield_batch(state.x, from_temp.b.method, mag_c, b_interp)
+        if rule is not None:
+            state.dt[:] = adaptive_dt(state.b, *rule)
+        record()
+        # the leapfrog starts half a step back (calcs.integrators)
+        state.v[:] = initial_half_step(push, state.x, state.v, state.e, state.b, state.dt[:, None], q_m)
+
+    start = step
+    if use_compiled_kernel(from_temp, b_interp, e_interp):
+        print(f"using the compiled grid kernel")
+        kernel = GridKernel(b_interp, e_interp, q_m, walls, rule, from_temp.step.integrator)
+        exit_surface = np.full(n, -1, dtype=np.int64)
+        exit_pos = np.zeros((n, 3))
+        while step < num_points and state.alive.any() and not (progress is not None and progress.stop_requested):
+            chunk = min(buffer.rows - buffer.count, 1000 - step % 1000, every - step % every, num_points - step)
+            before = step
+            timer.mark()
+            step += kernel.run(state.x, state.v, state.b, state.e, state.alive, state.exit_step, exit_surface, exit_pos,
+                               state.t, state.dt, step, chunk, buffer)
+            timer.lap('kernel')
+            lost = np.flatnonzero(state.exit_step > before)
+            if lost.size:
+                events.append(loss_events(lost, state.exit_step[lost], state.t[lost], exit_pos[lost], exit_surface[lost]))
+            if step % 1000 == 0:
+                report(step)
+            if buffer.full or step % every == 0 or (step % 1000 == 0 and writer.due()):
+                flush()
+    else:
+        for step in range(start + 1, num_points + 1):
+            idx = np.flatnonzero(state.alive)
+            if idx.size == 0:
+                step -= 1
+                break
+
+            # BORIS LOGIC
+            timer.mark()
+            dts = state.dt[idx]
+            x_old = state.x[idx]
+            x, v = push(x_old, state.v[idx], state.e[idx], state.b[idx], dts[:, None], q_m)
+            state.x[idx] = x
+            state.v[idx] = v
+            state.t[idx] += dts
+            timer.lap('push')
+
+            # COLLECT FIELDS at the new positions (one batched call each)
+            #   > off the field grids there are none: those particles are lost on the grid edge (calcs.walls)
+            edge = off_grid(x, b_interp, e_interp)
+            on, x_on = (idx[~edge], x[~edge]) if edge.any() else (idx, x)
+            state.e[idx[edge]] = 0.
+            state.b[idx[edge]] = 0.
+            if on.size:
+                state.e[on] = Efield_batch(x_on, from_temp, e_interp, e_coils)
+                timer.lap('e_field')
+                state.b[on] = Bfield_batch(x_on, from_temp.b.method, mag_c, b_interp)
+                timer.lap('b_field')
+            # row holds the dt that got each particle here (0 once it has left); the next one comes from the new field
+            buffer.append(state.x, state.v, state.b, state.e, state.t, np.where(state.alive, state.dt, 0.))
+            timer.lap('buffer')
+            if rule is not None:
+                state.dt[idx] = adaptive_dt(state.b[idx], *rule)
+
+            # EXIT CHECK (one vectorized test of every alive particle against every wall)
+            timer.mark()
+            surface, point = walls.crossings(x_old, x, edge)
+            timer.lap('walls')
+            hit = surface >= 0
+            if hit.any():
+                gone = idx[hit]
+                state.alive[gone] = False
+                state.exit_step[gone] = step
+                events.append(loss_events(gone, step, state.t[gone], point[hit], surface[hit]))
+
+            if step % 1000 == 0:
+                report(step)
+            if buffer.full or step % every == 0 or (step % 1000 == 0 and writer.due()):
+                flush()
+            if progress is not None and progress.stop_requested:
+                # stopped from the GUI (calcs.progress): end the run here; the final flush keeps what it has
+                break
+
+    if progress is not None and progress.stop_requested:
+        print(f"Stopped at step {step}")
+    if not state.alive.any():
+        print('All particles exited; ended ensemble push early')
+    comp_time = t.time() - comp_start
+    timer.add('run', comp_time)
+    print(f"{step - start} steps x {n} particles in {comp_time:.3f}s: "
+          f"{(step - start) * n / comp_time if comp_time > 0 else float('inf'):.1f} particle-steps/sec "
+          f"(B: {from_temp.b.method}, E: {from_temp.e.method})")
+    flush(final=True)
+    writer.close()
+    # a resumed run adds to the times of the runs before it
+    write_timing(path, timer, merge=from_temp.step.resume)
+    print(f"time per phase:\n{timer.summary()}")
+
+    if progress is not None:
+        progress.finish(step)
+    return state
@@ -0,0 +1,250 @@
+import h5py
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from calcs.jit_kernel import _trilinear, grid_arrays, is_uniform
+
+"""
+Guiding-centre (GC) mode for borisPush.
+
+In strongly magnetized regions a full orbit run spends nearly all of its steps resolving the gyration.
+In GC mode the particle is instead reduced to its guiding centre X, its parallel speed v_par and
+its magnetic moment mu = m v_perp^2 / 2B (an adiabatic invariant), pushed with RK4 through
+    dX/dt     = v_par b + (E x b) / B + b x (mu grad B + m v_par^2 kappa) / (q B)
+    dv_par/dt = (-mu b . grad B + q E . b) / m
+(b = B/|B|, kappa = (b . grad) b, the field line curvature), at GuidingCentreConfig.dt_factor times the full orbit dt.
+
+All of the field terms come from the gridded B: GCFields takes B, grad|B| and kappa on the grid once
+(finite differences) and interpolates them together, with the compiled kernel's trilinear lookup
+(calcs.jit_kernel._trilinear) on the stacked 9 components; a single point RegularGridInterpolator call
+costs more than the rest of the RK4 stage.
+
+# HAND-OFF
+The GC equations only hold while the gyro-orbit sees a nearly uniform field. That is measured by
+    eps = rho_L * max(|grad B| / B, |kappa|)     (gyroradius over the shortest field gradient/curvature length)
+The pusher drops back to full orbit when eps > eps_max, when |B| < b_min (near nulls and cusps)
+or when X leaves the grid, and only returns to GC once eps < eps_min (hysteresis, so it doesn't chatter).
+Every switch is printed and logged to '/src/handoff' in the output file (HANDOFF_DT), with the eps and |B| that caused it.
+
+A gyro-phase is carried along through GC stretches so that full orbit resumes with a sensible particle position.
+
+# OUTPUT
+One row per step as usual. During GC stretches the position is the guiding centre and the velocity is the
+particle velocity at the tracked gyro-phase; the t/dt columns show the longer GC steps.
+"""
+HANDOFF_DT = np.dtype([('step', np.int64), ('t', np.float64), ('to_gc', np.bool_), ('eps', np.float64),
+                       ('bmag', np.float64), ('x', np.float64), ('y', np.float64), ('z', np.float64)])
+
+#==============#
+# GRID FIELDS  #
+#==============#
+class GCFields:
+    """
+    B, grad|B| and the field line curvature on the grid of a B interpolator (RegularGridInterpolator).
+    Calling it with a (3,) point gives back (B, grad|B|, kappa), NaN outside of the grid.
+    Uniform grids (all of the B grids) use _trilinear, compiled if numba is there and plain Python otherwise;
+    anything else a RegularGridInterpolator.
+    """
+    def __init__(self, b_interp:RegularGridInterpolator):
+        axes = b_interp.grid
+        B = np.asarray(b_interp.values, dtype=np.float64)
+        bmag = np.linalg.norm(B, axis=-1)
+        bhat = B / np.where(bmag > 0, bmag, 1.)[..., None]
+
+        grad = np.stack(np.gradient(bmag, *axes), axis=-1)
+        # kappa_i = b_j d_j b_i
+        kappa = np.zeros_like(B)
+        for i in range(3):
+            d_bi = np.gradient(bhat[..., i], *axes)
+            kappa[..., i] = sum(bhat[..., j] * d_bi[j] for j in range(3))
+
+        values = np.concatenate([B, grad, kappa], axis=-1)
+        self.interp = RegularGridInterpolator(axes, values, bounds_error=False, fill_value=np.nan)
+        self.uniform = is_uniform(self.interp)
+        if self.uniform:
+            self.values, self.origin, self.inv_spacing = grid_arrays(self.interp)
+
+    def __call__(self, point):
+        if self.uniform:
+            out = np.empty(9)
+            if not _trilinear(self.values, self.origin, self.inv_spacing, point[0], point[1], point[2], out):
+                out[:] = np.nan
+        else:
+            out = self.interp(np.asarray(point).reshape(1, 3))[0]
+        return out[:3], out[3:6], out[6:]
+
+#=============#
+# THE MODE    #
+#=============#
+class GuidingCentre:
+    """
+    GC state of one particle and the hand-off logic. borisPush calls enter()/leave() when the criterion says so,
+    and step() in between.
+
+    X: guiding centre position
+    v_par: speed along b
+    mu: magnetic moment
+    u_perp: unit vector of the perpendicular velocity (the gyro-phase)
+    """
+    def __init__(self, fields:GCFields, config, q, m):
+        self.fields = fields
+        self.config = config
+        self.q, self.m = q, m
+        self.active = False
+        self.X = None
+        self.v_par = 0.
+        self.mu = 0.
+        self.u_perp = None
+        self.log = [] # HANDOFF_DT rows not yet written to the output file
+
+    #=== criterion ===#
+    def epsilon(self, point, v_perp):
+        """
+        returns (eps, |B|) at a point for a given perpendicular speed; eps is inf off the grid.
+        """
+        B, gradB, kappa = self.fields(point)
+        bmag = np.linalg.norm(B)
+        if not np.isfinite(bmag) or bmag == 0:
+            return np.inf, 0.
+        rho = self.m * v_perp / (abs(self.q) * bmag)
+        return rho * max(np.linalg.norm(gradB) / bmag, np.linalg.norm(kappa)), bmag
+
+    def adiabatic(self, eps, bmag, limit):
+        return eps < limit and bmag > self.config.b_min
+
+    def should_enter(self, x, v, Bf, Ef):
+        """
+        called on full orbit steps; True once the particle is well inside the adiabatic region.
+        """
+        bmag = np.linalg.norm(Bf)
+        if bmag == 0:
+            return False, np.inf, 0.
+        b = Bf / bmag
+        v_perp = v - np.dot(v, b) * b - _cross(Ef, b) / bmag
+        # judged at the would-be guiding centre, same as in GC mode
+        X = x + self.m / (self.q * bmag ** 2) * _cross(v_perp, Bf)
+        eps, bmag = self.epsilon(X, np.linalg.norm(v_perp))
+        return self.adiabatic(eps, bmag, self.config.eps_min), eps, bmag
+
+    #=== hand-offs ===#
+    def enter(self, x, v, Bf, Ef, step, t, eps):
+        """
+        full orbit -> GC, from the particle's position/velocity and the fields there.
+        """
+        bmag = np.linalg.norm(Bf)
+        b = Bf / bmag
+        v_e = _cross(Ef, b) / bmag
+        v_perp = v - np.dot(v, b) * b - v_e
+        vp = np.linalg.norm(v_perp)
+
+        self.X = x + self.m / (self.q * bmag ** 2) * _cross(v_perp, Bf)
+        self.v_par = np.dot(v, b)
+        self.mu = self.m * vp ** 2 / (2 * bmag)
+        self.u_perp = v_perp / vp if vp > 0 else _any_perpendicular(b)
+        self._last_b = b
+        self.active = True
+        self._log(step, t, True, eps, bmag, self.X)
+
+    def leave(self, e_at, step, t, eps, bmag):
+        """
+        GC -> full orbit; returns the particle's position and velocity at the tracked gyro-phase.
+        """
+        x, v = self.particle(e_at)
+        self.active = False
+        self._log(step, t, False, eps, bmag, x)
+        return x, v
+
+    def particle(self, e_at):
+        """
+        (position, velocity) of the particle at the current gyro-phase.
+        """
+        B, _, _ = self.fields(self.X)
+        bmag = np.linalg.norm(B)
+        if not np.isfinite(bmag) or bmag == 0:
+            # off the grid / at a null: there is no gyration to put back
+            return self.X.copy(), self.v_par * self._last_b
+        b = B / bmag
+        v_perp = np.sqrt(2 * self.mu * bmag / self.m) * self.u_perp
+        x = self.X - self.m / (self.q * bmag ** 2) * _cross(v_perp, B)
+        v = self.v_par * b + v_perp + _cross(e_at(self.X), b) / bmag
+        return x, v
+
+    def _log(self, step, t, to_gc, eps, bmag, pos):
+        self.log.append((step, t, to_gc, eps, bmag, *pos))
+        print(f"step {step}: {'full orbit -> guiding centre' if to_gc else 'guiding centre -> full orbit'} "
+              f"(eps = {eps:.3g}, |B| = {bmag:.3g} T)")
+
+    #=== pushing ===#
+    def _rhs(self, X, v_par, e_at):
+        B, gradB, kappa = self.fields(X)
+        bmag = np.linalg.norm(B)
+        if not np.isfinite(bmag) or bmag == 0:
+            return np.full(3, np.nan), np.nan
+        b = B / bmag
+        E = e_at(X)
+        dX = (v_par * b + _cross(E, b) / bmag
+              + _cross(b, self.mu * gradB + self.m * v_par ** 2 * kappa) / (self.q * bmag))
+        dv = (-self.mu * np.dot(b, gradB) + self.q * np.dot(E, b)) / self.m
+        return dX, dv
+
+    def step(self, dt, e_at):
+        """
+        One RK4 step of the GC equations. e_at(X) gives E at a point.
+
+        returns (eps, |B|) at the new guiding centre, for the hand-off check.
+        """
+        X, u = self.X, self.v_par
+        k1x, k1v = self._rhs(X, u, e_at)
+        k2x, k2v = self._rhs(X + 0.5 * dt * k1x, u + 0.5 * dt * k1v, e_at)
+        k3x, k3v = self._rhs(X + 0.5 * dt * k2x, u + 0.5 * dt * k2v, e_at)
+        k4x, k4v = self._rhs(X + dt * k3x, u + dt * k3v, e_at)
+        X_new = X + dt / 6 * (k1x + 2 * k2x + 2 * k3x + k4x)
+        v_new = u + dt / 6 * (k1v + 2 * k2v + 2 * k3v + k4v)
+        if not (np.all(np.isfinite(X_new)) and np.isfinite(v_new)):
+            # a stage left the grid or hit a null; stay put and let the caller hand back to full orbit
+            return np.inf, 0.
+        self.X, self.v_par = X_new, v_new
+
+        # advance the gyro-phase: v_perp turns by -Omega dt about b, then is kept perpendicular to the new b
+        B, _, _ = self.fields(self.X)
+        bmag = np.linalg.norm(B)
+        if np.isfinite(bmag) and bmag > 0:
+            b = B / bmag
+            self._last_b = b
+            ang = -self.q * bmag / self.m * dt
+            u = self.u_perp
+            u = u * np.cos(ang) + _cross(b, u) * np.sin(ang)
+            u = u - np.dot(u, b) * b
+            n = np.linalg.norm(u)
+            self.u_perp = u / n if n > 0 else _any_perpendicular(b)
+        return self.epsilon(self.X, np.sqrt(2 * self.mu * bmag / self.m) if np.isfinite(bmag) else 0.)
+
+    def pop_log(self) -> np.ndarray:
+        """
+        the hand-offs since the last call, as HANDOFF_DT rows (see append_handoffs).
+        """
+        rows = np.array(self.log, dtype=HANDOFF_DT)
+        self.log = []
+        return rows
+
+def append_handoffs(f:h5py.File, rows:np.ndarray):
+    """
+    appends hand-off rows to '/src/handoff' of an open output file (with no rows, only creates it).
+    """
+    if '/src/handoff' not in f:
+        f.create_dataset('/src/handoff', (0,), chunks=True, maxshape=(None,), dtype=HANDOFF_DT)
+    if len(rows) == 0:
+        return
+    ds = f['/src/handoff']
+    old = ds.shape[0]
+    ds.resize(old + len(rows), axis=0)
+    ds[old:] = rows
+
+def _any_perpendicular(b):
+    a = np.array([1., 0., 0.]) if abs(b[0]) < 0.9 else np.array([0., 1., 0.])
+    u = _cross(b, a)
+    return u / np.linalg.norm(u)
+
+def _cross(a, b):
+    # np.cross of two (3,) vectors; np.cross's axis handling is most of its cost at this size, called ~10 times a step
+    return np.array([a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]])
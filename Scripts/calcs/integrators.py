@@ -0,0 +1,103 @@
+import numpy as np
+
+from calcs.boris_step import boris_step
+from settings.constants import c_light
+
+"""
+The particle pushers borisPush/ensemble_push can step with, picked by DtNpConfig.integrator.
+
+Every integrator has the same signature as calcs.boris_step.boris_step:
+    push(x, v, Ef, Bf, dt, q_m) -> (x_new, v_new)
+on a single particle ((3,) arrays) or an ensemble ((N, 3) arrays, dt a float or (N, 1)),
+with Ef, Bf the fields at x. calcs.jit_kernel has compiled copies of each one (selected by INTEGRATOR_IDS).
+
+# INTEGRATORS
+boris: the classic (non-relativistic) Boris push. Volume preserving and energy conserving in pure B,
+       but the gyro-phase lags: it rotates by 2 atan(w dt / 2) instead of w dt per step.
+higuera_cary: the relativistic Higuera-Cary push on u = gamma v. Same rotation as Boris, but gets the
+       E x B drift velocity right at relativistic energies (Boris doesn't). Reduces to Boris when v << c.
+exact: Boris with the exact-rotation (exponential) magnetic step: the velocity is turned by exactly w dt about
+       the local B, so there is no gyro-phase error where B is locally uniform; everything else (leapfrog,
+       E kicks) is Boris. The orbit is still the polygon of the leapfrog, whose vertices sit on a circle
+       (w dt / 2) / sin(w dt / 2) times the gyroradius (Boris': sqrt(1 + (w dt / 2)^2) times), so it is second
+       order like the others, with a smaller constant (Tests/integrator_accuracy.py).
+
+# STARTING THE LEAPFROG
+All of them take v at the half steps, v(t - dt/2) -> v(t + dt/2). The pushers turn the particle file's v(0)
+into v(-dt/2) with a backward half step (initial_half_step) before the first step; started from v(0) instead,
+the orbit's gyro-phase is off by w dt / 2 for the whole run, a first order error that hides the order of the
+integrator. The first output row still holds v(0); resuming (files.checkpoint) carries on from the
+checkpointed half step velocity.
+"""
+#==============#
+# HIGUERA-CARY #
+#==============#
+def higuera_cary_step(x, v, Ef, Bf, dt, q_m):
+    """
+    Higuera & Cary (2017), Phys. Plasmas 24, 052104.
+    Same arguments as boris_step; v is the real velocity (u / gamma) on the way in and out.
+    """
+    half = q_m * 0.5 * dt
+    u = v / np.sqrt(1. - np.sum(v * v, axis=-1, keepdims=True) / c_light ** 2)
+
+    # half electric kick
+    u_minus = u + half * Ef
+
+    # gamma at the middle of the rotation (HC's implicit averaging of the magnetic part)
+    tau = half * Bf
+    tau2 = np.sum(tau * tau, axis=-1, keepdims=True)
+    gamma_minus2 = 1. + np.sum(u_minus * u_minus, axis=-1, keepdims=True) / c_light ** 2
+    u_star = np.sum(u_minus * tau, axis=-1, keepdims=True) / c_light
+    sigma = gamma_minus2 - tau2
+    gamma_new = np.sqrt(0.5 * (sigma + np.sqrt(sigma * sigma + 4. * (tau2 + u_star * u_star))))
+
+    # rotation
+    tt = tau / gamma_new
+    s = 1. / (1. + np.sum(tt * tt, axis=-1, keepdims=True))
+    u_plus = s * (u_minus + np.sum(u_minus * tt, axis=-1, keepdims=True) * tt + np.cross(u_minus, tt))
+
+    # second half kick
+    u_new = u_plus + half * Ef + np.cross(u_plus, tt)
+    v_new = u_new / np.sqrt(1. + np.sum(u_new * u_new, axis=-1, keepdims=True) / c_light ** 2)
+    return x + v_new * dt, v_new
+
+#================#
+# EXACT ROTATION #
+#================#
+def exact_step(x, v, Ef, Bf, dt, q_m):
+    """
+    Boris with the exact gyration angle (Zenitani & Umeda (2018), Phys. Plasmas 25, 112110).
+    Same arguments as boris_step.
+
+    Boris rotates v about B by 2 atan(|t|), t = (q dt / 2m) B; rescaling t to tan(w dt / 2) b makes that w dt,
+    i.e. the exponential of the rotation generator, which is exact when B is uniform over the step.
+    Needs dt < T_gyro / 2 (tan blows up at half a gyration per step).
+    """
+    half = q_m * 0.5 * dt
+    tt = half * Bf
+    tmag = np.linalg.norm(tt, axis=-1, keepdims=True)
+    tt = tt * np.where(tmag > 0, np.tan(tmag) / np.where(tmag > 0, tmag, 1.), 1.)
+    return boris_step(x, v, Ef, tt / half, dt, q_m)
+
+def initial_half_step(push, x, v, Ef, Bf, dt, q_m):
+    """
+    v(0) -> v(-dt/2) with a backward half step of the integrator push (same arguments as push),
+    for the start of a run (see STARTING THE LEAPFROG).
+    """
+    return push(x, v, Ef, Bf, -0.5 * dt, q_m)[1]
+
+#============#
+# SELECTION  #
+#============#
+INTEGRATORS = {
+    "boris" : boris_step,
+    "higuera_cary" : higuera_cary_step,
+    "exact" : exact_step,
+}
+# the kernel's switch values (calcs.jit_kernel)
+INTEGRATOR_IDS = {name : i for i, name in enumerate(INTEGRATORS)}
+
+def get_integrator(name:str):
+    if name not in INTEGRATORS:
+        raise ValueError(f"unknown integrator '{name}', expected one of {list(INTEGRATORS)}")
+    return INTEGRATORS[name]
@@ -0,0 +1,341 @@
+import numpy as np
+
+from calcs.integrators import INTEGRATOR_IDS
+from grid.symmetry import SymmetricGrid
+from settings.constants import c_light
+
+"""
+Compiled Boris kernel for gridded runs.
+
+With gridding on, every step used to call a scipy RegularGridInterpolator for a single point in Bfield/EfieldX,
+which is tens of microseconds of Python and input validation for eight array lookups.
+Here the raw grid arrays (RegularGridInterpolator.values) and their axes go into a numba kernel that runs
+many steps at a time, doing the trilinear lookup inline, and only comes back to Python at flush/progress intervals.
+Symmetry reduced grids (grid.symmetry.SymmetricGrid) go in as their stored box plus its folds (_grid_at).
+
+The push itself is one of the integrators in calcs.integrators, compiled again below as per-particle
+functions (_boris, which also does 'exact', and _higuera_cary) that update row p of x and v in place; keep them in step with those.
+
+numba is optional: if it is not installed, NUMBA_AVAILABLE is False and the pusher keeps using the Python loop.
+The kernel is CPU only. It releases the GIL, so the output writer thread (files.async_writer) runs alongside it.
+"""
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    def njit(*args, **kwargs):
+        # plain python fallback so the module still imports; the kernel is never selected without numba.
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+#==================#
+# GRID PREPARATION #
+#==================#
+def grid_arrays(interp):
+    """
+    Pulls the kernel inputs out of a RegularGridInterpolator built on a uniform grid (the box of a SymmetricGrid).
+    A None interpolator (zero field) becomes a 2x2x2 grid of zeros spanning everything.
+
+    returns (values (nx, ny, nz, 3), origin (3,), inv_spacing (3,))
+    """
+    if interp is None:
+        return np.zeros((2, 2, 2, 3)), np.full(3, -1e300), np.full(3, 1e-300)
+    if isinstance(interp, SymmetricGrid):
+        interp = interp.box
+
+    axes = interp.grid
+    origin = np.array([ax[0] for ax in axes], dtype=np.float64)
+    inv_spacing = np.array([(len(ax) - 1) / (ax[-1] - ax[0]) for ax in axes], dtype=np.float64)
+    values = np.ascontiguousarray(interp.values, dtype=np.float64)
+    return values, origin, inv_spacing
+
+def grid_folds(interp):
+    """
+    The folds of a SymmetricGrid (GridSymmetry.folds); none for anything else.
+
+    returns (axes (k,) int64, flips (k, 3), signs (k, 3))
+    """
+    if isinstance(interp, SymmetricGrid):
+        return interp.axes, interp.flips, interp.signs
+    return np.zeros(0, dtype=np.int64), np.zeros((0, 3)), np.zeros((0, 3))
+
+def is_uniform(interp) -> bool:
+    if interp is None:
+        return True
+    return all(np.allclose(np.diff(ax), ax[1] - ax[0]) for ax in interp.grid)
+
+def use_compiled_kernel(from_temp, b_interp, e_interp) -> bool:
+    """
+    The kernel only knows about gridded and zero fields.
+    """
+    if not NUMBA_AVAILABLE or not from_temp.step.compiled:
+        return False
+    b_ok = b_interp is not None or from_temp.b.method == "zero"
+    e_ok = e_interp is not None or from_temp.e.method == "zero"
+    return b_ok and e_ok and is_uniform(b_interp) and is_uniform(e_interp)
+
+#==========#
+# KERNELS  #
+#==========#
+@njit(cache=True)
+def _trilinear(values, origin, inv_spacing, px, py, pz, out):
+    """
+    Trilinear interpolation of a (nx, ny, nz, c) grid at one point, into out (c,).
+    returns False if the point is outside of the grid.
+    """
+    nx, ny, nz = values.shape[0], values.shape[1], values.shape[2]
+    fx = (px - origin[0]) * inv_spacing[0]
+    fy = (py - origin[1]) * inv_spacing[1]
+    fz = (pz - origin[2]) * inv_spacing[2]
+    # (written so that a NaN point is outside too)
+    if not (fx >= 0.0 and fy >= 0.0 and fz >= 0.0 and fx <= nx - 1 and fy <= ny - 1 and fz <= nz - 1):
+        return False
+    i = min(int(fx), nx - 2)
+    j = min(int(fy), ny - 2)
+    k = min(int(fz), nz - 2)
+    tx = fx - i
+    ty = fy - j
+    tz = fz - k
+    for c in range(values.shape[3]):
+        c00 = values[i, j, k, c] * (1 - tx) + values[i + 1, j, k, c] * tx
+        c10 = values[i, j + 1, k, c] * (1 - tx) + values[i + 1, j + 1, k, c] * tx
+        c01 = values[i, j, k + 1, c] * (1 - tx) + values[i + 1, j, k + 1, c] * tx
+        c11 = values[i, j + 1, k + 1, c] * (1 - tx) + values[i + 1, j + 1, k + 1, c] * tx
+        c0 = c00 * (1 - ty) + c10 * ty
+        c1 = c01 * (1 - ty) + c11 * ty
+        out[c] = c0 * (1 - tz) + c1 * tz
+    return True
+
+@njit(cache=True)
+def _grid_at(values, origin, inv_spacing, f_axes, f_flips, f_signs, px, py, pz, out):
+    """
+    _trilinear of a symmetry reduced grid: the point is folded into the stored box (grid.symmetry.GridSymmetry.folds)
+    and the field's components flipped back. No folds is a plain grid.
+    """
+    s0 = s1 = s2 = 1.0
+    for f in range(f_axes.shape[0]):
+        a = f_axes[f]
+        if (px if a == 0 else py if a == 1 else pz) < 0.0:
+            px, py, pz = px * f_flips[f, 0], py * f_flips[f, 1], pz * f_flips[f, 2]
+            s0, s1, s2 = s0 * f_signs[f, 0], s1 * f_signs[f, 1], s2 * f_signs[f, 2]
+    if not _trilinear(values, origin, inv_spacing, px, py, pz, out):
+        return False
+    out[0], out[1], out[2] = out[0] * s0, out[1] * s1, out[2] * s2
+    return True
+
+@njit(cache=True)
+def _boris(x, v, b, e, p, dt, q_m, exact):
+    half = q_m * 0.5 * dt
+    t0, t1, t2 = half * b[p, 0], half * b[p, 1], half * b[p, 2]
+    tsq = t0 * t0 + t1 * t1 + t2 * t2
+    if exact and tsq > 0.0:
+        # exact rotation angle (calcs.integrators.exact_step)
+        tm = np.sqrt(tsq)
+        f = np.tan(tm) / tm
+        t0, t1, t2 = t0 * f, t1 * f, t2 * f
+        tsq = t0 * t0 + t1 * t1 + t2 * t2
+    s0, s1, s2 = 2.0 * t0 / (1.0 + tsq), 2.0 * t1 / (1.0 + tsq), 2.0 * t2 / (1.0 + tsq)
+    m0, m1, m2 = v[p, 0] + half * e[p, 0], v[p, 1] + half * e[p, 1], v[p, 2] + half * e[p, 2]
+    p0 = m0 + m1 * t2 - m2 * t1
+    p1 = m1 + m2 * t0 - m0 * t2
+    p2 = m2 + m0 * t1 - m1 * t0
+    v[p, 0] = m0 + p1 * s2 - p2 * s1 + half * e[p, 0]
+    v[p, 1] = m1 + p2 * s0 - p0 * s2 + half * e[p, 1]
+    v[p, 2] = m2 + p0 * s1 - p1 * s0 + half * e[p, 2]
+    for c in range(3):
+        x[p, c] += v[p, c] * dt
+
+@njit(cache=True)
+def _higuera_cary(x, v, b, e, p, dt, q_m):
+    half = q_m * 0.5 * dt
+    cc = c_light * c_light
+    g = 1.0 / np.sqrt(1.0 - (v[p, 0] * v[p, 0] + v[p, 1] * v[p, 1] + v[p, 2] * v[p, 2]) / cc)
+    m0, m1, m2 = g * v[p, 0] + half * e[p, 0], g * v[p, 1] + half * e[p, 1], g * v[p, 2] + half * e[p, 2]
+    t0, t1, t2 = half * b[p, 0], half * b[p, 1], half * b[p, 2]
+    tau2 = t0 * t0 + t1 * t1 + t2 * t2
+    gm2 = 1.0 + (m0 * m0 + m1 * m1 + m2 * m2) / cc
+    us = (m0 * t0 + m1 * t1 + m2 * t2) / c_light
+    sigma = gm2 - tau2
+    gn = np.sqrt(0.5 * (sigma + np.sqrt(sigma * sigma + 4.0 * (tau2 + us * us))))
+    t0, t1, t2 = t0 / gn, t1 / gn, t2 / gn
+    s = 1.0 / (1.0 + t0 * t0 + t1 * t1 + t2 * t2)
+    mt = m0 * t0 + m1 * t1 + m2 * t2
+    p0 = s * (m0 + mt * t0 + m1 * t2 - m2 * t1)
+    p1 = s * (m1 + mt * t1 + m2 * t0 - m0 * t2)
+    p2 = s * (m2 + mt * t2 + m0 * t1 - m1 * t0)
+    u0 = p0 + half * e[p, 0] + p1 * t2 - p2 * t1
+    u1 = p1 + half * e[p, 1] + p2 * t0 - p0 * t2
+    u2 = p2 + half * e[p, 2] + p0 * t1 - p1 * t0
+    g = 1.0 / np.sqrt(1.0 + (u0 * u0 + u1 * u1 + u2 * u2) / cc)
+    v[p, 0], v[p, 1], v[p, 2] = u0 * g, u1 * g, u2 * g
+    for c in range(3):
+        x[p, c] += v[p, c] * dt
+
+@njit(cache=True)
+def _wall_hit(x, p, x0, x1, x2, w_c, w_n, w_off, w_rin, w_rout, sphere, size, hit_pos):
+    """
+    calcs.walls.Walls.crossings for particle p, which just moved from (x0, x1, x2) to x[p].
+    returns the surface id (-1 if none) and puts the hit point into hit_pos.
+    """
+    best = np.inf
+    surface = -1
+    for k in range(w_c.shape[0]):
+        d0 = x0 * w_n[k, 0] + x1 * w_n[k, 1] + x2 * w_n[k, 2] - w_off[k]
+        d1 = x[p, 0] * w_n[k, 0] + x[p, 1] * w_n[k, 1] + x[p, 2] * w_n[k, 2] - w_off[k]
+        if d0 * d1 > 0.0 or d0 == d1:
+            continue
+        f = d0 / (d0 - d1)
+        if f >= best:
+            continue
+        r0 = x0 + f * (x[p, 0] - x0) - w_c[k, 0]
+        r1 = x1 + f * (x[p, 1] - x1) - w_c[k, 1]
+        r2 = x2 + f * (x[p, 2] - x2) - w_c[k, 2]
+        a = r0 * w_n[k, 0] + r1 * w_n[k, 1] + r2 * w_n[k, 2]
+        q0, q1, q2 = r0 - a * w_n[k, 0], r1 - a * w_n[k, 1], r2 - a * w_n[k, 2]
+        radial = np.sqrt(q0 * q0 + q1 * q1 + q2 * q2)
+        if radial >= w_rin[k] and radial <= w_rout[k]:
+            best = f
+            surface = k + 2
+            hit_pos[0], hit_pos[1], hit_pos[2] = r0 + w_c[k, 0], r1 + w_c[k, 1], r2 + w_c[k, 2]
+    if surface >= 0:
+        return surface
+
+    if sphere:
+        out = x[p, 0] * x[p, 0] + x[p, 1] * x[p, 1] + x[p, 2] * x[p, 2] > size * size
+    else:
+        out = max(abs(x[p, 0]), abs(x[p, 1]), abs(x[p, 2])) > size
+    if out:
+        for c in range(3):
+            hit_pos[c] = x[p, c]
+        return 0
+    return -1
+
+@njit(cache=True, nogil=True)
+def boris_grid_run(x, v, b, e, alive, exit_step, exit_surface, exit_pos, t, dt, step0, nsteps, q_m, kind,
+                   w_c, w_n, w_off, w_rin, w_rout, sphere, size,
+                   adapt, dt_c, dt_lo, dt_hi,
+                   b_values, b_origin, b_inv, b_folds, use_b,
+                   e_values, e_origin, e_inv, e_folds, use_e,
+                   out_x, out_v, out_b, out_e, out_t, out_dt):
+    """
+    Runs up to nsteps Boris steps for N particles.
+
+    x, v, b, e: (N, 3) state; b, e hold the fields at x and are updated in place along with x, v.
+    alive, exit_step: (N,) masks, updated in place when a particle hits a wall or leaves the grid.
+    exit_surface, exit_pos: (N,), (N, 3) which surface each particle was lost on and where (calcs.walls).
+    t, dt: (N,) time of each particle and the dt of its next step, updated in place.
+    step0: the step number of the state passed in.
+    kind: which integrator to push with (calcs.integrators.INTEGRATOR_IDS).
+    w_*, sphere, size: the loss surfaces (calcs.walls.Walls, see GridKernel).
+    b_folds, e_folds: (axes, flips, signs) of symmetry reduced grids (grid_folds).
+    adapt: if True, each particle's dt is reset after every step to clip(dt_c / |B|, dt_lo, dt_hi) (see calcs.bob_dt).
+    out_x, out_v, out_b, out_e: (>= nsteps, N, 3) arrays (may be strided views) that receive one row per step.
+    out_t, out_dt: (>= nsteps, N) the same for the time and the dt taken.
+           Dead particles repeat their last state, with a dt of 0.
+
+    returns the number of steps done; fewer than nsteps if every particle left.
+    """
+    n = x.shape[0]
+    hit_pos = np.empty(3)
+    for s in range(nsteps):
+        any_alive = False
+        for p in range(n):
+            if alive[p]:
+                x0, x1, x2 = x[p, 0], x[p, 1], x[p, 2]
+                # PUSH
+                if kind == 1:
+                    _higuera_cary(x, v, b, e, p, dt[p], q_m)
+                else:
+                    _boris(x, v, b, e, p, dt[p], q_m, kind == 2)
+                t[p] += dt[p]
+                out_dt[s, p] = dt[p]
+
+                # FIELDS AT THE NEW POSITION
+                inside = True
+                if use_b:
+                    inside = _grid_at(b_values, b_origin, b_inv, b_folds[0], b_folds[1], b_folds[2],
+                                      x[p, 0], x[p, 1], x[p, 2], b[p])
+                if inside and use_e:
+                    inside = _grid_at(e_values, e_origin, e_inv, e_folds[0], e_folds[1], e_folds[2],
+                                      x[p, 0], x[p, 1], x[p, 2], e[p])
+
+                # EXIT CHECK
+                surface = _wall_hit(x, p, x0, x1, x2, w_c, w_n, w_off, w_rin, w_rout, sphere, size, hit_pos)
+                if surface < 0 and not inside:
+                    surface = 1
+                    for c in range(3):
+                        hit_pos[c] = x[p, c]
+                if not inside:
+                    for c in range(3):
+                        b[p, c] = 0.0
+                        e[p, c] = 0.0
+                if surface >= 0:
+                    alive[p] = False
+                    exit_step[p] = step0 + s + 1
+                    exit_surface[p] = surface
+                    for c in range(3):
+                        exit_pos[p, c] = hit_pos[c]
+                else:
+                    any_alive = True
+
+                # NEXT DT
+                if adapt:
+                    bm = np.sqrt(b[p, 0] * b[p, 0] + b[p, 1] * b[p, 1] + b[p, 2] * b[p, 2])
+                    dt[p] = min(max(dt_c / bm, dt_lo), dt_hi) if bm > 0.0 else dt_hi
+            else:
+                out_dt[s, p] = 0.0
+
+            out_t[s, p] = t[p]
+            for c in range(3):
+                out_x[s, p, c] = x[p, c]
+                out_v[s, p, c] = v[p, c]
+                out_b[s, p, c] = b[p, c]
+                out_e[s, p, c] = e[p, c]
+        if not any_alive:
+            return s + 1
+    return nsteps
+
+class GridKernel:
+    """
+    Holds the grid arrays for one run and feeds the kernel chunks of a TrajectoryBuffer.
+    walls: the loss surfaces (calcs.walls.Walls).
+    rule: (c, lo, hi) of the adaptive dt (calcs.bob_dt.dt_rule), or None for a fixed dt.
+    integrator: name of the push (calcs.integrators.INTEGRATORS).
+    """
+    def __init__(self, b_interp, e_interp, q_m, walls, rule=None, integrator="boris"):
+        self.b_values, self.b_origin, self.b_inv = grid_arrays(b_interp)
+        self.e_values, self.e_origin, self.e_inv = grid_arrays(e_interp)
+        self.b_folds, self.e_folds = grid_folds(b_interp), grid_folds(e_interp)
+        self.use_b = b_interp is not None
+        self.use_e = e_interp is not None
+        self.q_m = q_m
+        self.w_c, self.w_n = walls.centres, walls.normals
+        self.w_off = walls.offsets
+        self.w_rin, self.w_rout = walls.r_in, walls.r_out
+        self.sphere = walls.bound == 'sphere'
+        self.size = walls.size
+        self.kind = INTEGRATOR_IDS[integrator]
+        self.adapt = rule is not None
+        self.dt_c, self.dt_lo, self.dt_hi = rule if rule is not None else (0., 0., 0.)
+
+    def run(self, x, v, b, e, alive, exit_step, exit_surface, exit_pos, t, dt, step0, nsteps, buffer):
+        """
+        Runs up to nsteps steps, appending the rows to the buffer.
+        All state arrays are (N, 3)/(N,) and updated in place; exit_surface/exit_pos are only written for
+        particles that are lost.
+
+        returns the number of steps done.
+        """
+        i = buffer.count
+        done = boris_grid_run(x, v, b, e, alive, exit_step, exit_surface, exit_pos, t, dt, step0, nsteps,
+                              self.q_m, self.kind,
+                              self.w_c, self.w_n, self.w_off, self.w_rin, self.w_rout, self.sphere, self.size,
+                              self.adapt, self.dt_c, self.dt_lo, self.dt_hi,
+                              self.b_values, self.b_origin, self.b_inv, self.b_folds, self.use_b,
+                              self.e_values, self.e_origin, self.e_inv, self.e_folds, self.use_e,
+                              buffer.x[i:], buffer.v[i:], buffer.b[i:], buffer.e[i:],
+                              buffer.t[i:], buffer.dt[i:])
+        buffer.count += done
+        return done
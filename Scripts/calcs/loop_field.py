@@ -0,0 +1,145 @@
+import numpy as np
+from scipy.constants import mu_0
+from magpylib.current import Circle
+
+from EFieldFJW.celxx import cel_iter, cel_iter_scalar
+from calcs.jit_kernel import njit, NUMBA_AVAILABLE
+from calcs.coil_geometry import CoilGeometry
+
+"""
+B field of circular current loops without magpylib: the 'loop' B method (FieldConfig.method).
+
+Collection.getB checks its inputs and walks the collection's children on every call, which is most of the time
+a step of the python loop pushers takes for one point. CircleLoops reads the Circle children of the collection
+into flat arrays once (calcs.coil_geometry), and getB() then evaluates the closed form loop field
+(M. Ortner et al., "Numerically stable and computationally efficient expression for the magnetic field of a
+current loop", Magnetism 2023, 3(1), 11-31; the expression magpylib uses) for every point and every loop in one
+numpy pass, with the Bulirsch cel iteration of EFieldFJW.celxx (cel_iter).
+With numba (optional, as for calcs.jit_kernel) the same expression runs compiled, point by point and loop by loop
+(_loops_getB), which takes a few microseconds per point rather than the hundreds numpy spends on its calls.
+
+CircleLoops has the getB(points, squeeze=True) of a magpylib Collection, so the pushers and the grids take it in
+place of the collection (field_source). It agrees with magpylib to ~1e-14 relative (Tests/loop_field_speed.py).
+Like magpylib, the field on a wire is 0.
+"""
+class CircleLoops:
+    def __init__(self, coils:CoilGeometry):
+        """
+        coils: the loops' geometry (calcs.coil_geometry); strengths are the currents [A]
+        """
+        self.coils = coils
+
+    @classmethod
+    def from_collection(cls, collection):
+        loops = collection.sources_all if hasattr(collection, 'sources_all') else [collection]
+        if not all(isinstance(loop, Circle) for loop in loops):
+            raise ValueError(f"the 'loop' B method only takes Circle currents")
+        return cls(CoilGeometry.from_collection(collection))
+
+    def getB(self, points, squeeze=True) -> np.ndarray:
+        """
+        B [T] at points ((3,) or (..., 3) [m], e.g. a (res, res, res, 3) grid) in the points' shape,
+        or (3,) for a single point when squeeze is set.
+        """
+        coils = self.coils
+        points = np.asarray(points, dtype=np.float64)
+        single, shape = points.ndim == 1, points.shape
+        points = points.reshape(-1, 3)
+        if NUMBA_AVAILABLE:
+            b = np.empty_like(points)
+            _loops_getB(np.ascontiguousarray(points), coils.centres, coils.rotations, coils.radii, coils.strengths, b)
+        else:
+            r, phi, z = coils.to_cylindrical(points)
+            br, bz = loop_field(coils.radii, r, z, coils.strengths)
+            b = coils.cylindrical_to_world(br, bz, phi).sum(axis=1)
+        if single:
+            return b[0] if squeeze else b
+        return b.reshape(shape)
+
+def loop_field(r0, r, z, current):
+    """
+    (B_r, B_z) [T] of loops of radius r0 [m] carrying current [A], at cylindrical (r, z) [m] in the loop's frame.
+    All inputs broadcast together.
+    """
+    r, z = r / r0, z / r0
+    z2 = z ** 2
+    x0 = z2 + (r + 1) ** 2
+    k2 = 4 * r / x0
+    q2 = (z2 + (r - 1) ** 2) / x0
+    # on the wire: q2 = 0
+    wire = q2 < 1e-30
+    q2 = np.where(wire, 1., q2)
+    q = np.sqrt(q2)
+    p = 1 + q
+    pf = mu_0 * current / (4 * np.pi * r0 * np.sqrt(x0) * q2)
+
+    # the cel* (radial) and cel** (axial) parts, iterated together
+    k4 = k2 * k2
+    cc_r = k2 * 4 * z / x0
+    cc = np.stack(np.broadcast_arrays(cc_r, k4 - (q2 + 1) * (4 / x0)))
+    ss = np.stack(np.broadcast_arrays(2 * cc_r * q / p, 2 * q * (k4 / p - (4 / x0) * p)))
+    cel = cel_iter(q, p, np.ones_like(q), cc, ss, p, q)
+    return np.where(wire, 0., pf * cel[0]), np.where(wire, 0., -pf * cel[1])
+
+_cel = njit(cache=True)(cel_iter_scalar)
+
+@njit(cache=True)
+def _loop_rz(r0, rho, lz, current):
+    """
+    loop_field for one loop and one point: (B_r, B_z), 0 on the wire.
+    """
+    r, z = rho / r0, lz / r0
+    z2 = z * z
+    x0 = z2 + (r + 1) ** 2
+    k2 = 4 * r / x0
+    q2 = (z2 + (r - 1) ** 2) / x0
+    if q2 < 1e-30:
+        return 0., 0. # on the wire
+    q = np.sqrt(q2)
+    p = 1 + q
+    pf = mu_0 * current / (4 * np.pi * r0 * np.sqrt(x0) * q2)
+    cc = k2 * 4 * z / x0
+    br = pf * _cel(q, p, 1., cc, 2 * cc * q / p, p, q)
+    k4 = k2 * k2
+    bz = -pf * _cel(q, p, 1., k4 - (q2 + 1) * (4 / x0), 2 * q * (k4 / p - (4 / x0) * p), p, q)
+    return br, bz
+
+@njit(cache=True)
+def _loops_getB(points, centres, rotations, radii, currents, out):
+    """
+    CircleLoops.getB compiled: loop_field and the frame changes, for one point and one loop at a time.
+    """
+    for n in range(points.shape[0]):
+        bx = by = bz = 0.
+        for c in range(centres.shape[0]):
+            R = rotations[c]
+            dx = points[n, 0] - centres[c, 0]
+            dy = points[n, 1] - centres[c, 1]
+            dz = points[n, 2] - centres[c, 2]
+            # into the loop's frame (R transposed)
+            lx = R[0, 0] * dx + R[1, 0] * dy + R[2, 0] * dz
+            ly = R[0, 1] * dx + R[1, 1] * dy + R[2, 1] * dz
+            lz = R[0, 2] * dx + R[1, 2] * dy + R[2, 2] * dz
+            rho = np.sqrt(lx * lx + ly * ly)
+            br, bl = _loop_rz(radii[c], rho, lz, currents[c])
+
+            cos, sin = (lx / rho, ly / rho) if rho > 0 else (1., 0.)
+            ux, uy = br * cos, br * sin
+            bx += R[0, 0] * ux + R[0, 1] * uy + R[0, 2] * bl
+            by += R[1, 0] * ux + R[1, 1] * uy + R[1, 2] * bl
+            bz += R[2, 0] * ux + R[2, 1] * uy + R[2, 2] * bl
+        out[n, 0] = bx
+        out[n, 1] = by
+        out[n, 2] = bz
+
+def field_source(cfg):
+    """
+    What the pushers call getB on for a B FieldConfig: its collection, the collection's CircleLoops for 'loop',
+    or its AnnularCoils for 'annulus' (calcs.annulus_field).
+    """
+    if cfg.method == 'loop':
+        return CircleLoops.from_collection(cfg.collection)
+    if cfg.method == 'annulus':
+        from calcs.annulus_field import AnnularCoils
+        return AnnularCoils.from_config(cfg)
+    return cfg.collection
@@ -6,15 +6,17 @@
 
 # parallelization
 from concurrent.futures import ThreadPoolExecutor #multithreading
-from concurrent.futures import ProcessPoolExecutor #multiprocessing
 
 # used to create output restart file
 import pandas as pd
 
 # Pusher specific stuff
 ## Currents, dataclasses
-from files.PusherClasses import particle, position_dt, velocity_dt, field_e_dt, field_b_dt
-from files.PusherClasses import CreateOutput
+from files.trajectory_buffer import TrajectoryBuffer, rows_from_budget, append_buffer_to_hdf5
+from files.checkpoint import write_checkpoint, read_checkpoint, truncate_to_checkpoint, reserve_checkpoint
+from files.output_policy import OutputPolicy
+from files.async_writer import AsyncWriter
+from files.hdf5.output_file_structure import trim_to_filled
 ## Calculations
 import numpy as np
 import magpylib as magpy
@@ -22,25 +24,30 @@ import magpylib as magpy
 ## Computation Diagnostics
 import time as t
 
-# Field Methods
-from settings.fields.FieldMethods_Impl import (bob_e_impl)
-
 # Linalg stuff
 from Alg.polarSpace import toCart, toCyl
 
 # Constants
 from Scripts.settings.constants import proton
 
-from calcs.bob_dt import bob_dt_step
+from calcs.bob_dt import adaptive_dt, dt_rule
+from calcs.integrators import get_integrator, initial_half_step
+from calcs.backends import pick_backend, make_executor
+from calcs.jit_kernel import GridKernel, use_compiled_kernel
+from calcs.guiding_centre import GCFields, GuidingCentre, append_handoffs
+from calcs.walls import Walls, append_events, off_grid
+from calcs.timing import PhaseTimer, SamplingProfiler, write_timing
+from calcs.loop_field import field_source, CircleLoops
+from calcs.annulus_field import AnnularCoils
+from calcs.coil_geometry import CoilGeometry
 
 #from system.temp_manager import TEMPMANAGER_MANAGER, read_temp_file_dict
 #from system.temp_file_names import m1f1, param_keys
 
 from settings.configs.funcs.config_reader import runtime_configs
-from calcs.magpy4c1_manager_queue_datatype import Manager_Data
+from calcs.progress import ProgressChannel
 
 from EFieldFJW.efieldring_4 import fwysr_e
-from EFieldFJW.Estreamlines3Dring import compute_field
 from scipy.interpolate import RegularGridInterpolator
 
 from system.state_dict_main import AppConfig
@@ -59,7 +66,7 @@ pd.set_option('display.max_columns', None)
 # B FIELD #
 #=========#
 is_logging_e = False
-# unless it is outside of the bounds given by 'side'
+# unless it has hit one of the walls (calcs.walls)
 def Bfield(y, method, c, interp):
     if interp is None:
         if(method == "zero"):
@@ -69,7 +76,6 @@ def Bfield(y, method, c, interp):
         return np.array(Bf)
     else:
         # interpolator should be called for this point
-        print(f"USING INTERPOLATOR FOR B")
         return interp([y]).squeeze()
 
 # global variables
@@ -93,59 +99,43 @@ def Fw(coord:float, fromTemp):
     return np.multiply(A * np.exp(-(coord / Bx)** 4), (coord/Bx)**15)
 
 
-def _Bob_e(inCoord, c, res):
-    """
-    The internal function passed to each thread in Bob_e().
-
-    Inputs:
-    inCord: the coordinate of the point to calculate E at.
-    cnr: the coordinate of the circle's center and its radius.
+def Bob_e(coord, res, collection, coils:CoilGeometry=None):
     """
+    E of the charged rings at coord (bob_e_impl.at for every ring at once).
+    The points go into every ring's frame in one go, the theta integral runs over a (res, points, rings) array,
+    and each ring's (E_rho, E_zeta) goes back out through its own rotation before they are summed.
 
-    q = c.current # charge
-    #print(f"running with the q:{q}")
-    
-    # To make the target point relative to the coil, we call the bob_e.impl's alignment func.
-    normCoord = bob_e_impl.OrientPoint(c=c, point=inCoord)
-    radius = c.diameter / 2
-    normCoord = toCyl(normCoord)
-    # Then pass this as the coordinate parameter of the implementation.
-    z, r = bob_e_impl.at(coord = normCoord, q=q, resolution=int(res), radius= radius, convert=False)
-    cart = toCart(r, normCoord[1], z)
-        # since we most likely rotated the point by the inverse rotation of the coil,
-        # we need to also forward rotate the results to get the E field oriented correctly.
-    cart = c.orientation.apply(cart)
-    return cart
-
-def __Bob_e(coord, args):
-    """
-    This function will utlize multithreading, with each coil
-    calculating its own e-field on a new thread.
-    """
-    es = [] # collection of cartesian E field components for each coil
-    E_collection = args['collection']
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        futures = {executor.submit(_Bob_e, coord, coil, args): coil for coil in E_collection}
-
-        # Gather the data from futures once completed.
-        for index, task in enumerate(futures):
-            result = task.result() # cartesian form of E field
-            es.append(result)
-    return np.sum(es, axis=0) # sum the E field components column-wise
-
-def Bob_e(coord, res, collection):
-    """
-    This function will utlize multithreading, with each coil
-    calculating its own e-field on a new thread.
+    coord: a (3,) point, or (n, 3) points (the ensemble's batch, calcs.ensemble.Efield_batch)
+    coils: the collection's geometry (calc_e_consts), built here if not given.
+    returns (3,), or (n, 3)
     """
-    es = [] # collection of cartesian E field components for each coil
-    for coil in collection:
-        cart = _Bob_e(coord, coil, res)
-        es.append(cart)
-
-    return np.sum(es, axis=0) # sum the E field components column-wise
-
-from EFieldFJW.ys_3d_disk import compute_disk_with_collection, compute_fields
+    if coils is None:
+        coils = CoilGeometry.from_collection(collection)
+    k = 8.99e9 # Coulomb's constant, N * m^2/C^2
+    radius = coils.radii
+    kq_a2 = (k * coils.strengths) / (radius ** 2)
+
+    r, phi, z = coils.to_cylindrical(coord) # (n, C) each
+    zeta = z / radius
+    rho = r / radius
+    rho = np.where(np.abs(rho) < 1e-10, 1e-10, rho)
+
+    mag = (rho ** 2 + zeta ** 2 + 1)
+    mag_3_2 = mag ** (3/2)
+    Fzeta_c = (zeta)/(mag_3_2 * (radius ** 2))
+    Frho_c = (rho)/(mag_3_2 * (radius ** 2))
+
+    # (res, n, C)
+    cosines = np.cos(np.linspace(0, np.pi, int(res), dtype=np.float64))[:, None, None]
+    denominators = (1-((2 * rho * cosines)/mag)) ** (3/2)
+    denominators[denominators==0] = 1e-20
+
+    E_zeta = (1/denominators).sum(axis=0) * Fzeta_c * kq_a2
+    E_rho = ((1 - cosines / rho) / denominators).sum(axis=0) * Frho_c * kq_a2
+    E = coils.cylindrical_to_world(E_rho, E_zeta, phi).sum(axis=1) # sum over the rings
+    return E[0] if np.ndim(coord) == 1 else E
+
+from EFieldFJW.ys_3d_disk import compute_disk_with_collection
 #from EFieldFJW.washerPhiVectorized import compute_field as compute_washerPhi
 from EFieldFJW.washersPhi_vectorized import washer_phi_from_collection
 
@@ -171,77 +161,138 @@ def EfieldX(p:np.ndarray, fromTemp, executor, interpolator, e_args):
         case "fw":
             E = np.apply_along_axis(Fw, 0, p, fromTemp)
         case "bob_e":
-            E = Bob_e(p, fromTemp.e.res, fromTemp.e.collection)
-            np.empty(0).sum()  # force numpy thread finish
+            E = Bob_e(p, fromTemp.e.res, fromTemp.e.collection, e_args.get('coils'))
             #print(f"Bob_e says E is: {E}")
         case "fw_e":
             # call the appropriate function to get the value
-            E = compute_field(p, fromTemp.e.collection, int(fromTemp.e.res), executor)
-            np.empty(0).sum()  # force numpy thread finish
+            E = fwysr_e(p, fromTemp.e.collection, int(fromTemp.e.res), geometry=e_args.get('coils'))
         case 'disk_e':
             inners = fromTemp.e.inner_r
-            E = compute_disk_with_collection(p, fromTemp.e.collection, inners, executor)
+            E = compute_disk_with_collection(p, fromTemp.e.collection, inners, executor, coils=e_args.get('coils'))
 
             
     return np.array(E)
 
 import os
+import multiprocessing
+import copy
 import h5py
-def write_to_hdf5(from_temp, out, expand_length, num_points):
+def write_to_hdf5(from_temp, writer:AsyncWriter, buffer:TrajectoryBuffer, num_points, checkpoint:dict=None,
+                  gc:GuidingCentre=None, events:list=None, walls:Walls=None, policy:OutputPolicy=None, final=False):
+    """
+    Hands the filled rows of the trajectory buffer to the output file's writer (files.async_writer), along with
+    everything else that is saved at a flush. The buffer's structured arrays already match the dataset dtypes,
+    so they are handed to h5py as-is.
+    Everything but the buffer is copied here, since the push carries on while the writer works.
+
+    checkpoint: the state at the last buffered step (files.checkpoint.write_checkpoint kwargs); saved with the rows.
+    gc: guiding centre mode, whose hand-off log is saved with the rows.
+    events, walls: loss event rows since the last flush (calcs.walls) and the walls they refer to; events is emptied.
+    policy: which of the buffered steps to write (files.output_policy); needs the checkpoint for the step number.
+    final: the run ends with this flush; the preallocated rows that were never filled are dropped.
+
+    returns the (empty) buffer to keep filling.
+    """
         # notify terminal
     print(f"Flushing to h5 file")
+    flush_start = t.perf_counter()
+    checkpoint = copy.deepcopy(checkpoint)
+    rng = np.random.get_state()
+    handoffs = gc.pop_log() if gc is not None else None
+    event_rows = list(events) if events else None
+    if events:
+        events.clear()
+
+    def job(f):
+        if policy is None:
+            append_buffer_to_hdf5(f, buffer, max_rows=num_points + 1)
+        else:
+            # (the buffer is only ever empty without a checkpoint)
+            policy.write(f, buffer, checkpoint['step'] if checkpoint is not None else 0, max_rows=num_points + 1,
+                         final=final)
+        if checkpoint is not None:
+            write_checkpoint(f, config=from_temp, rng=rng, **checkpoint)
+            if policy is not None:
+                policy.save_state(f)
+        if handoffs is not None:
+            append_handoffs(f, handoffs)
+        if event_rows:
+            append_events(f, event_rows, walls.names)
+        if final:
+            trim_to_filled(f)
+
+    # (not assigned to buffer: the job reads it)
+    empty = writer.submit(job, buffer)
+    if writer.timer is not None:
+        writer.timer.add('flush', t.perf_counter() - flush_start)
+    return empty
+
+
+def compiled_push(from_temp, progress:ProgressChannel, kernel:GridKernel, walls:Walls, x, v, Bf, Ef, writer:AsyncWriter,
+                  buffer:TrajectoryBuffer, num_points, time=0, ft=0., dt=None, policy:OutputPolicy=None,
+                  timer:PhaseTimer=None):
+    """
+    borisPush's step loop for runs where every field is gridded or zero (see calcs.jit_kernel).
+    The kernel runs whole chunks of steps and only returns here to report progress or flush the buffer.
+    walls: the walls the kernel was built with, for the loss event.
+    time, ft: step number and simulated time to start from (non-zero when resuming).
+    dt: the first timestep; the kernel adapts it when dynamic dt is on.
+    writer, policy: the output file's writer and the output policy (see write_to_hdf5)
+    timer: each chunk is timed as 'kernel' (calcs.timing)
+
+    returns the step number it stopped at, the checkpoint state and the buffer it was filling.
+    """
+    every = from_temp.output.checkpoint_steps
+    if timer is None:
+        timer = PhaseTimer()
+    x, v = x.reshape(1, 3).copy(), v.reshape(1, 3).copy()
+    b, e = np.array(Bf, dtype=np.float64).reshape(1, 3), np.array(Ef, dtype=np.float64).reshape(1, 3)
+    alive = np.ones(1, dtype=bool)
+    exit_step = np.full(1, -1, dtype=np.int64)
+    exit_surface = np.full(1, -1, dtype=np.int64)
+    exit_pos = np.zeros((1, 3))
+    events = []
+    sim_time = np.full(1, ft, dtype=np.float64)
+    dts = np.full(1, from_temp.step.dt if dt is None else dt, dtype=np.float64)
+
+    def state():
+        return dict(step=time, sim_time=sim_time, dt=dts, x=x, v=v, b=b, e=e,
+                    alive=alive, exit_step=exit_step)
+
+    while time < num_points and alive[0] and not (progress is not None and progress.stop_requested):
+        chunk = min(buffer.rows - buffer.count, 1000 - time % 1000, every - time % every, num_points - time)
+        timer.mark()
+        time += kernel.run(x, v, b, e, alive, exit_step, exit_surface, exit_pos, sim_time, dts, time, chunk, buffer)
+        timer.lap('kernel')
+        if not alive[0]:
+            events.append((0, exit_step[0], sim_time[0], *exit_pos[0], exit_surface[0]))
 
-        # take away all None type entries
-    #print(out.shape)
-    _out = out[out != np.array(None)]
-    _out = _out[1:]
-    #print(_out)
-    df = pd.DataFrame([p.__dict__ for p in _out])
-    #print(df)
-    path = os.path.join(str(runtime_configs['Paths']['outputs']), from_temp.path.hdf5)
-    #print(path)
-
-    # append to position dataset
-    df_pos = np.ascontiguousarray(df[['px', 'py', 'pz']].astype(dtype=np.float64).to_numpy()).view(dtype=position_dt).reshape(-1)
-    #print(df_pos)
-    #df_pos.to_hdf(path, key='src/position', mode='a', append=True)
-    # append to velocity dataset
-    df_vel = np.ascontiguousarray(df[['vx', 'vy', 'vz', 'vperp', 'vpar', 'vmag']].astype(np.float64).to_numpy()).view(dtype=velocity_dt).reshape(-1)
-    #df_vel.to_hdf(path, key='src/velocity', mode='a', append=True)
-    # append to field datasets
-    df_fields_b = np.ascontiguousarray(df[['bx', 'by', 'bz', 'bmag', 'bhx', 'bhy', 'bhz']].astype(np.float64).to_numpy()).view(dtype=field_b_dt).reshape(-1)
-    #df_fields_b.to_hdf(path, key='src/fields/b', mode='a', append=True)
-    df_fields_e = np.ascontiguousarray(df[['ex', 'ey', 'ez', 'eperp', 'epar', 'emag']].astype(np.float64).to_numpy()).view(dtype=field_e_dt).reshape(-1)
-    #df_fields_e.to_hdf(path, key='src/fields/e', mode='a', append=True)
-
-    with h5py.File(path, 'a') as f:
-        old_shape = f['/src/position'].shape[0]
-        if old_shape < num_points + 1:
-            f['/src/position'].resize((old_shape + len(df)), axis=0)
-            f['/src/position'][old_shape:] = df_pos
-
-            old_shape = f['/src/velocity'].shape[0]
-            f['src/velocity'].resize((old_shape + len(df)), axis=0)
-            f['/src/velocity'][old_shape:] = df_vel
-
-            old_shape = f['src/fields/b'].shape[0]
-            f['src/fields/b'].resize((old_shape + len(df)), axis=0)
-            f['src/fields/e'].resize((old_shape + len(df)), axis=0)
-            f['src/fields/b'][old_shape:] = df_fields_b
-            f['src/fields/e'][old_shape:] = df_fields_e
-    
-        # reset the internal container array
-    last_struct = _out[-1] # indexing _out so this is guaranteed to not be None for whatever reason.
-    out = np.empty(out.shape, dtype=particle)
-    out[0] = last_struct
-
-    return out
-
+        if time % 1000 == 0:
+            if progress is not None:
+                progress.update(time, sim_time[0], buffer)
+            print(f"boris calc * {time}")
+        if buffer.full or time % every == 0 or (time % 1000 == 0 and writer.due()):
+            buffer = write_to_hdf5(from_temp, writer, buffer, num_points, state(), events=events, walls=walls,
+                                   policy=policy)
+
+    if not alive[0]:
+        print(f'Exited Boris Push Early, on {walls.names[exit_surface[0]]}')
+    elif progress is not None and progress.stop_requested:
+        print(f"Stopped at step {time}")
+    if events:
+        buffer = write_to_hdf5(from_temp, writer, buffer, num_points, state(), events=events, walls=walls,
+                               policy=policy)
+    return time, state(), buffer
 
 # boris push calculation
 # this is used to move the particle in a way that simulates movement from a magnetic field
-def borisPush(executor=None, from_temp=None, manager_queue=None, b_interp = None, e_interp = None):
+def borisPush(executor=None, from_temp=None, progress:ProgressChannel=None, b_interp = None, e_interp = None, backend="serial",
+              timer:PhaseTimer=None):
     """
+    executor: the execution backend handed to the E method (see calcs.backends); the loop itself is synchronous.
+    backend: name of that backend, only used for reporting.
+    timer: where the phases of the run are timed (calcs.timing); written to /diag/timing of the output file.
+
     INTERNAL VARS
     Gyroradius:
         gyro_time: the time in sec it takes for one gyration.
@@ -249,28 +300,21 @@ def borisPush(executor=None, from_temp=None, manager_queue=None, b_interp = None
     """
     #global df, num_parts, num_points, dt, sim_time, B_Method, E_Method, E_Args,c # Should be fine in multiprocessing because these values are only read,,,
     #print(df)
-    temp = 100000  # replace later with flush_count param after adding it to the tempfile
 
     # determine constants for field calculations
     e_args = {} # extra arguments supplied to E calculation
     def calc_e_consts():
         method = from_temp.e.method
+        if method in ('bob_e', 'fw_e', 'disk_e', 'washer_potential'):
+            # the rings' geometry, read from the collection once for the whole run
+            e_args['coils'] = CoilGeometry.from_config(from_temp.e)
         match method:
             case 'washer_potential':
-                e_c:magpy.Collection
-                e_c = from_temp.e.collection
                 # assemble extra function arguments for the solution
                 #   Generally will be in lists with the same indexing order as the collection
-
-                normals = [] # input n_coils amount of (3,) arrays
-                sigmas = [] # input n_coils amount of empty lists
-                for ring in e_c.children_all:
-                    # we can get the coil's normal by rotating [0, 0, 1] by the coil's orientation.
-                    default_z = np.array([0,0,1])
-                    normals.append(ring.orientation.apply(default_z))
-
-                    # append empty list per coil into sigmas
-                    sigmas.append([])
+                coils = e_args['coils']
+                normals = list(coils.normals) # input n_coils amount of (3,) arrays
+                sigmas = [[] for _ in range(len(coils))] # input n_coils amount of empty lists
 
                 # put all argument extras inside the e_args dict
                 e_args['normals'] = normals
@@ -280,292 +324,288 @@ def borisPush(executor=None, from_temp=None, manager_queue=None, b_interp = None
 
     calc_e_consts()
 
-    ## Collect coil location to know when the particle escapes
-    mag_c = from_temp.b.collection
+    ## Surfaces the particle is lost on (bounding box, coils, washers; see calcs.walls)
+    mag_c = field_source(from_temp.b) # the collection, or its loops for the 'loop' method (calcs.loop_field)
     dt = from_temp.step.dt
-    if from_temp.b.method == 'zero':
-        side = 5
-    else:
-        _side = mag_c[0].position
-        side = np.absolute(max(_side.min(), _side.max(), key=abs))
+    walls = Walls.from_config(from_temp)
+    events = []
 
     ## Mass and Charge are hard coded to be protons right now
     mass = proton.mass # kg
     charge = proton.q #coulumb
-
-    vAc = 1
+    q_m = charge / mass
+
+    ## Timestep rule; None for a fixed dt (see calcs.bob_dt)
+    rule = dt_rule(from_temp.step.dynamic, q_m)
+    ## The push (boris by default; see calcs.integrators)
+    push = get_integrator(from_temp.step.integrator)
+    ## Guiding centre mode (see calcs.guiding_centre); needs the B grid for the gradients.
+    gc_cfg = from_temp.step.guiding_centre
+    gc = None
+    if gc_cfg.on:
+        if b_interp is None:
+            print(f"guiding centre mode needs a gridded B field; running full orbit")
+        else:
+            gc = GuidingCentre(GCFields(b_interp), gc_cfg, charge, mass)
+    def e_at(p):
+        return EfieldX(p, from_temp, executor, e_interp, e_args)
 
     ## Time trackers
     ft = 0 # tracker for total simulation time
+    if timer is None:
+        timer = PhaseTimer()
     comp_start = t.time() # tracker for computational time
 
-    # Step 1: Create the AoS the process will work with
-    #     > These conditions are read from inp file, currently stored in df.
-    expand_length = (temp * from_temp.particle.count)
-    out = np.empty(((temp * from_temp.particle.count) + 1), dtype=particle) # Empty np.ndarray with enough room for all the simulation data, and initial conditions.
-
-    #temp = df["starting_pos"].to_numpy()[id] # Populate it with the initial conditions at index 0.
-    #temp1 = df["starting_vel"].to_numpy()[id] * 6
-    #df = from_temp['Particle_Df']
-    df = pd.read_csv(from_temp.path.particle, dtype=np.float64)
-    row = df.iloc[0]
-    starting_pos = [row["px"], row["py"], row["pz"]]
-    starting_pos = [float(item) for item in starting_pos]
-    starting_vel = [row['vx'], row['vy'], row['vz']]
-    starting_vel = [float(item) for item in starting_vel]
-    out[0] = particle(px = starting_pos[0], 
-                            py = starting_pos[1],
-                            pz = starting_pos[2],
-                            vx = starting_vel[0],
-                            vy = starting_vel[1],
-                            vz = starting_vel[2],
-                            bx = 0,
-                            by = 0,
-                            bz = 0,
-                            ex = 0,
-                            ey = 0,
-                            ez = 0,
-                            id = id,
-                            step = 0)
+    # Step 1: Create the SoA buffers the process will work with
+    #     > a pair sized from the memory budget in the output config: one is filled while the other is written.
+    rows = rows_from_budget(from_temp.output.buffer_mb / 2)
+    buffer = TrajectoryBuffer(rows)
+    #     > and the output policy that picks which of its steps are written (files.output_policy)
+    policy = OutputPolicy(from_temp.output)
 
-    # Step 2: do the actual boris logic
     num_points = int(from_temp.step.numsteps)
-    print(f"setup complete, beginning steps")
-    i = 1
-    for time in range(1, num_points + 1): # time: step number
-        #print(f"step {i}")
-        x = np.array([out[i - 1].px, out[i - 1].py, out[i - 1].pz])
-        v = np.array([out[i - 1].vx, out[i - 1].vy, out[i - 1].vz])
-        ##########################################################################
-        # COLLECT FIELDS
-            # submit the field calculations to the threadpool
-        _Ef = executor.submit(EfieldX, x, from_temp, executor, e_interp, e_args)
-        _Bf = executor.submit(Bfield, x, from_temp.b.method, mag_c, b_interp)
-            # collect the results
-        Ef = _Ef.result()
-        #print(Ef)
-        Bf = _Bf.result()
-            # update array entry with results
-        out[i - 1].bx, out[i - 1].by,out[i - 1].bz = Bf # update B field for particle we just found
-        out[i - 1].ex, out[i - 1].ey,out[i - 1].ez = Ef # update E field for particle we just found
-
-        ##########################################################################
-        # BORIS LOGIC
-            # define and run all the independently obtainable values w/ threads.
-        def _tt_and_ss_get():
-            tt = charge / mass * Bf * 0.5 * dt
-            ss = 2. * tt / (1. + tt * tt)
-            return tt, ss
-        def _v_minus_get():
-            return v + charge / (mass * vAc) * Ef * 0.5 * dt
-            # submit to executor
-        _tt_ss = executor.submit(_tt_and_ss_get)
-        _v_minus = executor.submit(_v_minus_get)
-            # get values from future
-        tt, ss = _tt_ss.result()
-        v_minus = _v_minus.result()
-
-            # The rest are entangled enough to rule out multithreading.
-        v_prime = v_minus + np.cross(v_minus, tt)
-        v_plus = v_minus + np.cross(v_prime, ss)
-        v = v_plus + charge / (mass) * Ef * 0.5 * dt
-
-        # Update particle information with the pos and vel
-        position = x + v * dt 
-        # velocity = v_plus + charge / (mass * vAc) * E * 0.5 * dt
-        out[i] = particle(px = position[0],
-                            py = position[1],
-                            pz = position[2],
-                            vx = v[0],
-                            vy = v[1],
-                            vz = v[2],
-                            bx = 0,
-                            by = 0,
-                            bz = 0,
-                            ex = 0,
-                            ey = 0,
-                            ez = 0,
-                            id = id,
-                            step = time)
-
-        ft += dt # total time spent simulating
-        
-        #TIME STEP SCALING
-        ##check ion gyrofrequency
-        """
-        we are aiming for 100 steps per gyration, so we find the
-        so we find the time it takes for 1 gyration at the particle's B and divide it by 100
-        """
-        #Bmag = np.linalg.norm(Bf)
-        #curr_gyrofreq = (charge * Bmag)/mass #rads/sec
-        #curr_time = 2 * np.pi / curr_gyrofreq
-    
-        #dt = curr_time/100
-        if from_temp.step.dynamic.on:
-            _dt = dt
-            dt = bob_dt_step(Bp=Bf,
-                             B0_mag=from_temp.step.dynamic.consts.B0.b_norm,
-                             dt0=from_temp.step.dynamic.consts.dt0,
-                             min=from_temp.step.dynamic.consts.dt_min,
-                             max=from_temp.step.dynamic.consts.dt_max)
-            print(f"dt changed to: {dt} from: {_dt}")
+    path = os.path.join(str(runtime_configs['Paths']['outputs']), from_temp.path.hdf5)
+    particle = 0 # the particle file's first particle, row 0 of the output's particle index
+    time = 0
+    ckpt = read_checkpoint(path) if from_temp.step.resume else None
+    if ckpt is not None:
+        #     > Resuming: continue from the output file's last checkpoint, appending to its datasets.
+        truncate_to_checkpoint(path, ckpt, rows=num_points + 1)
+        ckpt.restore_rng()
+        policy.restore_state(path, ckpt.step)
+        x, v, Bf, Ef = ckpt.x[0], ckpt.v[0], ckpt.b[0], ckpt.e[0]
+        time, ft, dt = ckpt.step, float(ckpt.t[0]), float(ckpt.dt[0])
+        print(f"resuming from step {time} of {num_points}")
+        if not ckpt.alive[0]:
+            print('particle already exited; nothing to resume')
+            time = num_points
+    else:
+        #     > Initial conditions are read from the particle file; only the first particle is pushed here.
+        df = pd.read_csv(from_temp.path.particle, dtype=np.float64)
+        row = df.iloc[particle]
+        x = np.array([row["px"], row["py"], row["pz"]], dtype=np.float64)
+        v = np.array([row['vx'], row['vy'], row['vz']], dtype=np.float64)
+            # fields at the starting position
+        Ef = EfieldX(x, from_temp, executor, e_interp, e_args)
+        Bf = Bfield(x, from_temp.b.method, mag_c, b_interp)
+        if rule is not None:
+            dt = adaptive_dt(Bf, *rule)
+        #     > row 0 of the output is the initial state, like the ensemble's; no step was taken to get there
+        buffer.append(x, v, Bf, Ef, ft, 0.)
+        #     > and the leapfrog starts half a step back (calcs.integrators)
+        v = initial_half_step(push, x, v, Ef, Bf, dt, q_m)
+    start = time
+    #     > the output file stays open on the writer thread for the rest of the run (files.async_writer);
+    #       in live mode, everything the flushes write to is made before it switches to SWMR
+    def prepare(f):
+        append_events(f, [], walls.names)
+        policy.prepare(f)
+        if gc is not None:
+            append_handoffs(f, [])
+        if '/checkpoint' not in f:
+            reserve_checkpoint(f, 1, from_temp)
+    live = from_temp.output.live
+    writer = AsyncWriter(path, TrajectoryBuffer(rows), threaded=from_temp.output.async_write, swmr=live,
+                         prepare=prepare, flush_seconds=from_temp.output.live_seconds if live else 0., timer=timer)
 
-        if time % 1000 == 0:
-            manager_queue.put(Manager_Data(step=time, do_stop=False))
-            print(f"boris calc * {time} for particle {id}")
-            print("total time: ", ft, dt, Ef, Bf)
-        """
-        Periodically add contents to the appropriate datasets in the h5 outputs file.
-        """
-        if time % temp == 0:
-            x = np.array([out[i].px, out[i].py, out[i].pz])
-            v = np.array([out[i].vx, out[i].vy, out[i].vz])
-            ##########################################################################
-            # COLLECT FIELDS
-            # submit the field calculations to the threadpool
-            _Ef = executor.submit(EfieldX, x, from_temp, executor, e_interp,
-                                  e_args)
-            _Bf = executor.submit(Bfield, x, from_temp.b.method, mag_c, b_interp)
-            # collect the results
-            Ef = _Ef.result()
-            Bf = _Bf.result()
-
-            # update array entry with results
-            out[i].bx, out[i].by, out[i].bz = Bf  # update B field for particle we just found
-            out[i].ex, out[i].ey, out[i].ez = Ef  # update E field for particle we just found
-            _out = write_to_hdf5(from_temp, out, temp, num_points)
-            #out[0] = out[time]
-            #out[1:] = None
-            i = 0  # reset the internal AoS index
-            out = _out
-            #print(out)
-
-        if np.absolute(max(x.min(), x.max(), key=abs)) > side:
-                out = out[out != np.array(None)]
-                print('Exited Boris Push Early')
+    # Step 2: do the actual boris logic
+    print(f"setup complete, beginning steps")
+    checkpoint = None
+    every = from_temp.output.checkpoint_steps
+    if time >= num_points:
+        pass
+    elif gc is None and use_compiled_kernel(from_temp, b_interp, e_interp):
+        print(f"using the compiled grid kernel")
+        kernel = GridKernel(b_interp, e_interp, q_m, walls, rule, from_temp.step.integrator)
+        time, checkpoint, buffer = compiled_push(from_temp, progress, kernel, walls, x, v, Bf, Ef, writer, buffer,
+                                                 num_points, time, ft, dt, policy, timer)
+        ft = float(checkpoint['sim_time'][0])
+    else:
+        alive = True
+        def checkpoint_state():
+            # in GC mode, checkpoint the particle rather than its guiding centre; resuming starts in full orbit.
+            px, pv = gc.particle(e_at) if gc is not None and gc.active else (x, v)
+            return dict(step=time, sim_time=ft, dt=dt, x=px, v=pv, b=Bf, e=Ef,
+                        alive=[alive], exit_step=[-1 if alive else time])
+
+        no_fields = np.zeros(3)
+        for time in range(start + 1, num_points + 1): # time: step number
+            x_prev = x
+            edge = False
+            timer.mark()
+            if gc is not None and gc.active:
+                ##########################################################################
+                # GUIDING CENTRE STEP
+                step_dt = dt * gc_cfg.dt_factor
+                eps, bmag = gc.step(step_dt, e_at)
+                ft += step_dt
+                if gc.adiabatic(eps, bmag, gc_cfg.eps_max):
+                    x, v = gc.X, gc.particle(e_at)[1]
+                else:
+                    # adiabaticity broke down (or a null/the grid edge is near): back to full orbit
+                    x, v = gc.leave(e_at, time, ft, eps, bmag)
+                # off the field grids: lost on the grid edge (calcs.walls), with no fields
+                edge = off_grid(x, b_interp, e_interp)[0]
+                if edge:
+                    Ef, Bf = no_fields, no_fields
+                else:
+                    Ef = e_at(x)
+                    # the same grid through GC's own lookup; the interpolator where that has no value
+                    Bf = gc.fields(x)[0]
+                    if not np.all(np.isfinite(Bf)):
+                        Bf = Bfield(x, from_temp.b.method, mag_c, b_interp)
+                timer.lap('gc_step')
+            else:
+                ##########################################################################
+                # BORIS LOGIC
+                x, v = push(x, v, Ef, Bf, dt, q_m)
+                timer.lap('push')
+
+                ##########################################################################
+                # COLLECT FIELDS (at the new position; these are also used by the next push)
+                #   > off the field grids there are none: the particle is lost on the grid edge (calcs.walls)
+                edge = off_grid(x, b_interp, e_interp)[0]
+                if edge:
+                    Ef, Bf = no_fields, no_fields
+                else:
+                    Ef = e_at(x)
+                    timer.lap('e_field')
+                    Bf = Bfield(x, from_temp.b.method, mag_c, b_interp)
+                    timer.lap('b_field')
+
+                step_dt = dt
+                ft += dt # total time spent simulating
+
+                if gc is not None and not edge:
+                    enter, eps, bmag = gc.should_enter(x, v, Bf, Ef)
+                    if enter:
+                        gc.enter(x, v, Bf, Ef, time, ft, eps)
+
+            # Update the buffer with the pos, vel, fields and the time/dt that got us here
+            timer.mark()
+            buffer.append(x, v, Bf, Ef, ft, step_dt)
+            timer.lap('buffer')
+
+            #TIME STEP SCALING
+            #   > 'bob' scales dt0 by B0/|B|; 'gyro' aims for steps_per_gyration steps per local gyration.
+            if rule is not None:
+                dt = adaptive_dt(Bf, *rule)
+
+            if time % 1000 == 0:
+                if progress is not None:
+                    progress.update(time, ft, buffer)
+                print(f"boris calc * {time} for particle {particle}")
+            timer.mark()
+            surface, point = walls.crossings(x_prev, x, edge)
+            timer.lap('walls')
+            if surface >= 0:
+                alive = False
+                events.append((particle, time, ft, *point, surface))
+
+            """
+            Periodically add contents to the appropriate datasets in the h5 outputs file.
+            """
+            if buffer.full or time % every == 0 or not alive or (time % 1000 == 0 and writer.due()):
+                buffer = write_to_hdf5(from_temp, writer, buffer, num_points, checkpoint_state(), gc, events, walls, policy)
+
+            if not alive:
+                    print(f'Exited Boris Push Early, on {walls.names[surface]}')
+                    break
+            if progress is not None and progress.stop_requested:
+                # stopped from the GUI (calcs.progress): end the run here; the final flush keeps what it has
+                print(f"Stopped at step {time}")
                 break
-        i += 1
+        if time > start:
+            checkpoint = checkpoint_state()
     comp_time = t.time() - comp_start
+    timer.add('run', comp_time)
     diags = {
-        "Particle id" : id,
+        "Particle id" : particle,
         "Computation Time" : comp_time,
-        "Simulation Time" : ft
+        "Simulation Time" : ft,
+        "Steps/sec" : (time - start) / comp_time if comp_time > 0 else float('inf'),
+        "Backend" : backend,
     }
-    if(i != 1):
-        write_to_hdf5(from_temp, out, expand_length, num_points)
+    print(f"{time - start} steps in {comp_time:.3f}s: {diags['Steps/sec']:.1f} steps/sec "
+          f"(B: {from_temp.b.method}, E: {from_temp.e.method}, backend: {backend})")
+    write_to_hdf5(from_temp, writer, buffer, num_points, checkpoint, gc, policy=policy, final=True)
+    writer.close()
+    # a resumed run adds to the times of the runs before it
+    write_timing(path, timer, merge=from_temp.step.resume)
+    print(f"time per phase:\n{timer.summary()}")
     #print(f"finished writing to file")
-    manager_queue.put(Manager_Data(step=num_points, do_stop=True))
-
+    if progress is not None: # None when run headless
+        progress.finish(time)
 
-from multiprocessing import Manager
-fromTemp = None
 
-def create_shared_info():
-    """
-    deprecated, as the shared info comes directly from the app by reference.
-    """
-    manager = Manager()
-    shared = manager.dict()
-
-    #shared.update(read_temp_file_dict(TEMPMANAGER_MANAGER.files[m1f1]))
-    return shared
-
-def init_process(data, n1, n2, t, t1, Bf, Ef, coils, _fromTemp, queue):
-    global df, num_parts, num_points, dt, sim_time, B_Method, E_Method, E_Args, c, c_cnr, fromTemp
-    global fromTemp, manager_queue
-    
-    fromTemp = _fromTemp
-    manager_queue = queue
-    
-    df = data
-    num_parts = n1
-    num_points = n2
-    dt = t
-    sim_time = t1
-    #sources = GetCurrentTrace(c, dia, res=100, nsteps=100)
-
-    B_Method = Bf
-
-    E_Method = list(Ef.keys())[0]
-    E_Args = Ef[E_Method]
-
-    # Magpy collection object with all the coils
-    c = coils
-
-    ## List of all the coil center coordinates.
-    ## Used in some E field implementations.
-    c_centers = np.array([s.position for s in c.children_all])
-    ## List of all the coil radii.
-    c_radii = np.array([s.diameter for s in c.children_all])
-    c_cnr = np.column_stack((c_centers, c_radii))
-
-
-    #print("data shared: ", data, n1, n2, t)
-"""
-Will eventually replace runsim(), development grounds for a new structure.    
-"""
-from grid._3d_mesh import precalculate_3d_grid
+from grid._3d_mesh import check_grid_dir, grid_axis
+from grid.superposition import CoilGridCache, Superposition
+from grid.symmetry import GridSymmetry, SymmetricGrid
 from EFieldFJW.ys_3d_disk import fields_from_grid
 from pathlib import Path
 from RETerry import bob_e
+from calcs.ensemble import ensemble_push
+from calcs.sharding import run_sharded
 
 def create_interpolator(filepath):
     with h5py.File(filepath, 'r') as f:
-        # get the linspace used in the grid
-        ax_linspace = f['src/coords'][0,:,0,0] # linspace used for x; should be same for all axes
+        # get the linspaces used in the grid (the same for all axes, unless the grid is symmetry reduced)
+        coords = f['src/coords']
+        axes = (coords[0,:,0,0], coords[1,0,:,0], coords[2,0,0,:])
         mesh_field = f['src/data']
         mesh_field = np.moveaxis(mesh_field, 0, -1)
-    interpolator = RegularGridInterpolator((ax_linspace, ax_linspace, ax_linspace), mesh_field, method='linear')
+        if 'symmetry' in f['src']:
+            return SymmetricGrid.from_arrays(axes, mesh_field, GridSymmetry.read(f['src/symmetry']),
+                                             int(f['src/symmetry'].attrs['res']))
+    interpolator = RegularGridInterpolator(axes, mesh_field, method='linear')
     return interpolator
 
+def coil_grids(cfg, path, field:str, res:int=100):
+    """
+    The gridded field of a FieldConfig as the sum of its coils' unit grids (grid.superposition), cached next to
+    its coil file (path); None for methods that aren't gridded.
+    """
+    match cfg.method:
+        case 'magpy':
+            evaluate, params = lambda points, coils: coils.to_collection().getB(points), None
+        case 'loop':
+            evaluate, params = lambda points, coils: CircleLoops(coils).getB(points), None
+        case 'annulus':
+            order = cfg.res
+            evaluate, params = lambda points, coils: AnnularCoils(coils, order).getB(points), order
+        case 'disk_e':
+            evaluate, params = lambda points, coils: fields_from_grid(points, None, None, coils), None
+        case 'bob_e':
+            evaluate, params = lambda points, coils: bob_e.bob_e_from_collection(points, None, coils), None
+        case _:
+            return None
+    coils = CoilGeometry.from_config(cfg)
+    # the cube of the grid files: +-1.5 times the first coil's largest coordinate
+    axis = grid_axis(np.max(np.abs(coils.centres[0])), res)
+    cache = CoilGridCache(check_grid_dir(Path(path)) / 'coils', field, cfg.method, axis, evaluate, params)
+    return Superposition(cache, coils)
+
 def grid_checker(fromTemp, filepath):
     """
     IF the simulation is called with gridding = 1 for a ring configuration, you need to make sure
-    that a grid lookup file exists.
+    that the coils' grids exist (grid.superposition), and sum them.
     """
     global is_logging_e
     # check b field
     b_interpolator = None
     e_interpolator = None
     try:
-        if fromTemp.b.gridding == 1 and fromTemp.b.method == "magpy":
-            collection = fromTemp.b.collection
-            method = collection.getB
-            precalculate_3d_grid(method, Path(fromTemp.path.b))
-
-            coil_path = Path(fromTemp.path.b)
-            # stuff with the interpolator
-            hdf5_name = coil_path.parents[0] / "grid" / f"{coil_path.name}.hdf5"
-            b_interpolator = create_interpolator(hdf5_name)
+        if fromTemp.b.gridding == 1 and fromTemp.b.method in ("magpy", "loop", "annulus"):
+            b_interpolator = coil_grids(fromTemp.b, fromTemp.path.b, 'b').interpolator()
     except KeyError:
         pass
 
     # check e field
     # TODO: extend functionality with e methods <3
     try:
-        if fromTemp.e.gridding == 1 and fromTemp.e.method == 'disk_e':
+        if fromTemp.e.gridding == 1 and fromTemp.e.method in ('disk_e', 'bob_e'):
             print('creating e grid')
-            method = fields_from_grid
-            collection = fromTemp.e.collection
-            inners = fromTemp.e.inner_r
-            args = {
-                'c' : collection,
-                'inners' : inners
-            }
-            coil_path = Path(fromTemp.path.e)
-            precalculate_3d_grid(method, coil_path, **args)
-
-            hdf5_name = coil_path.parents[0] / "grid" / f"{coil_path.name}.hdf5"
-            e_interpolator = create_interpolator(hdf5_name)
-
-        if fromTemp.e.gridding == 1 and fromTemp.e.method == 'bob_e':
-            method = bob_e.bob_e_from_collection
-            collection = fromTemp.e.collection
-            coil_path = Path(fromTemp.path.e)
-            precalculate_3d_grid(method, Path(fromTemp.path.e), collection=collection)
-
-            hdf5_name = coil_path.parents[0] / "grid" / f"{coil_path.name}.hdf5"
-            e_interpolator = create_interpolator(hdf5_name)
+            e_interpolator = coil_grids(fromTemp.e, fromTemp.path.e, 'e').interpolator()
 
         if fromTemp.e.method == 'washer_potential':
             # precompute the grid potential
@@ -583,15 +623,9 @@ def grid_checker(fromTemp, filepath):
             points = np.stack([_x.ravel(), _y.ravel(), _z.ravel()], axis=-1)
 
             # collect coil information
-            normals = []  # input n_coils amount of (3,) arrays
-            sigmas = []  # input n_coils amount of empty lists
-            for ring in e_c.children_all:
-                # we can get the coil's normal by rotating [0, 0, 1] by the coil's orientation.
-                default_z = np.array([0, 0, 1])
-                normals.append(ring.orientation.apply(default_z))
-
-                # append empty list per coil into sigmas
-                sigmas.append([])
+            coils = CoilGeometry.from_config(fromTemp.e)
+            normals = list(coils.normals)  # input n_coils amount of (3,) arrays
+            sigmas = [[] for _ in range(len(coils))]  # input n_coils amount of empty lists
 
             # LOG STUFF IF CALLED TO DO SO.
             #print(fromTemp.e.logging)
@@ -624,7 +658,7 @@ def grid_checker(fromTemp, filepath):
     print(f"finished making interpolators")
     return b_interpolator, e_interpolator
 
-def _runsim(manager_queue, params:AppConfig):
+def _runsim(progress:ProgressChannel, params:AppConfig):
     filepath = ""
     """
     This try/ except block exists to ensure that the tempfile created in some methods
@@ -635,40 +669,63 @@ def _runsim(manager_queue, params:AppConfig):
 
     # check/ create precomputed grid
     # value of these will be None if gridding not used.
-    b_inter, e_inter = grid_checker(_fromTemp, filepath)
-
-    with ThreadPoolExecutor() as executor:
-        borisPush(executor, _fromTemp, manager_queue, b_inter, e_inter)
-
-
-def runsim(fromGui:dict, manager_queue):
-    #print('simulation starting')
-    _fromTemp = create_shared_info()
-    dfIn = pd.DataFrame(_fromTemp['Particle_Df'])
-    numPa = dfIn.shape[0]
-    numPo = int(_fromTemp['numsteps'])
-    tScale = _fromTemp['dt']
-    time = numPo * tScale
-    Bf = _fromTemp["Field_Methods"]["B"]
-    Ef = _fromTemp["Field_Methods"]["E"]
-    coils = _fromTemp['coils']
-    coilName = _fromTemp['coil_file_name']
-
-    init_process(dfIn, numPa, numPo, tScale, time, Bf, Ef, coils, _fromTemp, manager_queue)
-    values = range(numPa)
-    with ProcessPoolExecutor(initializer=init_process, initargs=(dfIn, numPa, numPo, tScale, time, Bf, Ef, coils, _fromTemp, manager_queue)) as executor:
-        futures = executor.map(borisPush, values)
-
-    out = []
-    diags = []
-    for future, diag in futures:
-        out.append(future)
-        diags.append(diag)
-
-    ## Turn the list of dictionaries into a dataframe for ease of output.
-    diags = pd.DataFrame(diags)
-    ## Turn list of output data into an array for ease of access
-    out = np.asarray(out)
-
-    dir = CreateOutput(out, sim_time, num_points, num_parts, dfIn, Bf, Ef, coilName, diags)
-    #graph_trajectory(lim=side, data=dir)
+    timer = PhaseTimer() # the run's phases (calcs.timing)
+    with timer.phase('grid_build'):
+        b_inter, e_inter = grid_checker(_fromTemp, filepath)
+    run_with_fields(progress, _fromTemp, b_inter, e_inter, timer)
+
+def run_with_fields(progress:ProgressChannel, _fromTemp:AppConfig, b_inter=None, e_inter=None,
+                    timer:PhaseTimer=None):
+    """
+    The part of _runsim() after the grids are sorted out; sweeps (calcs.sweep) call this directly
+    with interpolators shared between runs.
+    timer: the run's PhaseTimer so far (calcs.timing)
+    """
+    if timer is None:
+        timer = PhaseTimer()
+    if not _fromTemp.output.profile:
+        _push(progress, _fromTemp, b_inter, e_inter, timer)
+        return
+    with SamplingProfiler(_fromTemp.output.profile_interval_ms) as profiler:
+        _push(progress, _fromTemp, b_inter, e_inter, timer)
+    profiler.write(os.path.join(str(runtime_configs['Paths']['outputs']), _fromTemp.path.hdf5))
+
+def _push(progress:ProgressChannel, _fromTemp:AppConfig, b_inter, e_inter, timer:PhaseTimer):
+    # more than one particle in the particle file: push them all together.
+    # workers != 1 splits them over that many processes (0 = every core).
+    if _fromTemp.particle.count is not None and _fromTemp.particle.count > 1:
+        if _fromTemp.particle.workers != 1:
+            run_sharded(_fromTemp, progress, b_inter, e_inter, _fromTemp.particle.workers, timer)
+        else:
+            ensemble_push(_fromTemp, progress, b_inter, e_inter, timer)
+        return
+
+    # interpolated fields never touch the executor, so don't pay for a pool.
+    backend = "serial" if e_inter is not None else pick_backend(_fromTemp.e)
+    with make_executor(backend) as executor:
+        borisPush(executor, _fromTemp, progress, b_inter, e_inter, backend, timer)
+
+def _runsim_child(progress:ProgressChannel, params:AppConfig, configs:dict):
+    # child processes start with an empty runtime config (like calcs.sharding's workers).
+    runtime_configs.read_dict(configs)
+    try:
+        _runsim(progress, params)
+    finally:
+        # a run that failed still has to let the progress window go
+        if not progress.read()['done']:
+            progress.finish()
+        progress.close()
+
+def start_runsim_process(progress:ProgressChannel, params:AppConfig):
+    """
+    Runs _runsim in a child process, for the GUI: the push no longer competes with Tk's mainloop for the GIL, and
+    can be stopped through progress (calcs.progress; the partly filled buffer is flushed, so the run is resumable).
+    The process is spawned rather than forked, as forking a process that runs Tk isn't safe.
+    returns the started multiprocessing.Process
+    """
+    configs = {section : dict(runtime_configs[section]) for section in runtime_configs.sections()}
+    # not a daemon: sharded runs and the field executors start processes of their own
+    process = multiprocessing.get_context('spawn').Process(target=_runsim_child, args=(progress, params, configs),
+                                                            name="boris push")
+    process.start()
+    return process
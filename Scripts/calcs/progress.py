@@ -0,0 +1,174 @@
+import copy
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+"""
+Progress of a running push, shared between the pusher and the GUI's progress window.
+
+This used to be a multiprocessing.Manager().Queue(): a server process started with the GUI, and every report
+(a Manager_Data every 1000 steps) was a pickled round trip to it that the progress window then drained.
+ProgressChannel is a small block of shared memory instead, which the pusher overwrites and the window reads
+when it likes; there is no server process and nothing queues up. It holds:
+    step, num_points: the step the run is at, out of how many
+    sim_time: simulated time at that step [s]
+    rate: steps/sec since the previous update
+    done: the pusher has finished (the old Manager_Data.do_stop)
+    stop: set by the GUI (request_stop) to ask the pusher to stop early
+    the last K positions of the first particle (a ring buffer), for the window's mini-trajectory
+
+The pusher calls update() where it used to put a Manager_Data, with its trajectory buffer: the rows written
+since the previous update go into the ring (rows flushed in between two updates are skipped), so recording
+the positions costs one small copy per 1000 steps.
+Updates are guarded by a sequence number (odd while an update is being written), so read() never returns a
+half-written state.
+
+# STOPPING
+The pushers check stop_requested after every step (between kernel chunks of at most 1000 steps for the compiled
+kernel) and leave their loop as if the run had ended there: the partly filled buffer is flushed with a
+checkpoint, so a stopped run keeps its data and can be resumed (headless.py --resume).
+
+The channel pickles by name, so it can be handed to child processes (which attach to the same memory, and
+share the parent's multiprocessing resource tracker); only the process that created it unlinks it (close()).
+"""
+HEADER_DT = np.dtype([('seq', np.int64), ('stop', np.int64), ('step', np.int64), ('num_points', np.int64),
+                      ('done', np.int64), ('count', np.int64), ('sim_time', np.float64), ('rate', np.float64)])
+
+# positions kept for the mini-trajectory
+RING_ROWS = 4096
+# copies read() makes while an update is being written before it settles for the last one
+READ_ATTEMPTS = 100
+
+class ProgressChannel:
+    def __init__(self, num_points:int=0, ring_rows:int=RING_ROWS, name:str=None):
+        """
+        Creates the shared memory (or attaches to the channel called name, see __setstate__).
+        num_points: steps the run will take
+        ring_rows: positions kept
+        """
+        self.ring_rows = ring_rows
+        self.owner = name is None
+        self.creator = os.getpid() if self.owner else None
+        size = HEADER_DT.itemsize + ring_rows * 3 * 8
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.header = np.ndarray((), dtype=HEADER_DT, buffer=self.shm.buf)
+        self.ring = np.ndarray((ring_rows, 3), dtype=np.float64, buffer=self.shm.buf, offset=HEADER_DT.itemsize)
+        # the stop flag as a plain memoryview: the pushers read it every step
+        at = HEADER_DT.fields['stop'][1]
+        self._stop = self.shm.buf[at:at + 8].cast('q')
+        self.reporting = True # False for a worker_view
+        if self.owner:
+            self.header[()] = np.zeros((), dtype=HEADER_DT)
+            self.header['num_points'] = num_points
+            self.ring[:] = np.nan
+        self._last = None # (step, wall time) of the previous update
+        self._rows = (None, 0) # (buffer, rows of it already in the ring)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def __getstate__(self):
+        return {'name' : self.shm.name, 'ring_rows' : self.ring_rows, 'reporting' : self.reporting}
+
+    def __setstate__(self, state):
+        self.__init__(ring_rows=state['ring_rows'], name=state['name'])
+        self.reporting = state['reporting']
+
+    def worker_view(self):
+        """
+        A copy for the worker processes of a run that reports for them (calcs.sharding): it sees stop requests,
+        and its updates are ignored.
+        """
+        view = copy.copy(self)
+        view.reporting = False
+        return view
+
+    #=== pusher side ===#
+    def update(self, step:int, sim_time:float=np.nan, buffer=None, done:bool=False):
+        """
+        Publishes the step the run is at.
+        buffer: the pusher's TrajectoryBuffer; its rows since the last update go into the ring
+        done: the run has finished
+        """
+        if not self.reporting:
+            return
+        now = time.perf_counter()
+        rate = np.nan
+        if self._last is not None and now > self._last[1]:
+            rate = (step - self._last[0]) / (now - self._last[1])
+        self._last = (step, now)
+
+        h = self.header
+        h['seq'] += 1 # odd: being written
+        h['step'] = step
+        h['sim_time'] = sim_time
+        if np.isfinite(rate):
+            h['rate'] = rate
+        if buffer is not None:
+            self._record(buffer)
+        h['done'] = int(done)
+        h['seq'] += 1
+
+    def _record(self, buffer):
+        old, seen = self._rows
+        start = seen if buffer is old and buffer.count >= seen else 0
+        x = buffer.x[start:buffer.count, 0][-self.ring_rows:]
+        self._rows = (buffer, buffer.count)
+        if len(x) == 0:
+            return
+        count = int(self.header['count'])
+        at = (count + np.arange(len(x))) % self.ring_rows
+        self.ring[at] = x
+        self.header['count'] = count + len(x)
+
+    def finish(self, step:int=None):
+        """
+        Marks the run as done (at step, or where it is).
+        """
+        self.update(int(self.header['step']) if step is None else step, float(self.header['sim_time']), done=True)
+
+    @property
+    def stop_requested(self) -> bool:
+        return self._stop[0] != 0
+
+    #=== GUI side ===#
+    def request_stop(self):
+        """
+        Asks the pusher to stop after its current step.
+        """
+        self._stop[0] = 1
+
+    def read(self) -> dict:
+        """
+        A consistent copy of the channel: the header fields, and 'positions', the recorded positions oldest first.
+        """
+        for attempt in range(READ_ATTEMPTS):
+            seq = int(self.header['seq'])
+            header = self.header.copy()
+            ring = self.ring.copy()
+            if seq % 2 == 0 and int(self.header['seq']) == seq:
+                break
+        count = int(header['count'])
+        if count > self.ring_rows:
+            ring = np.roll(ring, -(count % self.ring_rows), axis=0)
+        else:
+            ring = ring[:count]
+        state = {name : header[name].item() for name in HEADER_DT.names if name != 'seq'}
+        state['done'] = bool(state['done'])
+        state['stop'] = bool(state['stop'])
+        state['positions'] = ring
+        return state
+
+    def close(self):
+        """
+        Detaches from the shared memory, and frees it if this is the process that created it
+        (not a forked copy of it).
+        """
+        self.header = self.ring = None
+        self._stop.release()
+        self.shm.close()
+        if self.creator == os.getpid():
+            self.shm.unlink()
@@ -0,0 +1,199 @@
+##########################################################################
+# SHARDED ENSEMBLE RUNS                                                  #
+#     - Splits the particle list over worker processes                   #
+##########################################################################
+"""
+Replaces the old runsim()/init_process() ProcessPoolExecutor.map path, which never worked with AppConfig.
+
+The particle file is split into one shard per worker process. Every worker runs the ensemble pusher on its
+own shard and writes its own HDF5 file next to the run's data.hdf5 (data.shard<k>.hdf5), so the workers never
+contend for one file. When they are all done, the datasets in data.hdf5 are replaced with virtual datasets
+that stitch the shards together end to end.
+
+# OUTPUT LAYOUT
+Each shard has a block of rows per particle, like any ensemble output (see calcs.ensemble). data.hdf5 gets a
+'/src/shards' table with one row per shard:
+    row_start, row_count: where the shard's rows sit in the stitched datasets
+    particle_start, particle_count: which particles of the particle file it holds
+    step_start, step_count: where the shard's block of '/src/step' sits (decimated output only)
+'/src/exit_step' is stitched the same way, so it stays in particle file order. The shards' particle indexes are
+concatenated into '/src/particles', with each shard's offsets shifted by its row_start and each block's capacity
+cut to the rows up to the next block (the last particle of a shard was trimmed to its length, trim_to_filled).
+'/src/events' (calcs.walls) and '/src/reduced' (files.output_policy) are small and are copied in rather than
+stitched, with the particle column shifted to particle file order. '/src/step' (decimated output) is stitched
+shard after shard like the rest, as each shard decimates on its own particles
+(files.hdf5.output_file_structure.particle_steps).
+"""
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from calcs.ensemble import ensemble_push
+from calcs.progress import ProgressChannel
+from calcs.timing import PhaseTimer, write_timing
+from files.output_policy import append_rows
+from files.hdf5.output_file_structure import create_h5_output_file, storage_options
+from files.trajectory_buffer import rows_from_budget
+from files.checkpoint import write_config
+from settings.configs.funcs.config_reader import runtime_configs
+from system.state_dict_main import AppConfig
+
+# datasets that get stitched together from the shards
+SHARDED_DATASETS = ('/src/position', '/src/velocity', '/src/fields/b', '/src/fields/e', '/src/time', '/src/exit_step',
+                    '/src/step')
+# per-particle row tables that get copied in, with the particle column shifted to particle file order
+COPIED_DATASETS = ('/src/events', '/src/reduced')
+
+shard_table_dt = np.dtype([('row_start', np.int64), ('row_count', np.int64),
+                           ('particle_start', np.int64), ('particle_count', np.int64),
+                           ('step_start', np.int64), ('step_count', np.int64)])
+
+def shard_name(k:int) -> str:
+    return f"data.shard{k}.hdf5"
+
+def split_particles(df:pd.DataFrame, n_workers:int) -> list:
+    """
+    splits the particle dataframe into at most n_workers contiguous, non-empty chunks.
+    """
+    n_workers = max(1, min(n_workers, len(df)))
+    bounds = np.linspace(0, len(df), n_workers + 1).astype(int)
+    return [df.iloc[bounds[i]:bounds[i + 1]] for i in range(n_workers)]
+
+def _run_shard(params:AppConfig, k:int, shard:pd.DataFrame, out_dir:str, outputs_path:str, b_inter, e_inter,
+               progress:ProgressChannel=None):
+    """
+    Runs in a worker process: pushes one shard of particles into its own h5 file.
+    progress: a ProgressChannel.worker_view, so that stopping the run stops every shard
+    """
+    # worker processes start with an empty runtime config.
+    runtime_configs.read_dict({'Paths': {'outputs': outputs_path}})
+
+    params = copy.deepcopy(params)
+    params.path.particle = os.path.join(out_dir, f"particles.shard{k}.csv")
+    params.path.hdf5 = os.path.join(out_dir, shard_name(k))
+    params.particle.count = len(shard)
+    shard.to_csv(params.path.particle, index=False)
+
+    # resuming continues the shard's own checkpoint
+    if not (params.step.resume and os.path.exists(params.path.hdf5)):
+        create_h5_output_file(params.path.hdf5, params.step.numsteps + 1, len(shard),
+                              **storage_options(params.output, rows_from_budget(params.output.buffer_mb / 2, len(shard))))
+    try:
+        ensemble_push(params, progress, b_inter, e_inter)
+    finally:
+        if progress is not None:
+            progress.close()
+
+    os.remove(params.path.particle)
+    return k
+
+def stitch_shards(path, shard_paths:list, particle_counts:list):
+    """
+    Replaces the sharded datasets in the h5 file at path with virtual datasets over the shard files.
+    Shard files are referenced by name only, so the output folder can be moved as a whole.
+    """
+    table = np.zeros(len(shard_paths), dtype=shard_table_dt)
+    with h5py.File(path, 'a') as f:
+        for key in SHARDED_DATASETS:
+            with h5py.File(shard_paths[0], 'r') as s:
+                if key not in s: # only written by some runs (e.g. '/src/step', files.output_policy)
+                    continue
+            sources = []
+            for shard_path in shard_paths:
+                with h5py.File(shard_path, 'r') as s:
+                    sources.append((s[key].shape[0], s[key].dtype))
+            total = sum(n for n, _ in sources)
+            layout = h5py.VirtualLayout(shape=(total,), dtype=sources[0][1])
+
+            start = 0
+            for k, (shard_path, (n, dtype)) in enumerate(zip(shard_paths, sources)):
+                if n:
+                    layout[start:start + n] = h5py.VirtualSource(os.path.basename(shard_path), key, shape=(n,), dtype=dtype)
+                if key == '/src/position':
+                    table[k]['row_start'] = start
+                    table[k]['row_count'] = n
+                elif key == '/src/step':
+                    table[k]['step_start'] = start
+                    table[k]['step_count'] = n
+                start += n
+
+            if key in f:
+                del f[key]
+            f.create_virtual_dataset(key, layout)
+
+        table['particle_count'] = particle_counts
+        table['particle_start'] = np.concatenate(([0], np.cumsum(particle_counts)[:-1]))
+
+        for key in COPIED_DATASETS:
+            parts, attrs = [], {}
+            for shard_path, particle_start in zip(shard_paths, table['particle_start']):
+                with h5py.File(shard_path, 'r') as s:
+                    if key in s:
+                        rows = s[key][:]
+                        rows['particle'] += particle_start
+                        parts.append(rows)
+                        attrs = dict(s[key].attrs)
+            if key in f:
+                del f[key]
+            if parts:
+                append_rows(f, key, np.concatenate(parts), **attrs)
+        index = []
+        for shard_path, row_start in zip(shard_paths, table['row_start']):
+            with h5py.File(shard_path, 'r') as s:
+                rows = s['/src/particles'][:]
+                rows['offset'] += row_start
+                index.append(rows)
+        index = np.concatenate(index)
+        index['capacity'] = np.diff(np.append(index['offset'], f['/src/position'].shape[0]))
+        if '/src/particles' in f:
+            del f['/src/particles']
+        f.create_dataset('/src/particles', data=index)
+        if '/src/shards' in f:
+            del f['/src/shards']
+        f.create_dataset('/src/shards', data=table)
+        f['/src'].attrs['n_particles'] = int(sum(particle_counts))
+
+def run_sharded(params:AppConfig, progress:ProgressChannel=None, b_inter=None, e_inter=None, n_workers:int=None,
+                timer:PhaseTimer=None):
+    """
+    Pushes the particle file over n_workers processes (all cores if None or 0) and stitches the
+    results into params.path.hdf5.
+    timer: the run's timer (calcs.timing); the workers are timed as 'shards'
+    """
+    if timer is None:
+        timer = PhaseTimer()
+    n_workers = n_workers or os.cpu_count()
+    path = os.path.join(str(runtime_configs['Paths']['outputs']), params.path.hdf5)
+    out_dir = os.path.dirname(path)
+
+    df = pd.read_csv(params.path.particle, dtype=np.float64)
+    shards = split_particles(df, n_workers)
+    print(f"sharding {len(df)} particles over {len(shards)} worker processes")
+
+    num_points = int(params.step.numsteps)
+    view = progress.worker_view() if progress is not None else None
+    with timer.phase('shards'), ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        futures = [executor.submit(_run_shard, params, k, shard, out_dir,
+                                   str(runtime_configs['Paths']['outputs']), b_inter, e_inter, view)
+                   for k, shard in enumerate(shards)]
+        for done, future in enumerate(as_completed(futures), start=1):
+            k = future.result()
+            print(f"shard {k} finished ({done}/{len(shards)})")
+            if progress is not None and not progress.stop_requested:
+                progress.update(num_points * done // len(shards))
+
+    stitch_shards(path, [os.path.join(out_dir, shard_name(k)) for k in range(len(shards))],
+                  [len(shard) for shard in shards])
+    # each shard file has its own checkpoint; the stitched file only needs the config to be resumable.
+    with h5py.File(path, 'a') as f:
+        write_config(f, params)
+    write_timing(path, timer, merge=params.step.resume)
+
+    if progress is not None:
+        view.close()
+        # a stopped run ends where its last report was
+        progress.finish(None if progress.stop_requested else num_points)
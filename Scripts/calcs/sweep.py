@@ -0,0 +1,361 @@
+##########################################################################
+# PARAMETER SWEEPS                                                       #
+#     - Many AppConfig variants of one base run, over a worker pool      #
+##########################################################################
+"""
+Expands a sweep spec into AppConfig variants of a base AppConfig and runs them over a local process pool.
+
+# SWEEP SPEC
+A dict (read from json by headless.py --sweep):
+    {
+        "mode": "product",              # or "zip"; how the axes are combined
+        "axes": {
+            "b.current": [0.5, 1, 2],   # number: scales every B coil current; list: the current of each coil
+            "e.charge": [1, 2],         # same for the E coils' charges
+            "step.dt": [1e-9, 2e-9],
+            "particle.velocity": [0.5, 1, [1e5, 0, 0]],
+                                        # number: scales every particle's starting velocity; [vx, vy, vz]: sets it
+            "<any.AppConfig.field>": [...]  # anything else is set as-is (e.g. "step.numsteps", "b.gridding")
+        }
+    }
+
+# SHARED GRIDS
+Fields are linear in the coil currents/charges. The coil grids (grid.superposition) are kept per coil at unit
+current, so the parent only makes sure every coil of every variant has its unit grid on disk (computing the
+new ones), and each worker sums them with its variant's currents: a current sweep, uniform or coil by coil,
+builds its grids once. Other precomputed grids (washer_potential) are built once in the parent for each group
+of variants whose coils only differ by one common current (or charge) factor, handed to each worker process
+once, and scaled by the variant's factor there.
+
+# OUTPUT
+    <sweep folder>/inputs/<id>_*.csv       coil and particle files of each variant
+    <sweep folder>/variants/<id>/data.hdf5 each variant's usual output folder
+    <sweep folder>/sweep.hdf5              the index: a '/index' table with one row per variant
+                                           (its axis values, status, particles and how many exited),
+                                           and '/variants/<id>' external links to every variant's '/src'
+Variant ids are hashes of the variant's axis values, so re-running the same sweep into the same folder
+skips every variant that already finished.
+"""
+import copy
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import h5py
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from calcs.magpy4c1_01 import coil_grids, grid_checker, run_with_fields
+from events.events import Events
+from files.read_inputs import write_coil_file
+from files.hdf5.output_file_structure import n_particles, particle_index
+from grid.superposition import Superposition
+from grid.symmetry import SymmetricGrid
+from settings.configs.funcs.config_reader import runtime_configs
+from system.state_dict_main import AppConfig
+
+# status values of the index table
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+# attribute set on a variant's '/src' once its run completed
+COMPLETE_ATTR = "sweep_complete"
+
+#============#
+# EXPANSION  #
+#============#
+def expand_spec(spec:dict) -> list:
+    """
+    returns a list of dicts, each mapping axis name -> value for one variant.
+    """
+    axes = spec.get("axes", {})
+    names = list(axes)
+    mode = spec.get("mode", "product")
+    if mode == "product":
+        combos = itertools.product(*(axes[n] for n in names))
+    elif mode == "zip":
+        lengths = {len(axes[n]) for n in names}
+        if len(lengths) > 1:
+            raise ValueError(f"zip sweeps need axes of the same length, got {lengths}")
+        combos = zip(*(axes[n] for n in names))
+    else:
+        raise ValueError(f"unknown sweep mode '{mode}'")
+    return [dict(zip(names, combo)) for combo in combos]
+
+def variant_id(values:dict) -> str:
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode()).hexdigest()[:12]
+
+def _set_nested(obj, path:str, value):
+    *parents, last = path.split('.')
+    for p in parents:
+        if not hasattr(obj, p):
+            raise KeyError(f"AppConfig has no field '{path}'")
+        obj = getattr(obj, p)
+    if not hasattr(obj, last):
+        raise KeyError(f"AppConfig has no field '{path}'")
+    setattr(obj, last, value)
+
+def _set_strengths(collection, value):
+    """
+    number: scales every coil's current; list: one current per coil.
+    """
+    coils = collection.children_all
+    if np.ndim(value) == 0:
+        for c in coils:
+            c.current = c.current * float(value)
+    else:
+        if len(value) != len(coils):
+            raise ValueError(f"got {len(value)} currents for {len(coils)} coils")
+        for c, v in zip(coils, value):
+            c.current = float(v)
+
+def make_variant(base:AppConfig, values:dict, sweep_dir:str) -> AppConfig:
+    """
+    Deep copies the base config and applies one variant's axis values.
+    Every variant gets its own input files (so PRE_CALC can copy them) and output folder.
+    """
+    vid = variant_id(values)
+    params = copy.deepcopy(base)
+    df = params.particle.dataframe.copy()
+
+    for name, value in values.items():
+        match name:
+            case "b.current":
+                _set_strengths(params.b.collection, value)
+            case "e.charge":
+                _set_strengths(params.e.collection, value)
+            case "particle.velocity":
+                if np.ndim(value) == 0:
+                    df[['vx', 'vy', 'vz']] *= float(value)
+                else:
+                    df[['vx', 'vy', 'vz']] = np.broadcast_to(np.asarray(value, dtype=np.float64), (len(df), 3))
+            case _:
+                _set_nested(params, name, value)
+
+    inputs = os.path.join(sweep_dir, "inputs")
+    os.makedirs(inputs, exist_ok=True)
+    if params.b.method != "zero":
+        params.path.b = os.path.join(inputs, f"{vid}_b.csv")
+        write_coil_file(params.path.b, params.b.collection)
+    if params.e.method != "zero":
+        params.path.e = os.path.join(inputs, f"{vid}_e.csv")
+        write_coil_file(params.path.e, params.e.collection, getattr(params.e, 'inner_r', None), power="Q")
+    params.path.particle = os.path.join(inputs, f"{vid}_particles.csv")
+    df.to_csv(params.path.particle, index=False)
+    params.particle.dataframe = df
+    params.particle.count = len(df)
+    # the sweep already fills every core; don't nest process pools.
+    params.particle.workers = 1
+
+    params.path.output_absolute = os.path.join(sweep_dir, "variants")
+    params.path.output_name = vid
+    params.path.output = os.path.join(sweep_dir, "variants", vid)
+    params.path.hdf5 = os.path.join(params.path.output, 'data.hdf5')
+    return params
+
+def is_complete(params:AppConfig) -> bool:
+    try:
+        with h5py.File(params.path.hdf5, 'r') as f:
+            return bool(f['/src'].attrs.get(COMPLETE_ATTR, False))
+    except (OSError, KeyError):
+        return False
+
+#===============#
+# SHARED GRIDS  #
+#===============#
+def _strengths(collection) -> np.ndarray:
+    return np.array([c.current for c in collection.children_all], dtype=np.float64)
+
+def field_key(cfg, field:str):
+    """
+    Identifies a gridded field up to one overall current/charge factor.
+    returns (key, factor), or (None, 1) if the field isn't gridded.
+    """
+    gridded = cfg.gridding == 1 and cfg.method in ("magpy", "loop", "annulus", "disk_e", "bob_e")
+    if not gridded and not (field == 'e' and cfg.method == "washer_potential"):
+        return None, 1.
+
+    coils = cfg.collection.children_all
+    strengths = _strengths(cfg.collection)
+    ref = strengths[np.argmax(np.abs(strengths))] if len(strengths) and np.any(strengths) else 1.
+    geometry = [(tuple(np.round(c.position, 12)), tuple(np.round(c.orientation.as_quat(), 12)), round(c.diameter, 12))
+                for c in coils]
+    key = json.dumps([field, cfg.method, getattr(cfg, 'inner_r', None), geometry,
+                      np.round(strengths / ref, 12).tolist()])
+    return hashlib.sha1(key.encode()).hexdigest(), float(ref)
+
+def _as_arrays(interp):
+    """
+    what the workers get of a grid: (axes, values), or the SymmetricGrid itself (only its box is sent).
+    """
+    if interp is None or isinstance(interp, SymmetricGrid):
+        return interp
+    return interp.grid, interp.values
+
+def build_grids(variants:list) -> tuple:
+    """
+    Builds one grid per distinct (geometry, relative currents) over all variants; for coil grids, the unit
+    grids of their coils (once per coil geometry), summed in the workers.
+
+    returns (grids, refs, plan):
+        grids: key -> (axes, values) of the grid as built (or the SymmetricGrid, for symmetry reduced ones),
+               or the Superposition of the coils
+        refs: key -> the current/charge factor the grid was built at
+        plan: one (b_key, b_scale, e_key, e_scale) per variant
+    """
+    grids, refs, plan = {}, {}, []
+    for params in variants:
+        entry = []
+        for fld in ('b', 'e'):
+            key, factor = field_key(getattr(params, fld), fld)
+            if key is not None and key not in grids:
+                coils = coil_grids(getattr(params, fld), getattr(params.path, fld), fld)
+                if coils is not None:
+                    print(f"coil grids of shared {fld} grid {key[:8]} for variant {params.path.output_name}")
+                    coils.build()
+                    grids[key] = coils
+                else:
+                    print(f"building shared {fld} grid {key[:8]} for variant {params.path.output_name}")
+                    b_inter, e_inter = grid_checker(_only_field(params, fld), "")
+                    grids[key] = _as_arrays(b_inter if fld == 'b' else e_inter)
+                refs[key] = factor
+            entry += [key, factor / refs[key] if key is not None else 1.]
+        plan.append(tuple(entry))
+    return grids, refs, plan
+
+def _only_field(params:AppConfig, fld:str) -> AppConfig:
+    """
+    copy of params with the other field's gridding off, so grid_checker only builds the one asked for.
+    """
+    params = copy.copy(params)
+    other = 'e' if fld == 'b' else 'b'
+    off = copy.copy(getattr(params, other))
+    off.gridding = 0
+    if other == 'e' and off.method == "washer_potential":
+        off.method = "zero"
+    setattr(params, other, off)
+    return params
+
+#============#
+# WORKERS    #
+#============#
+_grids = {}
+
+def _init_worker(grids:dict, configs:dict):
+    global _grids
+    _grids = grids
+    runtime_configs.read_dict(configs)
+
+def _interpolator(key, scale):
+    if key is None or _grids.get(key) is None:
+        return None
+    if isinstance(_grids[key], Superposition):
+        return _grids[key].interpolator(scale)
+    if isinstance(_grids[key], SymmetricGrid):
+        return _grids[key].scaled(scale) if scale != 1 else _grids[key]
+    axes, values = _grids[key]
+    return RegularGridInterpolator(axes, values * scale if scale != 1 else values, method='linear')
+
+def _run_variant(params:AppConfig, b_key, b_scale, e_key, e_scale):
+    """
+    Runs in a worker process: PRE_CALC and the pusher for one variant, with the shared grids.
+    """
+    Events.PRE_CALC.value.invoke(params=params)
+    run_with_fields(None, params, _interpolator(b_key, b_scale), _interpolator(e_key, e_scale))
+    with h5py.File(params.path.hdf5, 'a') as f:
+        f['/src'].attrs[COMPLETE_ATTR] = True
+    return params.path.output_name
+
+#============#
+# INDEX FILE #
+#============#
+def _axis_column(values:list):
+    """
+    numeric axes become float columns; anything else (per-coil lists, vectors) is stored as its json.
+    """
+    if all(np.ndim(v) == 0 and isinstance(v, (int, float, np.number)) for v in values):
+        return np.asarray(values, dtype=np.float64)
+    return np.array([json.dumps(v) for v in values], dtype=h5py.string_dtype())
+
+def _summary(path):
+    """
+    (number of particles, number that were lost) of one variant's output, single particle or ensemble.
+    The losses come from the particle index; files from before it only have the ensemble's '/src/exit_step'.
+    """
+    try:
+        with h5py.File(path, 'r') as f:
+            n = n_particles(f)
+            index = particle_index(f)
+            if index is not None:
+                exit_step = index['exit_step']
+            else:
+                exit_step = f['/src/exit_step'][:] if '/src/exit_step' in f else None
+            exited = int(np.count_nonzero(exit_step >= 0)) if exit_step is not None else -1
+        return n, exited
+    except (OSError, KeyError):
+        return -1, -1
+
+def write_index(sweep_dir:str, spec:dict, points:list, variants:list, status:dict):
+    index_path = os.path.join(sweep_dir, "sweep.hdf5")
+    names = list(spec.get("axes", {}))
+    n = len(variants)
+
+    with h5py.File(index_path, 'w') as f:
+        f.attrs['spec'] = json.dumps(spec)
+        idx = f.create_group('index')
+        idx.create_dataset('id', data=np.array([p.path.output_name for p in variants], dtype=h5py.string_dtype()))
+        idx.create_dataset('status', data=np.array([status[p.path.output_name] for p in variants],
+                                                  dtype=h5py.string_dtype()))
+        for name in names:
+            idx.create_dataset(name, data=_axis_column([pt[name] for pt in points]))
+
+        summaries = [_summary(p.path.hdf5) for p in variants]
+        idx.create_dataset('n_particles', data=np.array([s[0] for s in summaries], dtype=np.int64))
+        idx.create_dataset('n_exited', data=np.array([s[1] for s in summaries], dtype=np.int64))
+
+        grp = f.create_group('variants')
+        for p in variants:
+            if status[p.path.output_name] != FAILED:
+                grp[p.path.output_name] = h5py.ExternalLink(os.path.relpath(p.path.hdf5, sweep_dir), '/src')
+        print(f"sweep index with {n} variants written to {index_path}")
+    return index_path
+
+#==========#
+# THE RUN  #
+#==========#
+def run_sweep(base:AppConfig, spec:dict, sweep_dir:str, n_workers:int=None):
+    """
+    Runs every variant of the spec that doesn't already have a finished output in sweep_dir.
+    returns the path of the sweep's index file.
+    """
+    n_workers = n_workers or os.cpu_count()
+    os.makedirs(sweep_dir, exist_ok=True)
+
+    points = expand_spec(spec)
+    variants = [make_variant(base, values, sweep_dir) for values in points]
+    status = {p.path.output_name: SKIPPED for p in variants}
+    todo = [i for i, p in enumerate(variants) if not is_complete(p)]
+    print(f"sweep: {len(variants)} variants, {len(variants) - len(todo)} already done")
+
+    if todo:
+        grids, _, plan = build_grids([variants[i] for i in todo])
+        configs = {s: dict(runtime_configs[s]) for s in runtime_configs.sections()}
+
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(todo)), initializer=_init_worker,
+                                 initargs=(grids, configs)) as executor:
+            futures = {executor.submit(_run_variant, variants[i], *plan[k]): variants[i].path.output_name
+                       for k, i in enumerate(todo)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                vid = futures[future]
+                try:
+                    future.result()
+                    status[vid] = DONE
+                except Exception as e:
+                    status[vid] = FAILED
+                    print(f"variant {vid} failed: {e!r}")
+                print(f"sweep: {done}/{len(todo)} variants finished")
+
+    return write_index(sweep_dir, spec, points, variants, status)
@@ -0,0 +1,219 @@
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import h5py
+import numpy as np
+
+"""
+Where a run spends its time, kept in the run's own output file.
+
+PhaseTimer is always on: the pushers time each phase of their loop with time.perf_counter() (mark()/lap())
+and add the durations up, which keeps a total, a count and a log2 histogram per phase (a few hundred ns per call, next to
+steps that take tens of microseconds in the python loops). The phases:
+    e_field, b_field: field evaluations at the new position (python loops)
+    push: the integrator step (python loops); gc_step: a guiding centre step, fields included
+    buffer: writing the step into the trajectory buffer
+    walls: the loss surface check
+    kernel: a chunk of steps in the compiled kernel (push, fields, buffer and walls together)
+    flush: handing a full buffer to the writer (waits while both buffers are still being written)
+    hdf5_write: the writer thread's jobs (files.async_writer)
+    grid_build: making the interpolators (calcs.magpy4c1_01.grid_checker)
+    run: the whole step loop, the computation time borisPush prints
+    shards: a sharded run's workers, as a whole (calcs.sharding); each shard file has the phases of its own push
+The PRE_CALC events (output folder, input copies, empty h5 file) are timed by events.events.Event.invoke.
+
+# IN THE FILE: /diag/timing
+    phases: PHASE_DT, one row per phase (total seconds, count, mean)
+    histogram: (phases, N_BINS) counts of the durations; bin i holds [bin_edges[i], bin_edges[i+1]) seconds
+    bin_edges: N_BINS + 1 powers of two, from 2^MIN_EXP s (~1 ns; shorter ones go in bin 0) to ~17 min
+    events: PHASE_DT rows of the PRE_CALC event handlers
+    profile: PROFILE_DT rows (collapsed call stack, samples), most sampled first; only with OutputConfig.profile
+A resumed run adds its times to the ones already in the file.
+
+# PROFILING
+With OutputConfig.profile, SamplingProfiler looks at the pushing thread's call stack every profile_interval_ms
+from a background thread and counts the stacks it sees; samples / total samples is then the share of the run
+spent in each stack. The stacks are 'outer;...;inner' function names, the input of flame graph tools
+(e.g. flamegraph.pl, speedscope). Code inside the compiled kernel shows up as the kernel's python caller.
+"""
+PHASE_DT = np.dtype([('phase', 'S32'), ('total', np.float64), ('count', np.int64), ('mean', np.float64)])
+PROFILE_DT = np.dtype([('stack', h5py.string_dtype()), ('samples', np.int64)])
+
+# log2 histogram bins: bin 0 is everything under 2^MIN_EXP seconds
+MIN_EXP = -30
+N_BINS = 40
+
+TIMING_GROUP = '/diag/timing'
+
+class PhaseTimer:
+    def __init__(self):
+        self.total = {}
+        self.count = {}
+        self.hist = {}
+        self._mark = time.perf_counter()
+
+    def add(self, phase:str, seconds:float):
+        """
+        adds one duration of phase.
+        """
+        if phase not in self.total:
+            self.total[phase] = 0.
+            self.count[phase] = 0
+            self.hist[phase] = [0] * N_BINS
+        self.total[phase] += seconds
+        self.count[phase] += 1
+        # frexp: seconds = m 2^e with 0.5 <= m < 1, so seconds is in [2^(e-1), 2^e)
+        i = math.frexp(seconds)[1] - 1 - MIN_EXP if seconds > 0 else 0
+        self.hist[phase][min(max(i, 0), N_BINS - 1)] += 1
+
+    def mark(self):
+        """
+        starts the clock for the next lap().
+        """
+        self._mark = time.perf_counter()
+
+    def lap(self, phase:str):
+        """
+        adds the time since the last mark()/lap() to phase and restarts the clock: a loop calls mark() at the top
+        and lap() after each of its phases.
+        """
+        now = time.perf_counter()
+        self.add(phase, now - self._mark)
+        self._mark = now
+
+    @contextmanager
+    def phase(self, phase:str):
+        """
+        times the with block as one duration of phase (for the coarse phases).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def merge(self, other:'PhaseTimer') -> 'PhaseTimer':
+        """
+        adds the phases of other to these (e.g. a resumed run's, or a shard's). returns self.
+        """
+        for phase in other.total:
+            if phase not in self.total:
+                self.total[phase], self.count[phase], self.hist[phase] = 0., 0, [0] * N_BINS
+            self.total[phase] += other.total[phase]
+            self.count[phase] += other.count[phase]
+            self.hist[phase] = [a + b for a, b in zip(self.hist[phase], other.hist[phase])]
+        return self
+
+    def table(self) -> np.ndarray:
+        rows = np.zeros(len(self.total), dtype=PHASE_DT)
+        for i, phase in enumerate(self.total):
+            rows[i] = (phase.encode(), self.total[phase], self.count[phase],
+                       self.total[phase] / self.count[phase] if self.count[phase] else 0.)
+        return rows
+
+    def summary(self) -> str:
+        """
+        the phases, slowest first, as text.
+        """
+        rows = np.sort(self.table(), order='total')[::-1]
+        return "\n".join(f"    {r['phase'].decode():<12}{r['total']:>10.3f} s"
+                         f"{r['count']:>10} x {r['mean'] * 1e6:>10.2f} us" for r in rows)
+
+def bin_edges() -> np.ndarray:
+    return 2. ** np.arange(MIN_EXP, MIN_EXP + N_BINS + 1)
+
+def _replace(grp:h5py.Group, name:str, data):
+    if name in grp:
+        del grp[name]
+    grp.create_dataset(name, data=data)
+
+def write_timing(path, timer:PhaseTimer, merge:bool=False):
+    """
+    Writes the timer into /diag/timing of the (closed) h5 file at path.
+    merge: add it to the phases already there (a resumed run) instead of replacing them
+    """
+    if merge:
+        timer = read_timing(path).merge(timer)
+    with h5py.File(path, 'a') as f:
+        grp = f.require_group(TIMING_GROUP)
+        _replace(grp, 'phases', timer.table())
+        _replace(grp, 'histogram', np.array([timer.hist[phase] for phase in timer.total],
+                                            dtype=np.int64).reshape(-1, N_BINS))
+        _replace(grp, 'bin_edges', bin_edges())
+
+def write_event_timing(path, timings:list):
+    """
+    Writes [(handler name, seconds)] of the PRE_CALC event into /diag/timing/events of the h5 file at path.
+    """
+    rows = np.zeros(len(timings), dtype=PHASE_DT)
+    for i, (name, seconds) in enumerate(timings):
+        rows[i] = (name.encode()[:32], seconds, 1, seconds)
+    with h5py.File(path, 'a') as f:
+        _replace(f.require_group(TIMING_GROUP), 'events', rows)
+
+def read_timing(path) -> PhaseTimer:
+    """
+    The phases in the h5 file at path as a PhaseTimer (an empty one if it has none).
+    """
+    timer = PhaseTimer()
+    with h5py.File(path, 'r') as f:
+        if TIMING_GROUP + '/phases' not in f:
+            return timer
+        for row, counts in zip(f[TIMING_GROUP + '/phases'][:], f[TIMING_GROUP + '/histogram'][:]):
+            phase = row['phase'].decode()
+            timer.total[phase] = float(row['total'])
+            timer.count[phase] = int(row['count'])
+            timer.hist[phase] = [int(c) for c in counts]
+    return timer
+
+#=================#
+# PROFILER        #
+#=================#
+class SamplingProfiler:
+    def __init__(self, interval_ms:float=5., thread:threading.Thread=None):
+        """
+        interval_ms: time between samples
+        thread: the thread to sample (the calling one by default)
+        """
+        self.interval = interval_ms / 1e3
+        self.target = (thread or threading.current_thread()).ident
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling profiler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        """
+        Writes the samples into /diag/timing/profile of the (closed) h5 file at path.
+        """
+        rows = np.array(self.stacks.most_common(), dtype=object).reshape(-1, 2)
+        table = np.zeros(len(rows), dtype=PROFILE_DT)
+        table['stack'] = rows[:, 0]
+        table['samples'] = rows[:, 1].astype(np.int64)
+        with h5py.File(path, 'a') as f:
+            grp = f.require_group(TIMING_GROUP)
+            _replace(grp, 'profile', table)
+            grp['profile'].attrs['interval_ms'] = self.interval * 1e3
@@ -0,0 +1,197 @@
+from dataclasses import dataclass, field
+
+import h5py
+import numpy as np
+
+from files.hdf5.output_file_structure import set_exits
+from calcs.coil_geometry import CoilGeometry
+
+"""
+Loss/wall-crossing detection for the pushers.
+
+The old exit test only compared the particle's largest coordinate with the position of the first coil,
+so particles flew straight through coil bodies and washers. Walls holds every surface a particle can be
+lost on, as flat arrays so that a whole ensemble is checked in one vectorized call per step:
+    - the bounding box (half-width) or sphere (radius); WallConfig.bound_size, defaulting to the old 'side' rule
+    - one annulus per B coil: the coil plane, radii R -/+ WallConfig.coil_width / 2 around the coil radius
+      (for the 'annulus' B method, the winding itself: inner_r to the outer radius, widened the same way)
+    - one annulus per washer of a WasherFieldConfig E field: the washer plane, radii inner_r to the outer radius
+Annuli are tested by segment crossing between the positions before and after the step, so fast particles
+can't step over them.
+
+# SURFACE IDS
+0: the bounding box/sphere, 1: the edge of the field grids, 2...: the annuli in the order of Walls.names.
+A particle that leaves a gridded field (off_grid) is lost on the grid edge unless it hit something else on the
+way; both the compiled kernel and the numpy pushers give it zero fields for that last row, as there are none.
+
+# EVENTS
+Every loss is one row of EVENT_DT in '/src/events' (particle, step, t, x, y, z, surface), where x, y, z is
+the point the surface was hit (the first point outside for the bound and the grid edge).
+The dataset's 'surfaces' attribute holds the surface names, indexed by the surface column.
+"""
+SURFACE_BOUND = 0
+SURFACE_GRID = 1
+
+EVENT_DT = np.dtype([('particle', np.int64), ('step', np.int64), ('t', np.float64),
+                     ('x', np.float64), ('y', np.float64), ('z', np.float64), ('surface', np.int32)])
+
+@dataclass
+class Walls:
+    """
+    names: one per surface id
+    centres, normals: (S, 3) centre and unit normal of each annulus
+    r_in, r_out: (S,) radii of each annulus
+    bound: 'box' or 'sphere'
+    size: half-width of the box or radius of the sphere
+    offsets: (S,) centre . normal of each annulus, i.e. its plane is x . normal = offset (derived)
+    """
+    names : list
+    centres : np.ndarray
+    normals : np.ndarray
+    r_in : np.ndarray
+    r_out : np.ndarray
+    bound : str
+    size : float
+    offsets : np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.offsets = np.einsum('sk,sk->s', self.centres, self.normals)
+
+    @classmethod
+    def from_config(cls, from_temp):
+        cfg = from_temp.walls
+        names = [f"bound {cfg.bound}", "grid edge"]
+        centres, normals, r_in, r_out = [], [], [], []
+
+        def add(name, coils, k, lo, hi):
+            names.append(name)
+            centres.append(coils.centres[k])
+            normals.append(coils.normals[k])
+            r_in.append(max(lo, 0.))
+            r_out.append(hi)
+
+        if cfg.coils and from_temp.b.method != 'zero':
+            coils = CoilGeometry.from_config(from_temp.b)
+            inner = coils.inner_radii if from_temp.b.method == 'annulus' else coils.radii
+            for k, r in enumerate(coils.radii):
+                add(f"coil {k}", coils, k, inner[k] - cfg.coil_width / 2, r + cfg.coil_width / 2)
+
+        inner_r = getattr(from_temp.e, 'inner_r', None)
+        if cfg.washers and inner_r and from_temp.e.method != 'zero':
+            coils = CoilGeometry.from_config(from_temp.e)
+            for k in range(min(len(coils), len(inner_r))):
+                add(f"washer {k}", coils, k, float(coils.inner_radii[k]), coils.radii[k])
+
+        size = cfg.bound_size if cfg.bound_size is not None else default_side(from_temp)
+        return cls(names=names,
+                   centres=np.array(centres, dtype=np.float64).reshape(-1, 3),
+                   normals=np.array(normals, dtype=np.float64).reshape(-1, 3),
+                   r_in=np.array(r_in, dtype=np.float64),
+                   r_out=np.array(r_out, dtype=np.float64),
+                   bound=cfg.bound, size=float(size))
+
+    @classmethod
+    def box(cls, size):
+        """
+        just a bounding box, no annuli.
+        """
+        return cls(names=["bound box", "grid edge"], centres=np.zeros((0, 3)), normals=np.zeros((0, 3)),
+                   r_in=np.zeros(0), r_out=np.zeros(0), bound='box', size=float(size))
+
+    def crossings(self, x0, x1, edge=None):
+        """
+        Which surface (if any) each particle hit on its way from x0 to x1.
+        x0, x1: (N, 3) or (3,)
+        edge: (N,) or bool, x1 is off the field grids (off_grid); the grid edge if nothing else was hit
+
+        returns (surface id (N,) or int, -1 where nothing was hit; hit point (N, 3) or (3,))
+        """
+        single = np.ndim(x1) == 1
+        if single:
+            # one particle (borisPush, every step): nearly every step crosses no annulus plane and stays inside
+            # the bound, which the plane distances alone tell; only a step that crosses a plane needs the radii.
+            x0, x1 = np.asarray(x0, dtype=np.float64), np.asarray(x1, dtype=np.float64)
+            if ((self.normals @ x0 - self.offsets) * (self.normals @ x1 - self.offsets) > 0).all():
+                if self.outside(x1):
+                    return SURFACE_BOUND, x1.copy()
+                if edge is not None and np.any(edge):
+                    return SURFACE_GRID, x1.copy()
+                return -1, x1
+        x0 = np.asarray(x0, dtype=np.float64).reshape(-1, 3)
+        x1 = np.asarray(x1, dtype=np.float64).reshape(-1, 3)
+        n = x1.shape[0]
+        surface = np.full(n, -1, dtype=np.int32)
+        point = x1.copy()
+
+        if len(self.r_in):
+            # signed distances of both ends from every annulus plane, (N, S)
+            d0 = x0 @ self.normals.T - self.offsets
+            d1 = x1 @ self.normals.T - self.offsets
+            cross = (d0 * d1 <= 0) & (d0 != d1)
+            frac = np.where(cross, d0 / np.where(cross, d0 - d1, 1.), np.inf)
+            p = x0[:, None, :] + np.where(cross, frac, 0.)[..., None] * (x1 - x0)[:, None, :] # (N, S, 3)
+            rel = p - self.centres[None]
+            radial = np.linalg.norm(rel - np.einsum('nsk,sk->ns', rel, self.normals)[..., None] * self.normals[None], axis=-1)
+            hit = cross & (radial >= self.r_in) & (radial <= self.r_out)
+
+            # first surface along the step
+            frac = np.where(hit, frac, np.inf)
+            first = np.argmin(frac, axis=1)
+            any_hit = np.isfinite(frac[np.arange(n), first])
+            surface[any_hit] = first[any_hit] + 2
+            point[any_hit] = p[any_hit, first[any_hit]]
+
+        out = self.outside(x1) & (surface < 0)
+        surface[out] = SURFACE_BOUND
+        if edge is not None:
+            surface[np.reshape(edge, -1) & (surface < 0)] = SURFACE_GRID
+        if single:
+            return int(surface[0]), point[0]
+        return surface, point
+
+    def outside(self, x):
+        if self.bound == 'sphere':
+            return np.linalg.norm(x, axis=-1) > self.size
+        return np.max(np.abs(x), axis=-1) > self.size
+
+def off_grid(x, *interps):
+    """
+    Which points are off the grid of any of the gridded fields (the grid edge); None interpolators have no grid.
+    x: (N, 3) or (3,)
+
+    returns (N,) mask; NaN points are off too
+    """
+    x = np.asarray(x, dtype=np.float64).reshape(-1, 3)
+    off = np.zeros(x.shape[0], dtype=bool)
+    for interp in interps:
+        if interp is None:
+            continue
+        for k, ax in enumerate(interp.grid):
+            off |= ~((x[:, k] >= ax[0]) & (x[:, k] <= ax[-1]))
+    return off
+
+def default_side(from_temp):
+    """
+    The old exit rule: a box as wide as the first B coil is far from the origin.
+    """
+    if from_temp.b.method == 'zero':
+        return 5
+    _side = from_temp.b.collection[0].position
+    return np.absolute(max(_side.min(), _side.max(), key=abs))
+
+def append_events(f:h5py.File, rows, names:list):
+    """
+    Appends event rows (a list of tuples or an EVENT_DT array) to '/src/events' of an open output file,
+    and marks the particles as lost in its particle index. With no rows it only creates the dataset.
+    """
+    if '/src/events' not in f:
+        f.create_dataset('/src/events', (0,), chunks=True, maxshape=(None,), dtype=EVENT_DT)
+        f['/src/events'].attrs['surfaces'] = list(names)
+    if len(rows) == 0:
+        return
+    rows = np.asarray(rows, dtype=EVENT_DT) if not isinstance(rows, np.ndarray) else rows
+    ds = f['/src/events']
+    old = ds.shape[0]
+    ds.resize(old + len(rows), axis=0)
+    ds[old:] = rows
+    set_exits(f, rows['particle'], rows['step'], rows['surface'])
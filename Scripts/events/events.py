@@ -1,15 +1,18 @@
 from enum import Enum
 from functools import partial
+import os
+import time
 
 from events.funcs import before_simulation_bob_dt, copy_diags_to_output_subdir, initialize_tempfile_dict
 from files.checks import folder_checks, ini_checks
 from system.temp_manager import TEMPMANAGER_MANAGER
 import system.temp_file_names as names
 
-from settings.configs.funcs.config_reader import read_configs
+from settings.configs.funcs.config_reader import read_configs, runtime_configs
 from settings.configs.funcs.configs import create_default_config
 
 from files.create import get_output_subdir, create_output_file
+from calcs.timing import write_event_timing
 
 """
 Definitions for all the different GUI user events (that exist at a higher level than tkinter's widgets)
@@ -22,14 +25,27 @@ Basically a list containing callables with a function to call them.
 class Event():
     def __init__(self, callables:list):
         self.callables = callables
+        self.timings = [] # (name, seconds) of each callable in the last invoke
         #print(self.callables)
     
     """
     runs all the callables that the object is responsible for.
     """
     def invoke(self, *args, **kwargs):
+        self.timings = []
         for c in self.callables:
+            start = time.perf_counter()
             c(*args, **kwargs)
+            name = getattr(c, '__name__', None) or getattr(getattr(c, 'func', None), '__name__', repr(c))
+            self.timings.append((name, time.perf_counter() - start))
+
+def record_pre_calc_timing(params, **kwargs):
+    """
+    last of the PRE_CALC callables: keeps how long the others took in the new output file (calcs.timing).
+    """
+    path = os.path.join(str(runtime_configs['Paths']['outputs']), params.path.hdf5)
+    if os.path.exists(path):
+        write_event_timing(path, Events.PRE_CALC.value.timings)
 
 def _whatis_file():
     print(f"events._whatis_file()")
@@ -73,6 +89,7 @@ class Events(Enum):
                       get_output_subdir, # creates subdirs according to path keys
                       copy_diags_to_output_subdir, # copy diagnostic files to them
                       create_output_file, # creates the default h5 file
+                      record_pre_calc_timing, # how long the above took, into the h5 file
                       ])
 
     # after a sim finishes
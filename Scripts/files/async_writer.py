@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+
+import h5py
+
+from files.trajectory_buffer import TrajectoryBuffer
+
+"""
+Background writer for the pushers' output file.
+
+Flushing used to happen inside the push loop: reopen the file, append, write the checkpoint, close, and only
+then carry on pushing. AsyncWriter instead keeps the file open for the whole run on a writer thread and takes
+write jobs through a bounded queue. The pusher fills one trajectory buffer while the other one is being
+written (double buffering):
+
+    buffer = writer.submit(job, buffer)   # hands the full buffer over, returns an empty one
+
+A job is a function job(f) of the open h5py.File. It runs on the writer thread, so it must only use copies of
+state the pusher keeps changing (see calcs.magpy4c1_01.write_to_hdf5). The buffer is reset and handed back to
+the pusher once its job is done.
+
+h5py holds the GIL while it writes, so the overlap comes from the compiled kernel (calcs.jit_kernel, which
+releases the GIL) and numpy; the python loop pusher gains less.
+Errors in a job are raised in the pusher by the next submit()/close().
+
+With threaded=False the jobs run inline in submit() (same file handling, no thread), e.g. for debugging.
+
+# LIVE (SWMR) MODE
+With swmr=True the file is put in HDF5 single-writer/multiple-reader mode once it is open, so the plotting tab
+can read the rows of every flush while the run goes on (files.hdf5.tail). Objects shouldn't be created or deleted
+in that mode, so prepare(f) runs first to create everything the jobs will write to (see the pushers), and
+the jobs write their checkpoint in place (files.checkpoint). due() tells the pusher when the buffer should be
+flushed early so that readers keep up (every flush_seconds).
+"""
+class AsyncWriter:
+    def __init__(self, path, spare:TrajectoryBuffer=None, depth:int=2, threaded:bool=True, swmr:bool=False,
+                 prepare=None, flush_seconds:float=0., timer=None):
+        """
+        path: the output h5 file (created already)
+        spare: the second buffer of the double buffer; None to hand the same buffer back (after its job is done)
+        depth: jobs that can wait in the queue before submit() blocks
+        swmr: live mode, see above; prepare: job run on the file before it switches to it
+        flush_seconds: > 0 makes due() True once this long has passed since the last submit()
+        timer: a calcs.timing.PhaseTimer; each job (with its flush) is timed as 'hdf5_write'
+        """
+        self.path = path
+        self.threaded = threaded
+        self.swmr = swmr
+        self.prepare = prepare
+        self.flush_seconds = flush_seconds
+        self.timer = timer
+        self.last = time.monotonic()
+        self.error = None
+        self.free = queue.Queue()
+        if spare is not None:
+            self.free.put(spare)
+        if threaded:
+            self.jobs = queue.Queue(maxsize=depth)
+            self.thread = threading.Thread(target=self._run, name="h5 writer", daemon=True)
+            self.thread.start()
+        else:
+            self.f = self._open()
+
+    def _open(self):
+        f = h5py.File(self.path, 'a', libver='latest')
+        if self.swmr:
+            if self.prepare is not None:
+                self.prepare(f)
+            f.swmr_mode = True
+        return f
+
+    def due(self) -> bool:
+        """
+        whether the buffer should be flushed now for live readers, full or not.
+        """
+        return self.flush_seconds > 0 and time.monotonic() - self.last >= self.flush_seconds
+
+    def _run(self):
+        try:
+            f = self._open()
+        except BaseException as err:
+            # the jobs are skipped (their buffers still handed back); the next submit() raises this
+            self.error, f = err, None
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            self._do(f, *job)
+        if f is not None:
+            f.close()
+
+    def _do(self, f, job, buffer):
+        try:
+            if self.error is None:
+                start = time.perf_counter()
+                job(f)
+                f.flush()
+                if self.timer is not None:
+                    self.timer.add('hdf5_write', time.perf_counter() - start)
+        except BaseException as err:
+            self.error = err
+        finally:
+            if buffer is not None:
+                buffer.reset()
+                self.free.put(buffer)
+
+    def _raise(self):
+        if self.error is not None:
+            err, self.error = self.error, None
+            raise RuntimeError("writing the output file failed") from err
+
+    def submit(self, job, buffer:TrajectoryBuffer=None) -> TrajectoryBuffer:
+        """
+        Queues job(f) with the buffer it writes (None for jobs without one).
+        returns the buffer to keep filling: the other buffer of the pair, or this one once it is written.
+        """
+        self._raise()
+        self.last = time.monotonic()
+        if not self.threaded:
+            self._do(self.f, job, buffer)
+            self._raise()
+            return self.free.get_nowait() if buffer is not None else None
+        self.jobs.put((job, buffer))
+        if buffer is None:
+            return None
+        return self.free.get()
+
+    def close(self):
+        """
+        Waits for the queued jobs and closes the file.
+        """
+        if self.threaded:
+            self.jobs.put(None)
+            self.thread.join()
+        else:
+            self.f.close()
+        self._raise()
@@ -0,0 +1,171 @@
+import pickle
+from dataclasses import dataclass
+
+import h5py
+import numpy as np
+
+from files.output_policy import truncate_policy_rows
+from files.hdf5.output_file_structure import SRC_DATASETS, filled_rows, set_filled_rows, set_exits, grow_capacity
+
+"""
+Checkpoints: enough of a run's state, kept in its own output h5 file, to continue it later.
+
+Every time the pusher flushes its buffer, it also overwrites the '/checkpoint' group of the output file with
+the state at the last flushed step. Whatever is in '/src' is therefore always consistent with the checkpoint;
+a run that is killed only loses the steps since the last flush (see OutputConfig.checkpoint_steps).
+
+# LAYOUT
+/checkpoint
+    x, v, b, e: (N, 3) position, velocity and fields of each particle at the checkpointed step
+    alive, exit_step: (N,) which particles are still inside the box / when they left (-1 = never)
+    t, dt: (N,) simulated time of each particle [s] and the timestep it will take next
+           (these differ between particles, and from DtNpConfig.dt, with dynamic dt on)
+    length: (N,) rows of each particle in the /src datasets at that step (the particle index's length)
+    attrs:
+        step: the step number of the state (-1: no state yet, see reserve_checkpoint)
+        rows: rows of the /src datasets up to the last filled one at that step
+        rng: pickled numpy global RNG state
+    output_policy: streaming state of a decimated/reduced output (files.output_policy), if any
+/config
+    the pickled AppConfig of the run (opaque bytes), so a run can be resumed from the h5 file alone (see read_config).
+    A dataset rather than an attribute: attributes are capped at 64kB and the config holds the particle dataframe.
+"""
+
+@dataclass
+class Checkpoint:
+    step : int
+    rows : int
+    x : np.ndarray
+    v : np.ndarray
+    b : np.ndarray
+    e : np.ndarray
+    alive : np.ndarray
+    exit_step : np.ndarray
+    t : np.ndarray
+    dt : np.ndarray
+    rng : tuple = None
+    length : np.ndarray = None
+
+    def restore_rng(self):
+        if self.rng is not None:
+            np.random.set_state(self.rng)
+
+def write_checkpoint(f:h5py.File, step:int, sim_time:float, dt:float, x, v, b, e, alive=None, exit_step=None, config=None,
+                     rng=None):
+    """
+    Overwrites the checkpoint group of an open output file. x, v, b, e are (3,) or (N, 3);
+    sim_time and dt are scalars or (N,).
+    rng: numpy global RNG state to save (np.random.get_state()); None takes it now.
+    """
+    x = np.asarray(x, dtype=np.float64).reshape(-1, 3)
+    n = x.shape[0]
+    alive = np.ones(n, dtype=bool) if alive is None else np.asarray(alive)
+    exit_step = np.full(n, -1, dtype=np.int64) if exit_step is None else np.asarray(exit_step)
+
+    data = {
+        'x' : x,
+        'v' : np.asarray(v, dtype=np.float64).reshape(-1, 3),
+        'b' : np.asarray(b, dtype=np.float64).reshape(-1, 3),
+        'e' : np.asarray(e, dtype=np.float64).reshape(-1, 3),
+        'alive' : alive,
+        'exit_step' : exit_step,
+        't' : np.broadcast_to(np.asarray(sim_time, dtype=np.float64), (n,)),
+        'dt' : np.broadcast_to(np.asarray(dt, dtype=np.float64), (n,)),
+    }
+    if '/src/particles' in f:
+        data['length'] = f['/src/particles'][:]['length']
+
+    # written in place when the group already has the same datasets, so nothing is created or deleted in a live
+    # (SWMR) file after the first checkpoint (files.async_writer)
+    grp = f.get('/checkpoint')
+    if grp is not None and all(name in grp and grp[name].shape == value.shape and grp[name].dtype == value.dtype
+                               for name, value in data.items()):
+        for name, value in data.items():
+            grp[name][...] = value
+    else:
+        if grp is not None:
+            del f['/checkpoint']
+        grp = f.create_group('/checkpoint')
+        for name, value in data.items():
+            grp.create_dataset(name, data=value)
+
+    grp.attrs.modify('step', int(step))
+    grp.attrs.modify('rows', filled_rows(f))
+    grp.attrs.modify('rng', np.void(pickle.dumps(np.random.get_state() if rng is None else rng)))
+    if config is not None:
+        write_config(f, config)
+
+def reserve_checkpoint(f:h5py.File, n:int, config=None):
+    """
+    Writes an empty checkpoint (step -1, which read_checkpoint ignores) for n particles, so that the first real
+    one is written in place. For live output files, before they switch to SWMR mode.
+    """
+    zeros = np.zeros((n, 3))
+    write_checkpoint(f, -1, np.zeros(n), np.zeros(n), zeros, zeros, zeros, zeros,
+                     np.ones(n, dtype=bool), np.full(n, -1, dtype=np.int64), config=config)
+
+def write_config(f:h5py.File, config):
+    data = np.void(pickle.dumps(config))
+    if '/config' in f:
+        if f['/config'][()].tobytes() == data.tobytes():
+            return
+        del f['/config']
+    f.create_dataset('/config', data=data)
+
+def read_config(path):
+    """
+    returns the AppConfig a run was started with, or None if the file doesn't have one.
+    """
+    with h5py.File(path, 'r') as f:
+        if '/config' not in f:
+            return None
+        return pickle.loads(f['/config'][()].tobytes())
+
+def read_checkpoint(path) -> Checkpoint:
+    """
+    returns the checkpoint in the h5 file at path, or None if it has none.
+    """
+    with h5py.File(path, 'r') as f:
+        if '/checkpoint' not in f or int(f['/checkpoint'].attrs['step']) < 0:
+            return None
+        grp = f['/checkpoint']
+        return Checkpoint(step=int(grp.attrs['step']),
+                          rows=int(grp.attrs['rows']),
+                          x=grp['x'][:], v=grp['v'][:], b=grp['b'][:], e=grp['e'][:],
+                          alive=grp['alive'][:], exit_step=grp['exit_step'][:],
+                          t=grp['t'][:], dt=grp['dt'][:],
+                          rng=pickle.loads(grp.attrs['rng'].tobytes()),
+                          length=grp['length'][:] if 'length' in grp else None)
+
+def truncate_to_checkpoint(path, ckpt:Checkpoint, rows:int=None):
+    """
+    Drops any rows written after the checkpoint (e.g. a flush that was cut off), so appending continues from it.
+    Loss events and GC hand-offs (keyed by step) after the checkpoint step are dropped too, and so are the losses
+    they put in the particle index.
+    rows: the rows per particle the resumed run will need, so its blocks are moved apart once, up front
+    """
+    with h5py.File(path, 'a') as f:
+        if '/src/particles' in f and ckpt.length is not None:
+            index = f['/src/particles'][:]
+            index['length'] = ckpt.length
+            index['exit_step'] = -1
+            index['exit_surface'] = -1
+            f['/src/particles'][:] = index
+            if rows is not None:
+                grow_capacity(f, rows)
+        else:
+            for key in SRC_DATASETS:
+                if key in f and f[key].shape[0] > ckpt.rows:
+                    f[key].resize(ckpt.rows, axis=0)
+            set_filled_rows(f, ckpt.rows)
+        for key in ('/src/events', '/src/handoff'):
+            if key in f:
+                event_rows = f[key][:]
+                keep = event_rows['step'] <= ckpt.step
+                if not keep.all():
+                    f[key].resize(int(keep.sum()), axis=0)
+                    f[key][:] = event_rows[keep]
+        if '/src/events' in f:
+            events = f['/src/events'][:]
+            set_exits(f, events['particle'], events['step'], events['surface'])
+        truncate_policy_rows(f, ckpt.step)
@@ -10,7 +10,8 @@ from settings.defaults.coils import coil_cust_attr_name
 #from system.temp_manager import TEMPMANAGER_MANAGER, read_temp_file_dict, write_dict_to_temp, update_temp
 #from system.temp_file_names import manager_1, m1f1, param_keys
 
-from files.hdf5.output_file_structure import create_h5_output_file
+from files.hdf5.output_file_structure import create_h5_output_file, storage_options
+from files.trajectory_buffer import rows_from_budget
 
 from settings.configs.funcs.config_reader import runtime_configs
 from system.state_dict_main import AppConfig
@@ -151,5 +152,8 @@ def get_output_subdir(params:AppConfig):
     os.makedirs(out_path, exist_ok=True)
 
 def create_output_file(params:AppConfig):
-    length = (params.step.numsteps * params.particle.count) + 1
-    create_h5_output_file(os.path.join(str(runtime_configs['Paths']['outputs']), params.path.hdf5), length)
+    n = max(1, params.particle.count or 1)
+    # chunking/compression/quantization from the output config; a flush is about half the buffer budget of rows
+    create_h5_output_file(os.path.join(str(runtime_configs['Paths']['outputs']), params.path.hdf5),
+                          params.step.numsteps + 1, n,
+                          **storage_options(params.output, rows_from_budget(params.output.buffer_mb / 2, n)))
@@ -1,18 +1,78 @@
 import h5py
-from files.PusherClasses import position_dt, velocity_dt, field_b_dt, field_e_dt
+import numpy as np
+from files.PusherClasses import position_dt, velocity_dt, field_b_dt, field_e_dt, time_dt
 
 """
 Place to define the file structure of the output HDF5 file
+
+# PARTICLES
+The per-step datasets are particle-major and ragged: each particle owns a block of rows, preallocated to the
+run's length, that its steps fill from the front. '/src/particles' (PARTICLE_DT, one row per particle) says
+where each block starts and how much of it is filled:
+    offset: first row of the particle's block
+    length: rows filled so far (steps after a particle was lost aren't written, so these differ)
+    capacity: rows in the block (a multiple of the chunk size, so particles don't share chunks)
+    exit_step, exit_surface: when and on which surface (calcs.walls) the particle was lost; -1 while it wasn't
+Particle k's trajectory is rows offset[k] : offset[k] + length[k] of every per-step dataset, so reading it is
+one contiguous read of its own length, whatever the number of particles (see particle_rows/read_particle).
+Row j of a block is step j, for the single particle pusher and the ensemble alike: row 0 is the initial state
+(t 0, dt 0), row j the state after step j. When the output policy drops steps, '/src/step' holds the step of
+each row instead (files.output_policy).
+A run that outgrows its blocks (resumed with --extend) has them moved apart (grow_capacity).
+When the run ends the datasets are trimmed after the last particle's rows (trim_to_filled). Rows that were never
+filled (the end of each block; the padding of a run that is still going or was killed) are NaN.
+
+Files from before the index have no '/src/particles': there the rows are step-major, row (step * N) + k being
+particle k (N in the '/src' attribute 'n_particles'), and '/src/rows' holds how many are filled.
+particle_rows and the writers handle both.
+
+# STORAGE (OutputConfig, see storage_options)
+chunks: chunk_rows rows per chunk for every per-step dataset, so a row range is the same chunks in each of them.
+    By default a flush's worth of a particle's rows, capped at CHUNK_BYTES per chunk (and at least MIN_CHUNK_ROWS):
+    a flush then writes whole chunks, and a plot (a full or strided read of one particle) or a tail of the latest
+    rows touches few, moderately sized chunks.
+compression: None, 'lzf' (fast) or 'gzip' (compression_level 0-9), optionally behind the shuffle filter.
+quantization: position/B/E can be rounded to a power-of-two quantum no larger than twice an absolute error bound
+    (quantize). The values stay float64 and need no decoding, but their low mantissa bits become zero, which
+    shuffle + lzf/gzip compress away. The max error is kept in the dataset's 'max_error' attribute and applied
+    to every append (so resumed runs keep it). HDF5's own scale-offset filter doesn't take compound datasets,
+    hence doing it here.
+See Tests/output_compression.py for what each setting costs and saves.
 """
-def create_h5_output_file(file_name, length, **kwargs):
+# the per-step datasets, one row per particle per step
+SRC_DATASETS = ('/src/position', '/src/velocity', '/src/fields/b', '/src/fields/e', '/src/time')
+
+# the particle index table
+PARTICLE_DT = np.dtype([('offset', np.int64), ('length', np.int64), ('capacity', np.int64),
+                        ('exit_step', np.int64), ('exit_surface', np.int64)])
+
+# upper bound on the bytes in one chunk of a per-step dataset when the chunk size is picked automatically
+CHUNK_BYTES = 1 << 20
+# lower bound on the rows in an automatic chunk (large ensembles write few rows per particle per flush)
+MIN_CHUNK_ROWS = 256
+# upper bound on the bytes of the blocks grow_capacity moves at once
+MOVE_BYTES = 64 << 20
+
+def create_h5_output_file(file_name, length, n_particles:int=1, chunk_rows:int=None, compression:str=None,
+                          compression_opts=None, shuffle:bool=False, max_error:dict=None, **kwargs):
     """
-    Explanation of h5py construction:
-    https://docs.h5py.org/en/stable/high/dataset.html#reading-writing-data
+    Creates the output file: the per-step datasets, one block of rows per particle (see PARTICLES above),
+    and the particle index. The datasets use HDF5's chunked layout, as resizable datasets must
+    (https://docs.h5py.org/en/stable/high/dataset.html#chunked-storage); storage_options builds the chunk and
+    filter arguments from an OutputConfig (see STORAGE above).
 
-    chunks=True tells h5py to make the h5 file use HDF5's chunked storage layout, which splits datasets into
-    multiple pieces on the disk. You can specify each chunk's shape, but setting it to True instead tells h5py
-    to use its best guess.
+    length: rows to preallocate per particle. Chunks are only allocated on disk once written, so a generous length
+        costs nothing; the blocks still grow past it if a run is extended.
+    n_particles: particles in the run (blocks in the datasets)
+    chunk_rows: rows per chunk, capped at length, and each block is a whole number of chunks (so particles
+        never share one); None leaves the chunk shape to h5py (chunks=True) and the blocks at length rows
+    compression: None, 'lzf' or 'gzip'; compression_opts: the gzip level (0-9); shuffle: the byte shuffle filter
+        in front of it. Passed to h5py as they are.
+    max_error: {dataset key : absolute error bound}; the datasets named get a 'max_error' attribute and every
+        append quantizes their rows to it (quantize). A missing or zero bound leaves a dataset exact.
+    **kwargs: ignored (the rest of an OutputConfig's options)
     """
+    max_error = max_error or {}
         # CREATE FILE, ROOT GROUP
     f = h5py.File(file_name, 'w', libver='latest')
     f.swmr_mode = True # single writer, multiple readers.
@@ -21,11 +81,223 @@ def create_h5_output_file(file_name, length, **kwargs):
     grp = f.create_group('/src')
 
         # THINGS INSIDE THE SRC GROUP
-    grp_ds = f.create_dataset("/src/position", (0,), chunks=True, maxshape=(None,), dtype=position_dt) # px, py, pz
-    grp_ds2 = f.create_dataset("/src/velocity", (0,), chunks=True, maxshape=(None,), dtype=velocity_dt) # vx, vy, vz, vperp, vpar, vmag
+    length = max(1, length)
+    if chunk_rows:
+        # a chunk is allocated whole once a row of it is written: no larger than a particle's block
+        chunk_rows = min(chunk_rows, length)
+    capacity = _round_up(length, chunk_rows)
+    def per_step(key, dtype):
+        ds = f.create_dataset(key, (n_particles * capacity,), chunks=(chunk_rows,) if chunk_rows else True, maxshape=(None,),
+                              dtype=dtype, fillvalue=np.full((), np.nan, dtype=dtype),
+                              compression=compression, compression_opts=compression_opts, shuffle=shuffle)
+        if max_error.get(key):
+            ds.attrs['max_error'] = float(max_error[key])
+        return ds
+    grp_ds = per_step("/src/position", position_dt) # px, py, pz
+    grp_ds2 = per_step("/src/velocity", velocity_dt) # vx, vy, vz, vperp, vpar, vmag
     grp_grp = f.create_group('/src/fields')
-    grp_grp_ds = f.create_dataset("/src/fields/b", (0,), chunks=True, maxshape=(None,), dtype=field_b_dt) # bx, by, bz, bmag, bhat
-    grp_grp_ds2 = f.create_dataset("/src/fields/e", (0,), chunks=True, maxshape=(None,), dtype=field_e_dt)  # bx, by, bz, eperp, epar, emag
+    grp_grp_ds = per_step("/src/fields/b", field_b_dt) # bx, by, bz, bmag, bhat
+    grp_grp_ds2 = per_step("/src/fields/e", field_e_dt)  # bx, by, bz, eperp, epar, emag
+    grp_ds3 = per_step("/src/time", time_dt) # t, dt (dt varies with dynamic dt)
+    set_particles(f, n_particles, capacity) # where each particle's rows are
+    f.close()
+
+def storage_options(output, flush_rows:int) -> dict:
+    """
+    create_h5_output_file keyword arguments for an OutputConfig.
+    flush_rows: rows one full buffer writes into each particle's block
+    """
+    largest = max(dt.itemsize for dt in (position_dt, velocity_dt, field_b_dt, field_e_dt, time_dt))
+    chunk_rows = output.chunk_rows or max(MIN_CHUNK_ROWS, min(flush_rows, CHUNK_BYTES // largest))
+    return dict(chunk_rows=chunk_rows,
+                compression=output.compression,
+                compression_opts=output.compression_level if output.compression == 'gzip' else None,
+                shuffle=output.shuffle,
+                max_error={'/src/position' : output.max_error_position,
+                           '/src/fields/b' : output.max_error_b,
+                           '/src/fields/e' : output.max_error_e})
+
+def quantize(data:np.ndarray, max_error:float) -> np.ndarray:
+    """
+    Rounds every float of a (structured, float64) array to a multiple of the largest power of two q <= 2 max_error,
+    so |error| <= q / 2 <= max_error. Returns a new array; NaN stays NaN.
+    """
+    q = 2. ** np.floor(np.log2(2. * max_error))
+    flat = np.ascontiguousarray(data).view(np.float64)
+    return (np.round(flat / q) * q).view(data.dtype)
+
+def _round_up(rows:int, chunk_rows:int=None) -> int:
+    return -(-rows // chunk_rows) * chunk_rows if chunk_rows else rows
+
+#=== the particle index ===#
+def set_particles(f:h5py.File, n:int, capacity:int):
+    """
+    (Re)writes the particle index of an open output file for n empty blocks of capacity rows.
+    Only for files nothing has been written to yet.
+    """
+    index = np.zeros(n, dtype=PARTICLE_DT)
+    index['offset'] = np.arange(n) * capacity
+    index['capacity'] = capacity
+    index['exit_step'] = -1
+    index['exit_surface'] = -1
+    if '/src/particles' in f:
+        del f['/src/particles']
+    f.create_dataset('/src/particles', data=index)
+    f['/src'].attrs['n_particles'] = n
+
+def particle_index(f:h5py.File) -> np.ndarray:
+    """
+    The PARTICLE_DT table of an open output file; None for files from before it (step-major rows).
+    """
+    return f['/src/particles'][:] if '/src/particles' in f else None
+
+def n_particles(f:h5py.File) -> int:
+    if '/src/particles' in f:
+        return f['/src/particles'].shape[0]
+    return int(f['/src'].attrs.get('n_particles', 1))
+
+def particle_rows(f:h5py.File, k:int=0) -> slice:
+    """
+    The rows of particle k in the per-step datasets of an open output file.
+    """
+    if '/src/particles' in f:
+        row = f['/src/particles'][k]
+        return slice(int(row['offset']), int(row['offset'] + row['length']))
+    return slice(k, filled_rows(f), n_particles(f))
+
+def read_particle(f:h5py.File, key:str, k:int=0) -> np.ndarray:
+    """
+    Particle k's rows of the per-step dataset key (e.g. '/src/position') of an open output file.
+    """
+    return f[key][particle_rows(f, k)]
+
+def particle_steps(f:h5py.File, k:int=0):
+    """
+    The step number of each of particle k's rows, if the run was decimated (files.output_policy; None otherwise,
+    when its rows are consecutive steps). Sharded runs (calcs.sharding) have a block of '/src/step' per shard.
+    """
+    if '/src/step' not in f:
+        return None
+    if '/src/particles' not in f:
+        return f['/src/step'][:]
+    start = 0
+    if '/src/shards' in f:
+        shards = f['/src/shards'][:]
+        s = shards[np.searchsorted(shards['particle_start'], k, side='right') - 1]
+        start = int(s['step_start'])
+    return f['/src/step'][start:start + int(f['/src/particles'][k]['length'])]
+
+def set_exits(f:h5py.File, particles, steps, surfaces):
+    """
+    Records where particles were lost in the particle index (see calcs.walls.append_events).
+    """
+    if '/src/particles' not in f or len(particles) == 0:
+        return
+    index = f['/src/particles'][:]
+    index['exit_step'][particles] = steps
+    index['exit_surface'][particles] = surfaces
+    f['/src/particles'][:] = index
+
+def grow_capacity(f:h5py.File, rows:int) -> np.ndarray:
+    """
+    Makes every particle's block hold at least rows rows, moving the blocks apart if they have to grow.
+    returns the new index.
+    """
+    index = f['/src/particles'][:]
+    capacity = int(index['capacity'].max()) if len(index) else 0
+    if rows <= capacity:
+        return index
+    capacity = _round_up(rows, f['/src/position'].chunks[0])
+    n = len(index)
+    offset, length = index['offset'], index['length']
+    new = np.arange(n) * capacity
+    for key in SRC_DATASETS:
+        if key not in f:
+            continue
+        ds = f[key]
+        if ds.shape[0] < n * capacity:
+            ds.resize(n * capacity, axis=0)
+        # a batch of neighbouring blocks at a time, from the last on, so a block never lands on one that hasn't
+        # been moved yet: one read of their rows, one write of NaN over them, one write of the moved blocks
+        per = max(1, MOVE_BYTES // (ds.dtype.itemsize * max(1, int(index['capacity'].max()))))
+        for lo in range(per * ((n - 1) // per), -1, -per):
+            ks = np.arange(lo, min(lo + per, n))
+            if not length[ks].any():
+                continue
+            start, end = int(offset[lo]), int((offset[ks] + length[ks]).max())
+            old = ds[start:end]
+            ds[start:end] = np.full(end - start, np.nan, dtype=ds.dtype)
+            for c in np.unique(length[ks]):
+                group = ks[length[ks] == c]
+                if c:
+                    write_blocks(ds, new[group], old[(offset[group] - start)[:, None] + np.arange(c)])
+    index['offset'] = new
+    index['capacity'] = capacity
+    f['/src/particles'][:] = index
+    return index
+
+def write_blocks(ds:h5py.Dataset, starts, data:np.ndarray):
+    """
+    Writes data[i] to rows starts[i] : starts[i] + rows of a per-step dataset, for every i.
+    data: (m, rows), e.g. one flush's rows of m particles, whose blocks are apart in the file.
+    Blocks the same distance apart (equal lengths in blocks of equal capacity, the usual case) are selected as
+    one strided hyperslab and written in one go, so HDF5 walks the chunks in C; one h5py write per block spends
+    most of a flush in call overhead once there are thousands of particles. Uneven starts (particles lost in
+    between) split into runs of evenly spaced blocks, one write each: a union of thousands of single block
+    hyperslabs is slower still to build than the writes it saves.
+    """
+    m, rows = data.shape
+    if m == 0 or rows == 0:
+        return
+    starts = np.asarray(starts, dtype=np.int64)
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    data = np.ascontiguousarray(data[order], dtype=ds.dtype)
+    step = np.diff(starts)
+    # runs of constant step; a block between two runs goes with the first
+    bounds = np.concatenate([[0], np.flatnonzero(step[1:] != step[:-1]) + 1, [m - 1]])
+    fspace = ds.id.get_space()
+    i = 0
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        if b < i:
+            continue
+        count = int(b - i + 1)
+        stride = int(step[i]) if count > 1 else rows
+        fspace.select_hyperslab((int(starts[i]),), (count,), stride=(stride,), block=(rows,))
+        ds.id.write(h5py.h5s.create_simple((count * rows,)), fspace, data[i:b + 1].reshape(-1))
+        i = int(b) + 1
+    if i < m:
+        fspace.select_hyperslab((int(starts[i]),), (1,), block=(rows,))
+        ds.id.write(h5py.h5s.create_simple((rows,)), fspace, data[i].reshape(-1))
+
+#=== filled rows ===#
+def filled_rows(f:h5py.File) -> int:
+    """
+    Rows of the per-step datasets of an open output file up to the last one filled (for files from before the
+    particle index: '/src/rows', or their length).
+    """
+    if '/src/particles' in f:
+        index = f['/src/particles'][:]
+        return int((index['offset'] + index['length']).max()) if len(index) else 0
+    if '/src/rows' in f:
+        return int(f['/src/rows'][()])
+    return f['/src/position'].shape[0]
+
+def set_filled_rows(f:h5py.File, rows:int):
+    """
+    (files from before the particle index)
+    """
+    if '/src/rows' in f:
+        f['/src/rows'][()] = rows
+
+def trim_to_filled(f:h5py.File):
+    """
+    Drops the preallocated rows after the last filled one.
+    """
+    rows = filled_rows(f)
+    for key in SRC_DATASETS:
+        if key in f and f[key].shape[0] > rows:
+            f[key].resize(rows, axis=0)
 
 if __name__ == "__main__":
-    h5py.run_tests()
\ No newline at end of file
+    h5py.run_tests()
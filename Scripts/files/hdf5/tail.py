@@ -0,0 +1,56 @@
+import h5py
+import numpy as np
+
+"""
+Following the output file of a run that is still going (OutputConfig.live, see files.async_writer).
+
+The writer keeps the file in HDF5's SWMR mode and flushes every few seconds; TrajectoryTail reads the rows each
+particle got since the last poll(), through the particle index (files.hdf5.output_file_structure), so a poll
+only costs the new rows whatever the length of the run.
+
+The file is opened for each poll and closed again, without file locking: the run may not have switched its file
+to SWMR mode yet when the tail starts (and a locked file couldn't be opened by the run at all), and a fresh open
+always sees the writer's latest flush.
+"""
+class TrajectoryTail:
+    def __init__(self, path, keys=('/src/position',)):
+        """
+        path: the output h5 file
+        keys: the per-step datasets to read
+        """
+        self.path = path
+        self.keys = keys
+        self.seen = np.zeros(0, dtype=np.int64) # rows of each particle read so far
+        self.index = None # the particle index at the last poll
+
+    def poll(self) -> dict:
+        """
+        returns {particle : (first row number, {key : new rows})} for the particles with rows since the last poll;
+        empty if there are none or the file can't be read right now.
+        """
+        try:
+            f = h5py.File(self.path, 'r', swmr=True, locking=False)
+        except OSError:
+            return {}
+        new = {}
+        with f:
+            if '/src/particles' not in f:
+                return {}
+            index = f['/src/particles'][:]
+            if len(index) != len(self.seen):
+                self.seen = np.zeros(len(index), dtype=np.int64)
+            # a resumed run truncates to its checkpoint first
+            self.seen = np.minimum(self.seen, index['length'])
+            for k in np.flatnonzero(index['length'] > self.seen):
+                lo = int(index['offset'][k] + self.seen[k])
+                hi = int(index['offset'][k] + index['length'][k])
+                new[k] = (int(self.seen[k]), {key : f[key][lo:hi] for key in self.keys if key in f})
+                self.seen[k] = index['length'][k]
+            self.index = index
+        return new
+
+    def capacity(self, k:int) -> int:
+        """
+        rows preallocated for particle k (the run's length when it started), e.g. to colour rows by progress.
+        """
+        return int(self.index['capacity'][k]) if self.index is not None else 1
@@ -0,0 +1,258 @@
+import h5py
+import numpy as np
+
+from files.trajectory_buffer import TrajectoryBuffer, append_buffer_to_hdf5
+
+"""
+Decimated/reduced output: which of the buffered steps actually get written to the output file.
+
+By default every step is written in full. OutputConfig can instead ask for
+    - every k-th step only (stride; steps are counted from the start of the run, so resuming doesn't shift them)
+    - steps from after_step on
+    - steps inside a box region only (region_mode 'inside'), or every step from the first time the particle
+      enters the region on (region_mode 'after'; the entry is the event)
+    - min/max/mean of every quantity over windows of reduce_window steps, streamed into '/src/reduced'
+    - no per-step rows at all (keep_steps False), e.g. with the reductions and the loss events only
+The policy is applied at flush time on the trajectory buffer, so the pushers and the compiled kernel don't change;
+the file size and the flush time scale with the rows kept.
+
+For an ensemble a step is kept when it is kept for any particle (e.g. any alive particle is inside the region),
+so row j of every particle's block (files.hdf5.output_file_structure) is the same step, '/src/step'[j].
+
+# LAYOUT (only when the policy drops steps)
+/src/step: step number of each kept step (one per step, not per particle row)
+/src/reduced: REDUCED_DT, one row per (window, particle) once the window is complete
+    step: first step of the window, count: steps of the particle in it (steps after it was lost don't count)
+    min, max, mean: (len(REDUCED_QUANTITIES),) over those steps
+    attrs: window, quantities
+The streaming state (unfinished window, the region entry step) is saved with the checkpoint, so resumed runs
+carry on exactly; the last, unfinished window of a run is written when the run ends.
+"""
+REDUCED_QUANTITIES = ('t', 'x', 'y', 'z', 'vx', 'vy', 'vz', 'vmag', 'bx', 'by', 'bz', 'bmag', 'ex', 'ey', 'ez', 'emag')
+
+REDUCED_DT = np.dtype([('particle', np.int64), ('step', np.int64), ('count', np.int64),
+                       ('min', np.float64, (len(REDUCED_QUANTITIES),)),
+                       ('max', np.float64, (len(REDUCED_QUANTITIES),)),
+                       ('mean', np.float64, (len(REDUCED_QUANTITIES),))])
+
+class OutputPolicy:
+    def __init__(self, config, n:int=1):
+        """
+        config: OutputConfig
+        n: particles per buffer row
+        """
+        self.n = n
+        self.stride = max(1, int(config.stride))
+        self.after_step = int(config.after_step)
+        self.region = None if config.region is None else np.asarray(config.region, dtype=np.float64).reshape(3, 2)
+        if config.region_mode not in ('inside', 'after'):
+            raise ValueError(f"unknown region_mode '{config.region_mode}', expected 'inside' or 'after'")
+        self.region_mode = config.region_mode
+        self.window = int(config.reduce_window)
+        self.keep_steps = config.keep_steps
+
+        self.trigger_step = -1 # first step inside the region, for region_mode 'after'
+        # the unfinished window
+        q = len(REDUCED_QUANTITIES)
+        self.w_id = -1
+        self.w_min = np.full((n, q), np.inf)
+        self.w_max = np.full((n, q), -np.inf)
+        self.w_sum = np.zeros((n, q))
+        self.w_count = np.zeros(n, dtype=np.int64)
+
+    @property
+    def decimates(self) -> bool:
+        """
+        False when every step is written, i.e. the output is the same as without a policy.
+        """
+        return (self.stride > 1 or self.after_step > 0 or self.region is not None or not self.keep_steps)
+
+    #=== selection ===#
+    def select(self, buffer:TrajectoryBuffer, last_step:int):
+        """
+        returns (kept buffer rows, their step numbers) for a buffer whose last row is step last_step.
+        """
+        c = buffer.count
+        steps = last_step - c + 1 + np.arange(c)
+        keep = (steps % self.stride == 0) & (steps >= self.after_step)
+        if self.region is not None:
+            inside = (np.all((buffer.x[:c] >= self.region[:, 0]) & (buffer.x[:c] <= self.region[:, 1]), axis=-1)
+                      & self._live(buffer, steps)).any(axis=1)
+            if self.region_mode == 'inside':
+                keep &= inside
+            else:
+                if self.trigger_step < 0 and inside.any():
+                    self.trigger_step = int(steps[np.argmax(inside)])
+                    print(f"entered the output region at step {self.trigger_step}; writing steps from here on")
+                keep &= (self.trigger_step >= 0) & (steps >= self.trigger_step)
+        if not self.keep_steps:
+            keep[:] = False
+        rows = np.flatnonzero(keep)
+        return rows, steps[rows]
+
+    @staticmethod
+    def _live(buffer, steps):
+        # rows after a particle was lost repeat its last state with dt 0; the initial row (step 0) has dt 0 too
+        return (buffer.dt[:len(steps)] > 0) | (steps[:, None] == 0)
+
+    #=== reductions ===#
+    def reduce(self, buffer:TrajectoryBuffer, last_step:int) -> np.ndarray:
+        """
+        folds the buffered steps into the running windows; returns the REDUCED_DT rows of the windows it completed.
+        """
+        c = buffer.count
+        if self.window <= 0 or c == 0:
+            return np.zeros(0, dtype=REDUCED_DT)
+        steps = last_step - c + 1 + np.arange(c)
+        live = self._live(buffer, steps)
+        vals = self._quantities(buffer, c)
+
+        ids = steps // self.window
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        seg_min = np.fmin.reduceat(np.where(live[..., None], vals, np.nan), starts, axis=0)
+        seg_max = np.fmax.reduceat(np.where(live[..., None], vals, np.nan), starts, axis=0)
+        seg_sum = np.add.reduceat(np.where(live[..., None], vals, 0.), starts, axis=0)
+        seg_count = np.add.reduceat(live.astype(np.int64), starts, axis=0)
+
+        done = []
+        for k, start in enumerate(starts):
+            w = ids[start]
+            if w != self.w_id:
+                if self.w_id >= 0:
+                    done.append(self._window_rows())
+                self._reset_window(w)
+            self.w_min = np.fmin(self.w_min, seg_min[k])
+            self.w_max = np.fmax(self.w_max, seg_max[k])
+            self.w_sum += seg_sum[k]
+            self.w_count += seg_count[k]
+        # the last window is complete if the buffer ends on its last step
+        if (last_step + 1) % self.window == 0:
+            done.append(self._window_rows())
+            self._reset_window(-1)
+        return np.concatenate(done) if done else np.zeros(0, dtype=REDUCED_DT)
+
+    def finish(self) -> np.ndarray:
+        """
+        REDUCED_DT rows of the unfinished window, at the end of a run (the window is kept for a resume).
+        """
+        if self.window <= 0 or self.w_id < 0:
+            return np.zeros(0, dtype=REDUCED_DT)
+        return self._window_rows()
+
+    def _quantities(self, buffer, c):
+        x, v, b, e = buffer.x[:c], buffer.v[:c], buffer.b[:c], buffer.e[:c]
+        norm = lambda a: np.linalg.norm(a, axis=-1, keepdims=True)
+        return np.concatenate([buffer.t[:c, :, None], x, v, norm(v), b, norm(b), e, norm(e)], axis=-1)
+
+    def _reset_window(self, w):
+        self.w_id = w
+        self.w_min[:] = np.inf
+        self.w_max[:] = -np.inf
+        self.w_sum[:] = 0.
+        self.w_count[:] = 0
+
+    def _window_rows(self):
+        has = np.flatnonzero(self.w_count > 0)
+        rows = np.zeros(len(has), dtype=REDUCED_DT)
+        rows['particle'] = has
+        rows['step'] = self.w_id * self.window
+        rows['count'] = self.w_count[has]
+        rows['min'] = self.w_min[has]
+        rows['max'] = self.w_max[has]
+        rows['mean'] = self.w_sum[has] / self.w_count[has, None]
+        return rows
+
+    #=== writing ===#
+    def write(self, f:h5py.File, buffer:TrajectoryBuffer, last_step:int, max_rows:int=None, final:bool=False):
+        """
+        Appends the kept rows of the buffer (and any completed windows) to an open output file.
+        final: the run is ending, also write the unfinished window.
+        """
+        if not self.decimates:
+            append_buffer_to_hdf5(f, buffer, max_rows=max_rows)
+        else:
+            rows, steps = self.select(buffer, last_step)
+            append_buffer_to_hdf5(f, buffer, max_rows=max_rows, rows=rows)
+            append_rows(f, '/src/step', steps.astype(np.int64))
+
+        reduced = self.reduce(buffer, last_step)
+        if final:
+            reduced = np.concatenate([reduced, self.finish()])
+        if self.window > 0:
+            append_rows(f, '/src/reduced', reduced, window=self.window, quantities=list(REDUCED_QUANTITIES))
+
+    #=== checkpointing ===#
+    def save_state(self, f:h5py.File):
+        """
+        saves the streaming state into the checkpoint group (call after files.checkpoint.write_checkpoint).
+        Written in place if the checkpoint already has it, like the checkpoint.
+        """
+        state = {'w_min' : self.w_min, 'w_max' : self.w_max, 'w_sum' : self.w_sum, 'w_count' : self.w_count}
+        if 'output_policy' in f['/checkpoint']:
+            grp = f['/checkpoint/output_policy']
+            for name, value in state.items():
+                grp[name][...] = value
+        else:
+            grp = f['/checkpoint'].create_group('output_policy')
+            for name, value in state.items():
+                grp.create_dataset(name, data=value)
+        grp.attrs.modify('trigger_step', self.trigger_step)
+        grp.attrs.modify('w_id', self.w_id)
+
+    def prepare(self, f:h5py.File):
+        """
+        creates the (empty) datasets the policy writes to, e.g. before a live output file switches to SWMR mode.
+        """
+        if self.decimates:
+            append_rows(f, '/src/step', np.zeros(0, dtype=np.int64))
+        if self.window > 0:
+            append_rows(f, '/src/reduced', np.zeros(0, dtype=REDUCED_DT), window=self.window,
+                        quantities=list(REDUCED_QUANTITIES))
+
+    def restore_state(self, path, step:int):
+        """
+        picks the streaming state back up from the checkpoint of the output file at path, at checkpoint step step.
+        """
+        with h5py.File(path, 'r') as f:
+            if '/checkpoint/output_policy' not in f:
+                return
+            grp = f['/checkpoint/output_policy']
+            trigger = int(grp.attrs['trigger_step'])
+            self.trigger_step = trigger if trigger <= step else -1
+            if self.window > 0 and grp['w_min'].shape == self.w_min.shape:
+                self.w_id = int(grp.attrs['w_id'])
+                self.w_min[:] = grp['w_min'][:]
+                self.w_max[:] = grp['w_max'][:]
+                self.w_sum[:] = grp['w_sum'][:]
+                self.w_count[:] = grp['w_count'][:]
+
+def append_rows(f:h5py.File, key:str, rows:np.ndarray, **attrs):
+    """
+    Appends rows to a resizable 1D dataset of an open h5 file, creating it (with attrs) the first time.
+    """
+    if key not in f:
+        f.create_dataset(key, (0,), chunks=True, maxshape=(None,), dtype=rows.dtype)
+        for name, value in attrs.items():
+            f[key].attrs[name] = value
+    if len(rows) == 0:
+        return
+    ds = f[key]
+    old = ds.shape[0]
+    ds.resize(old + len(rows), axis=0)
+    ds[old:] = rows
+
+def truncate_policy_rows(f:h5py.File, step:int):
+    """
+    Drops the rows of '/src/step' and '/src/reduced' that come after checkpoint step step (see truncate_to_checkpoint).
+    Windows that weren't complete at step are dropped too; the checkpoint holds their running state.
+    """
+    if '/src/step' in f:
+        steps = f['/src/step'][:]
+        f['/src/step'].resize(int(np.count_nonzero(steps <= step)), axis=0)
+    if '/src/reduced' in f:
+        ds = f['/src/reduced']
+        rows = ds[:]
+        keep = rows['step'] + int(ds.attrs['window']) - 1 <= step
+        if not keep.all():
+            ds.resize(int(keep.sum()), axis=0)
+            ds[:] = rows[keep]
@@ -0,0 +1,78 @@
+import ast
+import os
+
+import numpy as np
+import pandas as pd
+from magpylib import Collection
+from magpylib.current import Circle
+
+"""
+Readers (and a writer) for the input files (coil configurations, particle conditions) that don't go through the GUI.
+
+Gui_tkinter.funcs.GuiEntryHelpers.File_to_Collection does the same job for the GUI, but that module
+imports tkinter, which headless runs can't have.
+
+# COIL FILE FORMAT
+csv written by the coil entry tables, one coil per row:
+    PosX, PosY, PosZ, Amp (or Q for charged rings), Diameter, [Inner_r], RotationAngle, RotationAxis
+The rotation columns hold python lists, e.g. [90] and ['y'].
+"""
+
+def _as_list(val):
+    """
+    rotation cells are stringified lists; empty cells count as no rotation.
+    """
+    if isinstance(val, str):
+        val = ast.literal_eval(val)
+    if val is None or (isinstance(val, float) and np.isnan(val)):
+        return []
+    if not isinstance(val, (list, tuple)):
+        return [val]
+    return list(val)
+
+def read_coil_file(path):
+    """
+    Reads a coil csv into a magpylib Collection of Circles.
+
+    returns (collection, inner_r); inner_r is the list of inner washer radii, empty if the file has no Inner_r column.
+    """
+    df = pd.read_csv(path, header=0)
+    power = "Amp" if "Amp" in df.columns else "Q"
+
+    c = Collection()
+    for _, row in df.iterrows():
+        coil = Circle(position=[float(row["PosX"]), float(row["PosY"]), float(row["PosZ"])],
+                      current=float(row[power]),
+                      diameter=float(row["Diameter"]))
+        for ang, ax in zip(_as_list(row["RotationAngle"]), _as_list(row["RotationAxis"])):
+            coil.rotate_from_angax(float(ang), ax)
+        c.add(coil)
+
+    inner_r = [float(r) for r in df["Inner_r"]] if "Inner_r" in df.columns else []
+    return c, inner_r
+
+def read_particle_file(path):
+    """
+    Reads a particle conditions csv (px, py, pz, vx, vy, vz columns).
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"particle file not found: {path}")
+    return pd.read_csv(path, dtype=np.float64)
+
+def write_coil_file(path, collection:Collection, inner_r=None, power="Amp"):
+    """
+    Writes a collection of Circles as a coil csv that read_coil_file() and the GUI can read back.
+    Each coil's orientation is stored as a single rotation (angle in degrees about its rotation vector).
+    """
+    rows = []
+    for i, coil in enumerate(collection.children_all):
+        rotvec = coil.orientation.as_rotvec()
+        angle = np.degrees(np.linalg.norm(rotvec))
+        row = {"PosX": coil.position[0], "PosY": coil.position[1], "PosZ": coil.position[2],
+               power: coil.current, "Diameter": coil.diameter}
+        if inner_r:
+            row["Inner_r"] = inner_r[i]
+        row["RotationAngle"] = [float(angle)] if angle > 0 else []
+        row["RotationAxis"] = [list(map(float, rotvec / np.linalg.norm(rotvec)))] if angle > 0 else []
+        rows.append(row)
+    pd.DataFrame(rows).to_csv(path, index=False)
@@ -0,0 +1,176 @@
+import numpy as np
+from files.PusherClasses import position_dt, velocity_dt, field_b_dt, field_e_dt, time_dt
+from files.hdf5.output_file_structure import filled_rows, set_filled_rows, quantize, particle_index, grow_capacity, \
+    write_blocks
+
+"""
+Struct-of-arrays buffer that the pusher writes its steps into between flushes.
+
+Replaces the old np.empty(n, dtype=particle) object array, where every step was a 'particle' dataclass
+of 24 python floats that had to be turned into a DataFrame before it could be written.
+Here there is one preallocated structured array per output dataset (same dtypes as the h5 datasets),
+so a flush hands h5py the arrays as they are.
+
+Each array is shaped (rows, n): one row per step, one column per particle.
+The kernel writes through the float64 views (x, v, b, e, t, dt), which alias the structured arrays.
+"""
+# bytes taken by one particle for one step, over all four datasets.
+ROW_BYTES = position_dt.itemsize + velocity_dt.itemsize + field_b_dt.itemsize + field_e_dt.itemsize + time_dt.itemsize
+
+def rows_from_budget(budget_mb:float, n:int=1, min_rows:int=1) -> int:
+    """
+    How many steps fit in the given memory budget (in MB) for n particles.
+    """
+    return max(min_rows, int(budget_mb * 1024 ** 2) // (ROW_BYTES * n))
+
+class TrajectoryBuffer:
+    def __init__(self, rows:int, n:int=1):
+        self.rows = rows
+        self.n = n
+        self.count = 0 # number of filled rows
+
+        # diagnostic columns (vperp, bmag, ...) are filled lazily by the plotting window, so they start as NaN.
+        self.position = np.full((rows, n), np.nan, dtype=position_dt)
+        self.velocity = np.full((rows, n), np.nan, dtype=velocity_dt)
+        self.field_b = np.full((rows, n), np.nan, dtype=field_b_dt)
+        self.field_e = np.full((rows, n), np.nan, dtype=field_e_dt)
+        self.time = np.full((rows, n), np.nan, dtype=time_dt)
+
+        # (rows, n, 3) float views of the vector part of each dataset
+        self.x = self.position.view(np.float64).reshape(rows, n, 3)
+        self.v = self.velocity.view(np.float64).reshape(rows, n, 6)[..., :3]
+        self.b = self.field_b.view(np.float64).reshape(rows, n, 7)[..., :3]
+        self.e = self.field_e.view(np.float64).reshape(rows, n, 6)[..., :3]
+        # (rows, n) views of the time columns
+        self.t = self.time['t']
+        self.dt = self.time['dt']
+
+    @property
+    def full(self) -> bool:
+        return self.count == self.rows
+
+    def append(self, x, v, b, e, t, dt):
+        """
+        writes one step (x, v, b, e each (n, 3), or (3,) for a single particle; t, dt (n,) or scalars)
+        into the next free row.
+        """
+        i = self.count
+        self.x[i] = x
+        self.v[i] = v
+        self.b[i] = b
+        self.e[i] = e
+        self.t[i] = t
+        self.dt[i] = dt
+        self.count += 1
+
+    def filled(self, rows=None):
+        """
+        The filled part of each dataset as flat, step-major arrays (views; nothing is copied).
+        rows: only these of the filled rows (an index array; copies)
+        returns a dict of h5 dataset key -> array
+        """
+        c = self.count
+        pick = (lambda a: a[:c]) if rows is None else (lambda a: a[:c][rows])
+        return {
+            '/src/position' : pick(self.position).reshape(-1),
+            '/src/velocity' : pick(self.velocity).reshape(-1),
+            '/src/fields/b' : pick(self.field_b).reshape(-1),
+            '/src/fields/e' : pick(self.field_e).reshape(-1),
+            '/src/time' : pick(self.time).reshape(-1),
+        }
+
+    def columns(self, rows=None):
+        """
+        The filled part of each dataset, (rows, n) (views unless rows is given).
+        rows: only these of the filled rows (an index array)
+        returns a dict of h5 dataset key -> array
+        """
+        c = self.count
+        pick = (lambda a: a[:c]) if rows is None else (lambda a: a[:c][rows])
+        return {
+            '/src/position' : pick(self.position),
+            '/src/velocity' : pick(self.velocity),
+            '/src/fields/b' : pick(self.field_b),
+            '/src/fields/e' : pick(self.field_e),
+            '/src/time' : pick(self.time),
+        }
+
+    def live(self, rows=None):
+        """
+        (rows, n) mask of the filled rows that are steps of a particle: the rows after a particle was lost repeat
+        its last state with dt 0. The initial row (t = 0) has dt 0 too.
+        """
+        c = self.count
+        t, dt = (self.t[:c], self.dt[:c]) if rows is None else (self.t[:c][rows], self.dt[:c][rows])
+        return (dt > 0) | (t == 0)
+
+    def reset(self):
+        self.count = 0
+
+def append_buffer_to_hdf5(f, buffer:TrajectoryBuffer, max_rows:int=None, rows=None):
+    """
+    Appends the filled part of the buffer to the output datasets of an open h5py.File: each particle's rows go
+    after its filled rows, in its block (files.hdf5.output_file_structure). Rows after a particle was lost are
+    dropped. Blocks only grow if they are full.
+    The particles are written together, one HDF5 write per dataset for those with the same number of new rows
+    (all of them, but for the ones lost during the flush), see write_blocks.
+    Datasets with a 'max_error' attribute get their rows quantized to it first (files.hdf5.output_file_structure).
+
+    max_rows: if given, never fill a particle's block past this many rows.
+    rows: only append these buffer rows (see files.output_policy)
+    """
+    index = particle_index(f)
+    if index is None:
+        return _append_step_major(f, buffer, max_rows, rows)
+
+    live = buffer.live(rows)
+    counts = live.sum(axis=0)
+    if max_rows is not None:
+        counts = np.minimum(counts, np.maximum(0, max_rows - index['length']))
+    ends = index['length'] + counts
+    if (ends > index['capacity']).any():
+        index = grow_capacity(f, max(int(ends.max()), 2 * int(index['capacity'].max())))
+    write = np.flatnonzero(counts)
+    if len(write) == 0:
+        return
+    starts = index['offset'] + index['length']
+    # the particles with the same number of new rows; a particle's live rows come first (lost ones repeat after)
+    groups = [write[counts[write] == c] for c in np.unique(counts[write])]
+
+    for key, data in buffer.columns(rows).items():
+        if key not in f:
+            # output files from before a dataset existed (e.g. resuming an old run)
+            continue
+        ds = f[key]
+        if 'max_error' in ds.attrs:
+            data = quantize(data, ds.attrs['max_error'])
+        end = int((starts + counts).max())
+        if ds.shape[0] < end:
+            ds.resize(end, axis=0)
+        for ks in groups:
+            c = int(counts[ks[0]])
+            write_blocks(ds, starts[ks], data[:c, ks].T)
+    index['length'] = ends
+    f['/src/particles'][:] = index
+
+def _append_step_major(f, buffer:TrajectoryBuffer, max_rows:int=None, rows=None):
+    """
+    append_buffer_to_hdf5 for output files from before the particle index: all particles per row, step-major.
+    """
+    old = filled_rows(f)
+    new = old
+    for key, data in buffer.filled(rows).items():
+        if key not in f:
+            continue
+        ds = f[key]
+        if max_rows is not None:
+            data = data[:max(0, max_rows - old)]
+        if len(data) == 0:
+            continue
+        if 'max_error' in ds.attrs:
+            data = quantize(data, ds.attrs['max_error'])
+        if ds.shape[0] < old + len(data):
+            ds.resize(old + len(data), axis=0)
+        ds[old:old + len(data)] = data
+        new = old + len(data)
+    set_filled_rows(f, new)
@@ -1,10 +1,14 @@
+import hashlib
+import json
+
 import h5py
 import numpy as np
 from settings.configs.funcs.config_reader import runtime_configs
 from pathlib import Path
 import os
 import pandas as pd
-from Gui_tkinter.funcs.GuiEntryHelpers import File_to_Collection
+
+from grid.symmetry import GridSymmetry
 
 def get_diag_values(row) -> dict:
     """
@@ -34,36 +38,38 @@ def get_diag_values(row) -> dict:
 
 """
 Creates and saves a .h5 file storing a uniform coarse grid with a selected configuration's field.
+(The coil field methods of calcs.magpy4c1_01.grid_checker go through grid.superposition instead, which keeps a
+grid per coil and sums them.)
 """
-def check_if_overwrite(desired_file, input_file_path, diags_present)->bool:
+def grid_key(input_file_path, res, method) -> str:
+    """
+    What a grid file was built from: the whole input file, the resolution and the method's name.
     """
-    If the selected option's .h5 file already exists (and has different input parameters), return True.
-    Otherwise, return False.
+    with open(input_file_path, 'rb') as f:
+        contents = hashlib.sha1(f.read()).hexdigest()
+    name = getattr(method, '__qualname__', type(method).__name__)
+    return hashlib.sha1(json.dumps([contents, int(res), name]).encode()).hexdigest()
+
+def check_if_overwrite(desired_file, key:str)->bool:
+    """
+    True if the grid file doesn't exist yet or was built from something else (a different grid_key).
 
     :params:
     desired_file(Path): a Path object that contains the dir to the desired file
-    input_file_path(Path): a Path object that contains the dir to the input file
-                           The first line is read to compare w/ the diags in the h5 file, if exists
+    key(str): grid_key of the present input
     """
-    # 1st check if an .h5 file with the same name already exists
     if not os.path.exists(desired_file): # if the path does not exist, then u always create one
         return True
-    else:
-        # GET H5 DIAGNOSTICS
-        with h5py.File(desired_file, 'r') as f:
-            diags_ds = f['src']['diags']
-            diags_past = {
-                'offset': diags_ds['offset'],
-                'current': diags_ds['current'],
-                'diameter': diags_ds['diameter']
-            }
-
-        # if the past and present dicts are the same, then you don't need to update the file.
-        # however, if they are not the same, then you do want to overwrite.
-
-        #print(f"check_if overwrite: past: {diags_past} present: {diags_present}")
-        #print(f"returning {diags_past == diags_present}")
-        return False if diags_past == diags_present else True
+    with h5py.File(desired_file, 'r') as f:
+        # (files from before the key have none: rebuild them)
+        return f['src'].attrs.get('key', '') != key
+
+def grid_axis(offset, res) -> np.ndarray:
+    """
+    The grid's axis (the same along x, y and z): res nodes across +-1.5 times the first coil's offset.
+    """
+    pad = offset * 1.5
+    return np.linspace(-pad, pad, res)
 
 # numpy dtypes, so the h5 file can have named columns
 dtype_diags = np.dtype([('diameter', np.float64),
@@ -91,7 +97,7 @@ def check_grid_dir(path:Path)-> Path:
     os.makedirs(grid_dir, exist_ok=True)
     return grid_dir
 
-def create_grid_h5(file_name, res, **kwargs):
+def create_grid_h5(file_name, res, shape=None, **kwargs):
     """
     Creates an empty .h5 file with the given structure.
     Expected to be populated during initial calculations.
@@ -100,24 +106,28 @@ def create_grid_h5(file_name, res, **kwargs):
     know whether to overwrite the currently existing .h5 file nor not (if it exists)
 
     the dataset 'data' will hold all relevant grid/field information.
+    shape: the node counts of a symmetry reduced grid's box (grid.symmetry); (res, res, res) by default
     """
+    shape = (res, res, res) if shape is None else tuple(shape)
     # Create file
     with h5py.File(file_name, 'w', libver='latest') as f:
         f.swmr_mode = True # single writer, multiple readers
 
         grp = f.create_group('/src')
         diags = f.create_dataset('/src/diags', (1,), dtype=dtype_diags)
-        coords = f.create_dataset('/src/coords', (3, res, res, res), chunks=True,
+        coords = f.create_dataset('/src/coords', (3, *shape), chunks=True,
                                 dtype=np.float64)
-        data = f.create_dataset('src/data', (3, res, res, res), chunks=True,
+        data = f.create_dataset('src/data', (3, *shape), chunks=True,
                                 dtype=np.float64)
 
-def precalculate_3d_grid(method, input_file_path, res=100, **kwargs):
+def precalculate_3d_grid(method, input_file_path, res=100, symmetry:GridSymmetry=None, **kwargs):
     """
     :params:
     method(callable): the actual logic used to populate the field.
                       Takes a cartesian input, and poops out a cartesian output.
     input_file_name(str): the path to the input file. Used to create input corresponding grid files
+    symmetry(GridSymmetry): point symmetries of the field (grid.symmetry); with one, only one node per orbit is
+                      computed and only the box the sign flips fold into is stored
 
     The coarse grid will, for now, be defined by a meshgrid composed of each axis being divided up into a linspace
     with 100 subdivisions.
@@ -143,16 +153,22 @@ def precalculate_3d_grid(method, input_file_path, res=100, **kwargs):
     diags_present = get_diag_values(first_row)
 
     # this function tells us if we either need to create a new file or overwrite an existing one.
-    should_overwrite = check_if_overwrite(desired_path, input_file_path, diags_present)
+    key = grid_key(input_file_path, res, method)
+    should_overwrite = check_if_overwrite(desired_path, key)
     #print(should_overwrite)
     # debug line to prevent grid creation
     #return None
-    # if the existing diags dataset is the same as the proposed diags, then you are good.
+    # if the existing file was built from the same input, then you are good.
     if not should_overwrite:
         print(f"3d_mesh returning None")
         return None
 
     check_grid_dir(input_file_path)
+    _ax_linspace = grid_axis(diags_present['offset'], res)
+    if symmetry is not None:
+        _precalculate_symmetric(method, desired_path, diags_present, key, _ax_linspace, symmetry, **kwargs)
+        return None
+
     # NOW WE KNOW WE NEED TO CREATE A NEW H5 FILE WITH THE GIVEN NAME
     create_grid_h5(file_name=desired_path, res=res) # this will replace any existing files with this name
 
@@ -162,12 +178,10 @@ def precalculate_3d_grid(method, input_file_path, res=100, **kwargs):
         # diagnostic order needs to be diameter, current, offset
         f['/src/diags'][:] = np.array((diags_present['diameter'],diags_present['current'],diags_present['offset'] ),
                                      dtype=dtype_diags)
+        f['/src'].attrs['key'] = key
         # FILL DATA!
         # step 1: assemble the meshgrid
         #   - X, Y, Z lims are the 'offset' value of the diags
-        pad = diags_present['offset'] * 1.5
-        _ax_linspace = np.linspace(-pad, pad, res)
-
         grid = np.meshgrid(_ax_linspace, _ax_linspace, _ax_linspace, indexing='ij')
         # fill the coords dataset before moving axis
         f['/src/coords'][:] = grid
@@ -184,9 +198,46 @@ def precalculate_3d_grid(method, input_file_path, res=100, **kwargs):
         f['/src/data'][:] = output_moved
 
 
+def symmetric_values(method, axis, symmetry:GridSymmetry, **kwargs):
+    """
+    The field of a symmetry reduced grid on the cube with this axis: the method only sees the orbit
+    representatives, as a (n, 1, 1, 3) 'grid', and the rest of the box is filled in from them.
+    returns (the box's axes, (*box shape, 3) node positions, (*box shape, 3) field)
+    """
+    res = len(axis)
+    shape, reps, src, op = symmetry.representatives(res)
+    axes = [axis[lo:] for lo in symmetry.box(res)]
+    print(f"grid symmetry of order {len(symmetry)}: computing {len(reps)} of {res ** 3} nodes")
+
+    grid = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    points = grid[reps].reshape(-1, 1, 1, 3)
+    output = np.asarray(method(points, **kwargs))
+    # (n, [1, 1,] 3) like the points (magpylib squeezes), or (3, n, 1, 1) like bob_e's (3, res, res, res)
+    if output.shape[0] == len(points) and output.shape[-1] == 3:
+        output = output.reshape(-1, 3)
+    else:
+        output = np.moveaxis(output, 0, -1).reshape(-1, 3)
+    values = symmetry.fill(output, src, op).reshape(*shape, 3)
+    return axes, grid.reshape(*shape, 3), values
+
+def _precalculate_symmetric(method, desired_path, diags_present, key, axis, symmetry:GridSymmetry, **kwargs):
+    """
+    precalculate_3d_grid for a symmetry reduced grid: only the box is stored, with the symmetry.
+    """
+    axes, grid, values = symmetric_values(method, axis, symmetry, **kwargs)
+
+    create_grid_h5(file_name=desired_path, res=len(axis), shape=values.shape[:-1])
+    with h5py.File(desired_path, 'r+') as f:
+        f['/src/diags'][:] = np.array((diags_present['diameter'], diags_present['current'], diags_present['offset']),
+                                     dtype=dtype_diags)
+        f['/src'].attrs['key'] = key
+        f['/src/coords'][:] = np.moveaxis(grid, -1, 0)
+        f['/src/data'][:] = np.moveaxis(values, -1, 0)
+        symmetry.write(f['/src'], len(axis))
+
 if __name__ == '__main__':
     import magpylib as mp
-    from Gui_tkinter.funcs.GuiEntryHelpers import tryEval
+    from Gui_tkinter.funcs.GuiEntryHelpers import tryEval, File_to_Collection
     # Run a hardcoded example to test h5 file creation
     filepath = 'D:\\FromCDocuments\\Boris_Usr\\Inputs\\CoilConfigurations\\mirror_10k'
     collection = File_to_Collection(filepath, 'mirror_10k', {"Amp": tryEval, "RotationAngle": tryEval, "RotationAxis": tryEval})
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+
+import h5py
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from calcs.coil_geometry import CoilGeometry
+from grid._3d_mesh import symmetric_values
+from grid.symmetry import OPS, TOL, GridSymmetry, SymmetricGrid
+
+"""
+Field grids as sums of per-coil unit grids, cached by coil geometry.
+
+Every gridded coil method (B: magpy, loop, annulus; E: disk_e, bob_e) is linear in the coils' currents/charges,
+so the grid of a coil set is
+    F = sum over coils k of q_k U_k
+where U_k is coil k's field at unit strength (1 A, 1 C) on the same cube. CoilGridCache keeps each U_k in its own
+file, named by a hash of what it depends on (the field and method, the coil's centre, normal, radii and the
+cube's axis; not its current), so:
+    - a new current/charge vector is a weighted sum of grids already on disk (tens of ms per coil at res 100,
+      most of it reading the file), in the GUI, across headless runs and for every variant of a sweep;
+    - editing one coil's geometry recomputes only that coil's grid (the other keys don't change; moving the
+      first coil's offset does move the cube, grid._3d_mesh.grid_axis, and with it every key).
+For these methods it replaces the one grid file per coil set of grid._3d_mesh.precalculate_3d_grid, whose reuse
+check only compared the first coil's offset, current and diameter and which was rebuilt from scratch for any
+other change (that check, check_if_overwrite, now compares a hash of the whole coil file).
+
+# COMPUTING A UNIT GRID
+A missing U_k is found, in order:
+    - as the image of a coil of the set whose grid exists, under one of the cube's 48 signed axis permutations
+      (grid.symmetry): a coil g c_i, normal g n_i has U(p) = g U_i(g^T p) (times det(g) for B, and -1 where its
+      normal is the image's reversed), an exact permutation of the array. The coils of the cube and polyhedral
+      sets are mostly images of one or two of them;
+    - otherwise computed, with the coil's own symmetries (a coil on an axis has 8; grid.symmetry) reducing the
+      nodes evaluated, the way precalculate_3d_grid reduces a whole set's.
+A first build so evaluates the field about as many times as the symmetry reduced grid of the whole set would,
+or fewer (the images don't care which way the currents run), plus writing each coil's file; with the compiled
+'loop' method, where evaluations are cheap, that is about twice the time of the direct grid
+(Tests/grid/grid_superposition.py), and every build after it a fraction of a second.
+
+# THE TOTAL
+CoilGridCache.interpolator(coils) sums the unit grids with the coils' strengths into a RegularGridInterpolator,
+or a SymmetricGrid of its box when the set (with its currents) has a symmetry, as the grid files had.
+Superposition pairs a cache with a coil set; it is what the sweeps (calcs.sweep) hand their workers, which read
+the unit grids from the files (kept in memory per process) and sum them with each variant's currents.
+
+# IN A FILE: <input dir>/grid/coils/<key>.hdf5
+    /src/axis: (res,) the cube's axis (x, y and z)
+    /src/data: (3, res, res, res) the unit field, like a grid file's
+    attrs of /src: field, method, params, centre, normal, radius, inner_radius
+"""
+# unit grids read in this process, by file (sweep workers sum the same coils for every variant)
+_UNITS = {}
+
+class CoilGridCache:
+    def __init__(self, directory, field:str, method:str, axis, evaluate=None, params=None):
+        """
+        directory: where the unit grids go (<input dir>/grid/coils)
+        field: 'b' or 'e' (B is a pseudovector)
+        method: the FieldConfig's method, part of the key
+        axis: (res,) the cube's axis (grid._3d_mesh.grid_axis)
+        evaluate: evaluate(points, coils=CoilGeometry) -> the coils' field at (..., 3) points, in the points'
+                  shape or as bob_e's (3, ...); None where the grids are only read (a sweep's workers)
+        params: anything else the unit grids depend on (the annulus order), part of the key
+        """
+        self.directory = str(directory)
+        self.field = field
+        self.method = method
+        self.axis = np.asarray(axis, dtype=np.float64)
+        self.evaluate = evaluate
+        self.params = params
+
+    def __getstate__(self):
+        # (the evaluate callables are closures over configs; workers only read)
+        state = self.__dict__.copy()
+        state['evaluate'] = None
+        return state
+
+    @property
+    def pseudovector(self) -> bool:
+        return self.field == 'b'
+
+    def key(self, coils:CoilGeometry, k) -> str:
+        def rounded(x):
+            return (np.round(np.asarray(x, dtype=np.float64), 12) + 0.).tolist() # (+ 0. drops the -0.)
+        key = [self.field, self.method, self.params, rounded(coils.centres[k]), rounded(coils.normals[k]),
+               rounded(coils.radii[k]), rounded(coils.inner_radii[k]), rounded(self.axis[-1]), len(self.axis)]
+        return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+    def path(self, key) -> str:
+        return os.path.join(self.directory, f"{key}.hdf5")
+
+    #=== building ===#
+    def build(self, coils:CoilGeometry) -> list:
+        """
+        Makes sure every coil has its unit grid on disk, computing only the missing ones.
+        returns the coils' keys
+        """
+        keys = [self.key(coils, k) for k in range(len(coils))]
+        have = [k for k in range(len(coils)) if os.path.exists(self.path(keys[k]))]
+        missing = [k for k in range(len(coils)) if k not in have]
+        if missing:
+            print(f"coil grids: {len(have)} of {len(coils)} cached, building {len(missing)}")
+        for k in missing:
+            if os.path.exists(self.path(keys[k])): # (a coil the same as an earlier one)
+                have.append(k)
+                continue
+            image = self._image_of(coils, k, have)
+            if image is not None:
+                i, g, factor = image
+                print(f"coil grid {k}: image of coil {i}")
+                values = _transform(self.unit(keys[i]), g, factor)
+            else:
+                print(f"coil grid {k}: computing")
+                values = self._compute(coils.unit(k))
+            self._write(keys[k], values, coils, k)
+            have.append(k)
+        return keys
+
+    def _image_of(self, coils:CoilGeometry, k, have):
+        """
+        (i, g, factor): a coil i of have that g maps onto coil k, with U_k(p) = factor g U_i(g^T p); or None.
+        """
+        scale = np.max(np.linalg.norm(coils.centres, axis=1) + coils.radii)
+        for i in have:
+            if (abs(coils.radii[i] - coils.radii[k]) > TOL * scale
+                    or abs(coils.inner_radii[i] - coils.inner_radii[k]) > TOL * scale):
+                continue
+            for g in OPS.astype(np.float64):
+                if np.linalg.norm(g @ coils.centres[i] - coils.centres[k]) > TOL * scale:
+                    continue
+                det = np.linalg.det(g) if self.pseudovector else 1.
+                n = det * g @ coils.normals[i]
+                for s in (1, -1):
+                    if np.linalg.norm(s * n - coils.normals[k]) < TOL:
+                        # a reversed normal is the reversed current for B, the same ring for E
+                        return i, g, det * (s if self.pseudovector else 1)
+        return None
+
+    def _compute(self, unit:CoilGeometry) -> np.ndarray:
+        """
+        (res, res, res, 3) the field of one unit coil on the cube, through its own symmetries.
+        """
+        res = len(self.axis)
+        symmetry = GridSymmetry.detect(unit, self.pseudovector)
+        if symmetry is None:
+            symmetry = GridSymmetry(OPS[:1], np.ones(1, dtype=np.int8), self.pseudovector)
+        axes, _, values = symmetric_values(self.evaluate, self.axis, symmetry, coils=unit)
+        if values.shape[:-1] == (res, res, res):
+            return values
+        return SymmetricGrid.from_arrays(axes, values, symmetry, res).values
+
+    def _write(self, key, values, coils:CoilGeometry, k):
+        os.makedirs(self.directory, exist_ok=True)
+        # written next to its name and moved there, so a reader never sees half a file
+        tmp = self.path(key) + ".tmp"
+        with h5py.File(tmp, 'w') as f:
+            src = f.create_group('src')
+            src.create_dataset('axis', data=self.axis)
+            src.create_dataset('data', data=np.moveaxis(values, -1, 0))
+            src.attrs['field'] = self.field
+            src.attrs['method'] = self.method
+            src.attrs['params'] = json.dumps(self.params)
+            src.attrs['centre'] = coils.centres[k]
+            src.attrs['normal'] = coils.normals[k]
+            src.attrs['radius'] = coils.radii[k]
+            src.attrs['inner_radius'] = coils.inner_radii[k]
+        os.replace(tmp, self.path(key))
+        _UNITS[self.path(key)] = np.ascontiguousarray(values)
+
+    #=== summing ===#
+    def unit(self, key) -> np.ndarray:
+        """
+        (res, res, res, 3) the unit grid of a key, from disk the first time.
+        """
+        path = self.path(key)
+        if path not in _UNITS:
+            with h5py.File(path, 'r') as f:
+                _UNITS[path] = np.ascontiguousarray(np.moveaxis(f['src/data'][()], 0, -1))
+        return _UNITS[path]
+
+    def total(self, coils:CoilGeometry, scale=1.) -> np.ndarray:
+        """
+        (res, res, res, 3) the coils' field: their unit grids times their strengths (times scale).
+        """
+        keys = self.build(coils)
+        res = len(self.axis)
+        values = np.zeros((res, res, res, 3))
+        for key, q in zip(keys, coils.strengths * scale):
+            if q != 0:
+                values += q * self.unit(key)
+        return values
+
+    def interpolator(self, coils:CoilGeometry, scale=1.):
+        """
+        The total as a RegularGridInterpolator, or the SymmetricGrid of its box if the coils have a symmetry.
+        """
+        values = self.total(coils, scale)
+        symmetry = GridSymmetry.detect(coils, self.pseudovector)
+        if symmetry is None:
+            return RegularGridInterpolator((self.axis,) * 3, values, method='linear')
+        lo = symmetry.box(len(self.axis))
+        box = np.ascontiguousarray(values[lo[0]:, lo[1]:, lo[2]:])
+        return SymmetricGrid.from_arrays([self.axis[i:] for i in lo], box, symmetry, len(self.axis))
+
+@dataclass
+class Superposition:
+    """
+    A coil set and the cache of its unit grids: the gridded field of one FieldConfig.
+    """
+    cache : CoilGridCache
+    coils : CoilGeometry
+
+    def build(self) -> list:
+        return self.cache.build(self.coils)
+
+    def interpolator(self, scale=1.):
+        return self.cache.interpolator(self.coils, scale)
+
+def _transform(values, g, factor) -> np.ndarray:
+    """
+    (res, res, res, 3) grid of a field U on a cube centred on the origin -> the grid of factor g U(g^T p).
+    """
+    perm = np.argmax(np.abs(g), axis=1) # g[r, perm[r]] = +-1
+    sign = g[np.arange(3), perm]
+    # (g^T p)_{perm[r]} = sign[r] p_r: node index i_r along axis r reads perm[r]'s, mirrored where sign < 0
+    moved = np.transpose(values, (*perm, 3))
+    moved = moved[tuple(slice(None, None, -1) if s < 0 else slice(None) for s in sign)]
+    return np.ascontiguousarray(factor * moved @ g.T)
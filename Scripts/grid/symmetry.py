@@ -0,0 +1,250 @@
+import itertools
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+from calcs.coil_geometry import CoilGeometry
+
+"""
+Point symmetries of a coil set, and field grids that only store the part of the cube the symmetry doesn't repeat.
+
+The grids of grid._3d_mesh are cubes of res^3 nodes centred on the origin. The cube's nodes map onto each other
+under the 48 signed permutations of the axes (the 6 axis permutations times the 8 sign flips; the symmetry group
+of the cube), so any of those that maps the coil set onto itself also maps the grid's field onto itself:
+    B(g p) = chi det(g) g B(p)      (B is a pseudovector: a mirror reverses the circulation of a loop)
+    E(g p) = chi g E(p)
+where chi = -1 for the operations that map the set onto itself with every current (charge) reversed, as the
+mirrors of a cusp do. GridSymmetry.detect finds the operations (and their chi) that a CoilGeometry has: a cube of
+six inward facing coils has all 48 (MakeCurrent.Circle, whose y pair faces outward, 16), the dodecahedral set
+(FigureIllustrationsFJW/dodecahedronCoils) the 24 that its icosahedral symmetry shares with the cube (the axis
+flips and the cyclic permutations). Tests/grid/grid_symmetry.py compares them with full grids.
+
+# THE REDUCED GRID
+grid._3d_mesh.precalculate_3d_grid (and grid.superposition, for each coil's grid under the coil's own
+symmetries) then only computes one node per orbit of the group (res^3 / |G| field evaluations instead of res^3)
+and fills in the others through the relation above. What it stores is the box the sign flips in the group
+fold every point into (x >= 0 for an x mirror, ...; one extra layer of nodes past the plane for even res, where
+no node sits on it), up to 1/8 of the cube; grid.superposition cuts the same box out of its sums of coil grids.
+SymmetricGrid interpolates it like the RegularGridInterpolator of the full cube: it folds the query points
+into the box (flipping signs), interpolates there and flips the field's components back. The compiled grid
+kernel (calcs.jit_kernel) does the same fold inline. Trilinear interpolation commutes with the fold, so the
+result is the full grid's to rounding. Consumers that want the full arrays (calcs.guiding_centre) get them
+from .grid/.values, expanded on first use.
+
+# IN THE FILE: /src/symmetry
+    ops: (G, 3, 3) int8 signed permutation matrices
+    chi: (G,) int8
+    attrs: pseudovector (bool), res (the full cube's)
+"""
+# (48, 3, 3): the signed permutations of the axes, identity first
+OPS = np.array([np.diag(signs)[list(perm)] for perm in itertools.permutations(range(3))
+                for signs in itertools.product((1, -1), repeat=3)], dtype=np.int8)
+# relative tolerance on coil positions, radii and strengths
+TOL = 1e-9
+
+@dataclass
+class GridSymmetry:
+    """
+    ops: (G, 3, 3) the group's signed permutation matrices
+    chi: (G,) +1, or -1 where the operation reverses every current/charge
+    pseudovector: the field is B (picks up det(g) under mirrors)
+    """
+    ops : np.ndarray
+    chi : np.ndarray
+    pseudovector : bool
+
+    @classmethod
+    def detect(cls, coils:CoilGeometry, pseudovector:bool):
+        """
+        The operations of OPS that map coils onto themselves.
+        pseudovector: B coils (currents circulate around the normal, which flips with the current);
+                      False for charged rings/disks, which don't care which way the normal points
+        returns the GridSymmetry, or None if the identity is the only one.
+        """
+        keep = coils.strengths != 0
+        centres, normals = coils.centres[keep], coils.normals[keep]
+        radii, inner, q = coils.radii[keep], coils.inner_radii[keep], coils.strengths[keep]
+        if not len(q):
+            return None
+        scale = np.max(np.linalg.norm(centres, axis=1) + radii)
+        q_scale = np.max(np.abs(q))
+
+        def canonical(n, q):
+            # a normal and its reverse are the same coil: keep the one whose largest component is positive
+            flip = np.sign(n[np.arange(len(n)), np.argmax(np.abs(n), axis=1)])
+            return n * flip[:, None], q * flip if pseudovector else q
+        n0, q0 = canonical(normals, q)
+
+        ops, chi = [], []
+        for g in OPS:
+            g = g.astype(np.float64)
+            det = np.linalg.det(g) if pseudovector else 1.
+            n1, q1 = canonical(normals @ g.T * det, q)
+            # (image coil, original coil) pairs that are the same loop
+            same = ((np.linalg.norm((centres @ g.T)[:, None] - centres[None], axis=-1) < TOL * scale)
+                    & (np.abs(radii[:, None] - radii[None]) < TOL * scale)
+                    & (np.abs(inner[:, None] - inner[None]) < TOL * scale)
+                    & (np.linalg.norm(n1[:, None] - n0[None], axis=-1) < TOL))
+            if not np.all(np.any(same, axis=1)):
+                continue
+            match = np.argmax(same, axis=1)
+            for c in (1, -1):
+                if np.all(np.abs(c * q1 - q0[match]) < TOL * q_scale):
+                    ops.append(g)
+                    chi.append(c)
+                    break
+        if len(ops) == 1:
+            return None
+        return cls(np.array(ops, dtype=np.int8), np.array(chi, dtype=np.int8), pseudovector)
+
+    def __len__(self):
+        return len(self.ops)
+
+    def factors(self) -> np.ndarray:
+        """
+        (G,) chi det(g) for B, chi for E: the field of the image is this times the rotated field.
+        """
+        det = np.round(np.linalg.det(self.ops.astype(np.float64))) if self.pseudovector else np.ones(len(self))
+        return (self.chi * det).astype(np.float64)
+
+    def folds(self):
+        """
+        The sign flips of the group as independent folds, one per folded axis: a point with a negative
+        coordinate on axes[k] gets its coordinates multiplied by flips[k], and the field there is the field at the
+        folded point times signs[k].
+        returns (axes (k,) int64, flips (k, 3), signs (k, 3)); k = 0 without sign flips
+        """
+        diagonal = np.all(self.ops == self.ops * np.eye(3, dtype=np.int8), axis=(1, 2))
+        flips = [np.diagonal(g).astype(np.float64) for g in self.ops[diagonal]]
+        factors = self.factors()[diagonal]
+        # reduced echelon form over GF(2) of the flips' -1 patterns: each fold owns one axis the others keep
+        axes, rows = [], []
+        for flip, factor in sorted(zip(flips, factors), key=lambda row: -np.sum(row[0] < 0)):
+            for a, (f, s) in zip(axes, rows):
+                if flip[a] < 0:
+                    flip, factor = flip * f, factor * s
+            if np.all(flip > 0):
+                continue
+            a = int(np.argmax(flip < 0))
+            rows = [(f * flip, s * factor) if f[a] < 0 else (f, s) for f, s in rows]
+            axes, rows = axes + [a], rows + [(flip, factor)]
+        axes = np.array(axes, dtype=np.int64)
+        flips = np.array([f for f, s in rows], dtype=np.float64).reshape(-1, 3)
+        signs = np.array([f * s for f, s in rows], dtype=np.float64).reshape(-1, 3)
+        return axes, flips, signs
+
+    def box(self, res:int):
+        """
+        The first node index along each axis of the stored box of a res^3 grid.
+        """
+        lo = np.zeros(3, dtype=np.int64)
+        lo[self.folds()[0]] = (res - 1) // 2
+        return lo
+
+    def representatives(self, res:int):
+        """
+        Which nodes of the box to compute, and how the others follow from them.
+        returns (shape, reps, src, op):
+            shape: the box's node counts
+            reps: flat box indices of one node per orbit
+            src: (box nodes,) index into reps of each node's representative
+            op: (box nodes,) index into ops of the g with g node = representative
+        """
+        lo = self.box(res)
+        shape = tuple(int(n) for n in res - lo)
+        folded = np.zeros(3, dtype=bool)
+        folded[self.folds()[0]] = True
+        # nodes as integers symmetric about the centre (node coordinate = m * spacing / 2)
+        m = (2 * (np.indices(shape, dtype=np.int32).reshape(3, -1).T + lo) - (res - 1)).astype(np.int32)
+        best = np.full(len(m), np.iinfo(np.int64).max)
+        op = np.zeros(len(m), dtype=np.int64)
+        for o, g in enumerate(self.ops.astype(np.int32)):
+            image = m @ g.T
+            inside = np.all((image >= 0) | ~folded, axis=1)
+            j = np.where(inside[:, None], (image + (res - 1)) // 2 - lo, 0)
+            key = np.where(inside, np.ravel_multi_index(tuple(j.T), shape), np.iinfo(np.int64).max)
+            better = key < best
+            best[better], op[better] = key[better], o
+        reps, src = np.unique(best, return_inverse=True)
+        return shape, reps, src.ravel(), op
+
+    def fill(self, rep_values, src, op) -> np.ndarray:
+        """
+        (reps, 3) fields at the representatives -> (box nodes, 3) field at every box node:
+        F(node) = factor(g) g^T F(g node).
+        """
+        return self.factors()[op, None] * np.einsum('nji,nj->ni', self.ops[op].astype(np.float64), rep_values[src])
+
+    #=== file ===#
+    def write(self, grp, res:int):
+        grp.create_dataset('symmetry/ops', data=self.ops)
+        grp.create_dataset('symmetry/chi', data=self.chi)
+        grp['symmetry'].attrs['pseudovector'] = self.pseudovector
+        grp['symmetry'].attrs['res'] = res
+
+    @classmethod
+    def read(cls, grp):
+        return cls(grp['ops'][()], grp['chi'][()], bool(grp.attrs['pseudovector']))
+
+class SymmetricGrid:
+    """
+    A RegularGridInterpolator (linear) of the full cube, from the box of a symmetry reduced grid.
+    box: RegularGridInterpolator of the stored box
+    full_axes: the full cube's axes
+    """
+    def __init__(self, box:RegularGridInterpolator, symmetry:GridSymmetry, full_axes):
+        self.box = box
+        self.symmetry = symmetry
+        self.full_axes = tuple(full_axes)
+        self.axes, self.flips, self.signs = symmetry.folds()
+        self._values = None
+
+    @classmethod
+    def from_arrays(cls, axes, values, symmetry:GridSymmetry, res:int):
+        """
+        axes: the box's axes; values: (nx, ny, nz, 3) on them
+        """
+        full = [np.concatenate([-ax[::-1][:res - len(ax)], ax]) if len(ax) < res else ax for ax in axes]
+        return cls(RegularGridInterpolator(tuple(axes), values, method='linear'), symmetry, full)
+
+    def fold(self, points):
+        """
+        (n, 3) points -> (the points folded into the box, (n, 3) signs of the field components)
+        """
+        q = np.array(points, dtype=np.float64).reshape(-1, 3)
+        s = np.ones_like(q)
+        for a, flip, sign in zip(self.axes, self.flips, self.signs):
+            neg = q[:, a] < 0
+            q[neg] *= flip
+            s[neg] *= sign
+        return q, s
+
+    def __call__(self, points):
+        points = np.asarray(points, dtype=np.float64)
+        q, s = self.fold(points)
+        return (self.box(q) * s).reshape(points.shape[:-1] + (3,))
+
+    def scaled(self, factor:float) -> 'SymmetricGrid':
+        box = RegularGridInterpolator(self.box.grid, self.box.values * factor, method='linear')
+        return SymmetricGrid(box, self.symmetry, self.full_axes)
+
+    #=== as a full RegularGridInterpolator ===#
+    @property
+    def grid(self):
+        return self.full_axes
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        (res, res, res, 3) the full cube, unfolded from the box (kept after the first call).
+        """
+        if self._values is None:
+            mesh = np.stack(np.meshgrid(*self.full_axes, indexing='ij'), axis=-1)
+            q, s = self.fold(mesh.reshape(-1, 3))
+            lo = [len(full) - len(ax) for full, ax in zip(self.full_axes, self.box.grid)]
+            # the folded nodes are box nodes: find them by index rather than interpolating
+            i = [np.searchsorted(self.full_axes[k], q[:, k] - 1e-9 * np.ptp(self.full_axes[k])) - lo[k]
+                 for k in range(3)]
+            self._values = (self.box.values[i[0], i[1], i[2]] * s).reshape(mesh.shape)
+        return self._values
@@ -0,0 +1,332 @@
+"""
+Headless entry point: runs a simulation without the GUI (no tkinter, no multiprocessing.Manager).
+Meant for batching runs on compute nodes that have no display.
+
+# USAGE (from the project root)
+Re-run a pickled AppConfig, e.g. the GUI's last-used one:
+    python Scripts/headless.py --config path/to/AppConfig.pkl
+    python Scripts/headless.py --last-used
+
+Or build the run from input files and flags:
+    python Scripts/headless.py --b-coils Inputs/CoilConfigurations/mirror --particles Inputs/ParticleConditions/p1 \
+                               --numsteps 100000 --dt 1e-9 --e-method disk_e --e-coils Inputs/Disks/d1
+
+Or sweep over parameters of a base run built the same way (see calcs.sweep for the spec):
+    python Scripts/headless.py --config base.pkl --sweep currents.json --workers 8
+
+Continue a run that was killed or stopped, or lengthen a finished one by N steps:
+    python Scripts/headless.py --resume path/to/data.hdf5 [--extend N]
+
+Ctrl-C stops a run after its current step, flushing what it has so that it can be resumed (like the GUI's
+stop button, see calcs.progress); a second Ctrl-C kills it.
+
+Flags given together with --config/--last-used override the values in the pickle.
+The output folder is picked like the GUI's output popup does (Outputs/<preset>/<current>/<b>/<e>/ns-<numsteps>_dt-<dt>)
+unless --output/--name are given.
+
+# ORDER OF OPERATIONS
+Same as pressing 'calculate' in the GUI:
+    1. Events.ON_START (config .ini, folder checks)
+    2. Events.PRE_CALC (dt consts, output subdir, copies of the input files, empty h5 file)
+    3. calcs.magpy4c1_01._runsim, with a progress channel (calcs.progress) only for Ctrl-C
+"""
+import argparse
+import json
+import os
+import pickle
+import signal
+import sys
+
+# make the project root (definitions.py) and Scripts/ importable when run as a plain script
+_scripts = os.path.dirname(os.path.abspath(__file__))
+for _p in (os.path.dirname(_scripts), _scripts):
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+from events.events import Events
+from files.create import get_default_output_dir, get_output_name
+from files.read_inputs import read_coil_file, read_particle_file
+from files.checkpoint import read_config
+from calcs.integrators import INTEGRATORS
+from system.state_dict_main import AppConfig, AppConfigMeta, fill_missing_fields
+from system.state_dict import FieldConfig, ResFieldConfig, WasherFieldConfig, AnnulusFieldConfig
+from system.state_file_handling import get_config_dir
+
+# field config dataclass for each method; same pairing as the GUI's field notebooks (Gui_tkinter.widgets.constructs)
+FIELD_CONFIGS = {
+    "zero" : FieldConfig,
+    "magpy" : FieldConfig,
+    "loop" : FieldConfig,
+    "annulus" : AnnulusFieldConfig,
+    "bob_e" : ResFieldConfig,
+    "disk_e" : WasherFieldConfig,
+    "washer_potential" : WasherFieldConfig,
+}
+
+#=============#
+# PARAMETERS  #
+#=============#
+def load_config(path):
+    """
+    reads a pickled AppConfig (as dumped by the GUI on close).
+    """
+    with open(path, 'rb') as f:
+        return fill_missing_fields(pickle.load(f))
+
+def set_field(params:AppConfig, fld:str, method:str=None, coils:str=None, res:int=None, gridding:bool=None):
+    """
+    Updates params.<fld> ('b' or 'e'). Changing the method swaps in that method's config dataclass,
+    and the coil file (given, or the one in params.path) is (re)read into its collection.
+    """
+    cfg = getattr(params, fld)
+    if method is not None and method != cfg.method:
+        cfg = FIELD_CONFIGS[method](method=method)
+        coils = coils or getattr(params.path, fld)
+
+    if coils is not None and cfg.method != "zero":
+        cfg.collection, inner_r = read_coil_file(coils)
+        cfg.name = os.path.basename(coils)
+        setattr(params.path, fld, coils)
+        if hasattr(cfg, 'inner_r'):
+            cfg.inner_r = inner_r
+    elif cfg.method != "zero" and len(cfg.collection) == 0:
+        raise ValueError(f"{fld} method '{cfg.method}' needs a coil file (--{fld}-coils)")
+
+    if res is not None and hasattr(cfg, 'res'):
+        cfg.res = res
+    if gridding is not None:
+        cfg.gridding = int(gridding)
+    setattr(params, fld, cfg)
+
+def build_params(args) -> AppConfig:
+    """
+    AppConfig for the run: the pickle (if any) with the command line flags applied on top.
+    """
+    if args.config is not None:
+        params = load_config(args.config)
+    elif args.last_used:
+        params = load_config(os.path.join(get_config_dir(), AppConfigMeta.filename))
+    else:
+        params = AppConfig()
+
+    # FIELDS
+    # a fresh AppConfig has no methods; the GUI starts on the 'zero' tabs too.
+    for fld in ('b', 'e'):
+        if getattr(params, fld).method == "":
+            getattr(params, fld).method = "zero"
+    b_method = args.b_method or ("magpy" if args.b_coils and params.b.method == "zero" else None)
+    set_field(params, 'b', b_method, args.b_coils, args.b_res, args.b_grid)
+    set_field(params, 'e', args.e_method, args.e_coils, args.e_res, args.e_grid)
+
+    # STEPS
+    if args.numsteps is not None:
+        params.step.numsteps = args.numsteps
+    if args.dt is not None:
+        params.step.dt = args.dt
+    if args.dynamic_dt is not None:
+        params.step.dynamic.on = args.dynamic_dt
+    if args.dt_mode is not None:
+        params.step.dynamic.mode = args.dt_mode
+    if args.integrator is not None:
+        params.step.integrator = args.integrator
+    if args.guiding_centre is not None:
+        params.step.guiding_centre.on = args.guiding_centre
+    if args.bound is not None:
+        params.walls.bound = args.bound
+    if args.bound_size is not None:
+        params.walls.bound_size = args.bound_size
+    if args.coil_walls is not None:
+        params.walls.coils = args.coil_walls
+    if args.washer_walls is not None:
+        params.walls.washers = args.washer_walls
+    if args.no_compiled:
+        params.step.compiled = False
+
+    # PARTICLES
+    if args.particles is not None:
+        params.path.particle = args.particles
+        params.particle.name = os.path.basename(args.particles)
+    if params.path.particle is None:
+        raise ValueError("no particle file given (--particles)")
+    params.particle.dataframe = read_particle_file(params.path.particle)
+    params.particle.count = len(params.particle.dataframe)
+    if args.workers is not None:
+        params.particle.workers = args.workers
+
+    # OUTPUT
+    if args.buffer_mb is not None:
+        params.output.buffer_mb = args.buffer_mb
+    if args.sync_write:
+        params.output.async_write = False
+    if args.no_live:
+        params.output.live = False
+    if args.live_seconds is not None:
+        params.output.live_seconds = args.live_seconds
+    if args.profile is not None:
+        params.output.profile = True
+        params.output.profile_interval_ms = args.profile
+    if args.compression is not None:
+        params.output.compression = args.compression
+    if args.shuffle:
+        params.output.shuffle = True
+    if args.max_error is not None:
+        params.output.max_error_position, params.output.max_error_b, params.output.max_error_e = args.max_error
+    if args.stride is not None:
+        params.output.stride = args.stride
+    if args.after_step is not None:
+        params.output.after_step = args.after_step
+    if args.region is not None:
+        params.output.region = args.region
+    if args.region_mode is not None:
+        params.output.region_mode = args.region_mode
+    if args.reduce_window is not None:
+        params.output.reduce_window = args.reduce_window
+    if args.no_steps:
+        params.output.keep_steps = False
+    out_dir = args.output or get_default_output_dir(params)
+    name = args.name or get_output_name(out_dir, params)
+    params.path.output_absolute = out_dir
+    params.path.output_name = name
+    params.path.output = os.path.join(out_dir, name)
+    return params
+
+#=========#
+# RUNNING #
+#=========#
+def run(params:AppConfig):
+    """
+    Runs one simulation, exactly like the GUI's calculate button minus the progress window.
+    Returns the path of the output h5 file.
+    """
+    # imported here so that only actually running pulls in the solvers
+    from calcs.magpy4c1_01 import _runsim
+
+    Events.PRE_CALC.value.invoke(params=params)
+    _run_stoppable(_runsim, params)
+    return params.path.hdf5
+
+def resume(path, extend:int=0):
+    """
+    Continues the run in the h5 file at path from its last checkpoint, appending to its datasets.
+    extend: add this many steps to the run's numsteps (to lengthen a run that already finished).
+    """
+    from calcs.magpy4c1_01 import _runsim
+
+    params = read_config(path)
+    if params is None:
+        raise ValueError(f"{path} has no stored config; it was written before checkpoints existed")
+    params = fill_missing_fields(params)
+    params.path.hdf5 = os.path.abspath(path)
+    params.path.output = os.path.dirname(params.path.hdf5)
+    params.step.resume = True
+    params.step.numsteps = int(params.step.numsteps) + extend
+
+    _run_stoppable(_runsim, params)
+    return params.path.hdf5
+
+def _run_stoppable(runsim, params:AppConfig):
+    """
+    runsim(progress, params) with the first Ctrl-C asking the run to stop rather than raising KeyboardInterrupt.
+    """
+    from calcs.progress import ProgressChannel
+
+    progress = ProgressChannel(int(params.step.numsteps), ring_rows=1)
+    def stop(signum, frame):
+        print("stopping after this step (Ctrl-C again to kill)")
+        progress.request_stop()
+        signal.signal(signal.SIGINT, previous)
+    previous = signal.signal(signal.SIGINT, stop)
+    try:
+        runsim(progress, params)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+        progress.close()
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Run a Boris pusher simulation without the GUI.")
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument("--config", help="pickled AppConfig to run")
+    src.add_argument("--last-used", action="store_true", help="run the GUI's last-used AppConfig")
+    src.add_argument("--resume", help="data.hdf5 of an earlier run to continue from its last checkpoint")
+    parser.add_argument("--extend", type=int, default=0, help="with --resume: run this many steps past the original numsteps")
+
+    parser.add_argument("--b-coils", help="B coil configuration file")
+    parser.add_argument("--b-method", choices=["zero", "magpy", "loop", "annulus"])
+    parser.add_argument("--b-res", type=int, help="quadrature order of the 'annulus' B method")
+    parser.add_argument("--b-grid", type=int, choices=[0, 1], help="precompute and interpolate the B field")
+    parser.add_argument("--e-coils", help="E coil/disk configuration file")
+    parser.add_argument("--e-method", choices=[m for m in FIELD_CONFIGS if m not in ("magpy", "loop", "annulus")])
+    parser.add_argument("--e-res", type=int, help="integration resolution of the E solver")
+    parser.add_argument("--e-grid", type=int, choices=[0, 1], help="precompute and interpolate the E field")
+
+    parser.add_argument("--particles", help="particle conditions file")
+    parser.add_argument("--workers", type=int, help="processes for multi-particle runs (0 = every core)")
+    parser.add_argument("--numsteps", type=int)
+    parser.add_argument("--dt", type=float)
+    parser.add_argument("--dynamic-dt", type=lambda s: s.lower() in ("1", "true", "on"), help="bob's dt scaling on/off")
+    parser.add_argument("--dt-mode", choices=["bob", "gyro"], help="rule of the dynamic dt (see calcs.bob_dt)")
+    parser.add_argument("--integrator", choices=list(INTEGRATORS), help="particle push (see calcs.integrators)")
+    parser.add_argument("--guiding-centre", type=lambda s: s.lower() in ("1", "true", "on"),
+                        help="guiding centre mode where the field allows it (single particle, gridded B)")
+    parser.add_argument("--no-compiled", action="store_true", help="don't use the compiled grid kernel")
+    parser.add_argument("--bound", choices=["box", "sphere"], help="shape of the outer loss surface")
+    parser.add_argument("--bound-size", type=float, help="half-width/radius of the outer loss surface (m)")
+    parser.add_argument("--coil-walls", type=lambda s: s.lower() in ("1", "true", "on"),
+                        help="lose particles that cross a B coil on/off (default off)")
+    parser.add_argument("--washer-walls", type=lambda s: s.lower() in ("1", "true", "on"),
+                        help="lose particles that cross a washer of the E field on/off (default off)")
+
+    parser.add_argument("--output", help="folder to put the output folder in")
+    parser.add_argument("--name", help="name of the output folder")
+    parser.add_argument("--buffer-mb", type=float, help="memory budget of the trajectory buffer")
+    parser.add_argument("--sync-write", action="store_true", help="write the output file in the push loop, not on a thread")
+    parser.add_argument("--no-live", action="store_true", help="don't keep the output file readable (SWMR) during the run")
+    parser.add_argument("--live-seconds", type=float, help="flush the buffer at least this often for live readers (0 = off)")
+    parser.add_argument("--profile", type=float, nargs="?", const=5.0, metavar="MS",
+                        help="sample the pusher's call stack every MS ms (default 5) into /diag/timing/profile")
+    parser.add_argument("--compression", choices=["lzf", "gzip"], help="compress the output datasets")
+    parser.add_argument("--shuffle", action="store_true", help="byte shuffle before compressing")
+    parser.add_argument("--max-error", type=float, nargs=3, metavar=("POS", "B", "E"),
+                        help="quantize positions [m], B [T] and E [V/m] to these absolute errors (0 = exact)")
+    parser.add_argument("--stride", type=int, help="only write every stride-th step")
+    parser.add_argument("--after-step", type=int, help="only write steps from this one on")
+    parser.add_argument("--region", type=float, nargs=6, metavar=("XMIN", "XMAX", "YMIN", "YMAX", "ZMIN", "ZMAX"),
+                        help="only write steps inside this box (see --region-mode)")
+    parser.add_argument("--region-mode", choices=["inside", "after"],
+                        help="write the steps inside the region, or every step after first entering it")
+    parser.add_argument("--reduce-window", type=int, help="also write min/max/mean over windows of this many steps")
+    parser.add_argument("--no-steps", action="store_true", help="don't write per-step rows (reductions/events only)")
+    parser.add_argument("--save-config", help="also pickle the AppConfig used for the run to this path")
+    parser.add_argument("--sweep", help="json sweep spec (see calcs.sweep); the other flags make the base run. "
+                                        "--workers is then the number of variants run at once")
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+
+    Events.ON_START.value.invoke()
+    if args.resume is not None:
+        out = resume(args.resume, args.extend)
+        print(f"output written to: {out}")
+        return out
+
+    params = build_params(args)
+    if args.save_config is not None:
+        with open(args.save_config, 'wb') as f:
+            pickle.dump(params, f)
+
+    if args.sweep is not None:
+        # imported here for the same reason as in run()
+        from calcs.sweep import run_sweep
+        with open(args.sweep) as f:
+            spec = json.load(f)
+        # the sweep folder is not numbered like single runs are, so that re-running a sweep skips finished variants.
+        name = args.name or os.path.splitext(os.path.basename(args.sweep))[0]
+        out = run_sweep(params, spec, os.path.join(params.path.output_absolute, name), args.workers)
+    else:
+        out = run(params)
+    print(f"output written to: {out}")
+    return out
+
+if __name__ == "__main__":
+    main()
@@ -23,7 +23,6 @@ The dropdown graphs use the function 'Param_v_Step_callable', in which:
 
 """
 from Gui_tkinter.BorisGui import App
-from multiprocessing import Manager
 
 if __name__ == "__main__":
     # For whatever reason, instantiating the GUI window HAS to 
@@ -31,9 +30,8 @@ if __name__ == "__main__":
 
     # If I call root.mainloop() here, it gets called when a process
     # spawns, even when inside the main block.
-    manager = Manager()
     #OpenGUI(manager)2
-    app = App(manager)
+    app = App()
     app.mainloop()
 
     
@@ -8,11 +8,14 @@ from files.windows.get_documents_path_win import get_documents_path_win
 
 def create_default_config():
         # CONFIGURE THE ACTUAL INI FILE
+    # the windows documents folder can be moved, so ask the os; elsewhere (incl. headless linux nodes) it's ~/Documents.
+    if PLATFORM == 'win32':
+        documents = get_documents_path_win()
+    else:
+        documents = os.path.expanduser('~/Documents')
     config = configparser.ConfigParser()
     config['Paths'] = {
-        'usr_Documents' : os.path.normpath(os.path.join(os.path.expanduser('~/Documents'), "Boris_Usr"))
-        if os.path.exists(os.path.normpath(os.path.expanduser('~/Documents'))) and PLATFORM == 'darwin'
-        else os.path.normpath(os.path.join(get_documents_path_win(), "Boris_Usr")),
+        'usr_Documents' : os.path.normpath(os.path.join(documents, "Boris_Usr")),
         'Inputs' : "%(usr_Documents)s/Inputs",
         'Outputs' : "%(usr_Documents)s/Outputs",
     }
@@ -15,4 +15,5 @@ class ion():
     anum : float # atomic number
 
 proton = ion(name="proton", mass=1.672e-27, q=1.602e-19, anum=1)
-coulomb = 8.99e9  # Coulomb constant (N·m²/C²)
\ No newline at end of file
+coulomb = 8.99e9  # Coulomb constant (N·m²/C²)
+c_light = 2.99792458e8  # speed of light (m/s)
\ No newline at end of file
@@ -20,6 +20,7 @@ import pandas as pd
 class ParticleData:
     name : Optional[str] = None #name of the particle file chosen
     count : Optional[int] = None #number of tracked particles
+    workers : int = 1 #processes to split multi-particle runs over; 0 = every core
     dataframe : Optional[pd.DataFrame] = field(default_factory=pd.DataFrame)
 
 # DIRECTORY DATACLASSES
@@ -67,12 +68,30 @@ class DynDtConfig:
     dynamic_range : int = 10
     consts : DynDtConsts = field(default_factory=DynDtConsts)
     on : bool = False # scaling is off by default.
+    mode : str = "bob" # 'bob': dt = dt0 * B0/|B|, 'gyro': a fixed number of steps per local gyration (calcs.bob_dt)
+    steps_per_gyration : int = 100 # only used by 'gyro'
+
+@dataclass
+class GuidingCentreConfig:
+    """
+    Guiding-centre mode (calcs.guiding_centre); single particle runs with a gridded B only.
+    eps is the adiabaticity parameter, gyroradius / field gradient length.
+    """
+    on : bool = False
+    dt_factor : float = 50. # GC steps are this many times the full orbit dt
+    eps_max : float = 0.05 # drop to full orbit above this...
+    eps_min : float = 0.02 # ...and go back to GC below this
+    b_min : float = 1e-3 # [T] always full orbit below this |B| (nulls, cusps)
 
 @dataclass
 class DtNpConfig:
     dt : float = 2e-9
     numsteps : int = 30000
     dynamic : DynDtConfig = field(default_factory=DynDtConfig)
+    compiled : bool = True # use the compiled grid kernel (calcs.jit_kernel) when the fields allow it
+    resume : bool = False # continue the run already in path.hdf5 from its last checkpoint (files.checkpoint)
+    integrator : str = "boris" # 'boris', 'higuera_cary' or 'exact' (calcs.integrators)
+    guiding_centre : GuidingCentreConfig = field(default_factory=GuidingCentreConfig)
 
 # FIELD METHOD DATACLASSES
 #    - Universal class for every method, then subclasses for any variations.
@@ -83,15 +102,20 @@ class FieldConfig:
     Holds universal params for B, E-field solver methods.
 
     :params:
-    method: the name of the method
+    method: the name of the method ('zero', 'magpy', 'loop' or 'annulus' for B; 'loop' is the closed form loop
+            field of calcs.loop_field, for collections of Circles, 'annulus' the flat multi-turn coils of
+            calcs.annulus_field, see AnnulusFieldConfig)
     collection: the magpylib Collection object
     gridding: 0, 1 = determines whether the solver will precompute a grid and interpolate
+    backend: 'serial', 'threads', 'processes' or None = execution backend handed to the solver
+             (None picks the default for the method, see calcs.backends)
     """
     method : str = ""
     collection : object = Collection()
     gridding : int = 0
     name : Optional[str] = None #name of the particle file chosen
     logging : int = 0 #whether to dump runtime info in a file
+    backend : Optional[str] = None
 
 @dataclass
 class ResFieldConfig(FieldConfig):
@@ -107,3 +131,83 @@ class WasherFieldConfig(ResFieldConfig):
     Washer fields also need to know its inner washer radii.
     """
     inner_r : list[float] = field(default_factory=list)
+
+@dataclass
+class AnnulusFieldConfig(WasherFieldConfig):
+    """
+    Flat multi-turn (annular) B coils: the collection's Circles are their outer edges carrying the total current,
+    inner_r their inner radii, and res the Gauss-Legendre order of the integral across each winding.
+    """
+    res : int = 64
+
+# OUTPUT DATACLASSES
+@dataclass
+class OutputConfig:
+    """
+    Controls how the pusher writes its output file.
+
+    :params:
+    buffer_mb: memory budget (MB) of the in-memory trajectory buffer; it is flushed to the h5 file when full.
+    checkpoint_steps: the buffer is also flushed, with a restart checkpoint, at least every this many steps.
+    async_write: write on a background thread while the next buffer fills (files.async_writer);
+        buffer_mb is then split between the two buffers.
+    live: keep the output file in SWMR mode while it is written, so the plotting tab can follow the run
+        (files.hdf5.tail); the buffer is then also flushed at least every live_seconds (0 = only when full)
+
+    Which steps get written (files.output_policy; the defaults write every step):
+    stride: write every stride-th step
+    after_step: write steps from this step on
+    region: [xmin, xmax, ymin, ymax, zmin, zmax] box; None = everywhere
+    region_mode: 'inside' writes the steps inside the region, 'after' every step from the first entry into it on
+    reduce_window: > 0 also writes min/max/mean of every quantity over windows of this many steps to /src/reduced
+    keep_steps: False writes no per-step rows at all (only reductions and events)
+
+    How the per-step datasets are stored (files.hdf5.output_file_structure):
+    chunk_rows: rows per chunk; 0 picks one from the buffer size
+    compression: None, 'lzf' or 'gzip'; compression_level: gzip's level (0-9)
+    shuffle: byte shuffle filter before compressing (helps a lot with quantized columns)
+    max_error_position/b/e: > 0 quantizes positions [m] / B [T] / E [V/m] to within this absolute error
+
+    Every run times its phases into /diag/timing (calcs.timing); on top of that:
+    profile: sample the pusher's call stack every profile_interval_ms [ms] into /diag/timing/profile
+    """
+    buffer_mb : float = 64.0
+    checkpoint_steps : int = 100000
+    async_write : bool = True
+    live : bool = True
+    live_seconds : float = 2.0
+    stride : int = 1
+    after_step : int = 0
+    region : list[float] = None
+    region_mode : str = "inside"
+    reduce_window : int = 0
+    keep_steps : bool = True
+    chunk_rows : int = 0
+    compression : str = None
+    compression_level : int = 4
+    shuffle : bool = False
+    max_error_position : float = 0.
+    max_error_b : float = 0.
+    max_error_e : float = 0.
+    profile : bool = False
+    profile_interval_ms : float = 5.0
+
+# LOSS SURFACES
+@dataclass
+class WallConfig:
+    """
+    Surfaces particles are lost on (calcs.walls).
+
+    :params:
+    bound: 'box' or 'sphere' around the origin
+    bound_size: half-width/radius of the bound; None keeps the old rule (distance of the first B coil)
+    coils: lose particles that cross a B coil, modelled as an annulus coil_width wide in the coil plane
+    washers: lose particles that cross a washer of a washer E field (inner_r to the outer radius)
+    coils and washers are off by default, so a run only ends on the bound (and the grid edge) as it always did;
+    turning them on ends orbits that used to pass through a coil or washer.
+    """
+    bound : str = "box"
+    bound_size : float = None
+    coils : bool = False
+    coil_width : float = 0.005
+    washers : bool = False
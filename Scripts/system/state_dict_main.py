@@ -2,7 +2,7 @@
 state_dict.py holds all the dataclasses that will be organized here.
 """
 from system.state_dict import *
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields, is_dataclass, MISSING
 
 @dataclass
 class AppConfig:
@@ -21,6 +21,10 @@ class AppConfig:
 
     path : DirData = field(default_factory=DirData) #path of b, e input file
 
+    output : OutputConfig = field(default_factory=OutputConfig)
+
+    walls : WallConfig = field(default_factory=WallConfig) # loss surfaces
+
 @dataclass
 class AppConfigMeta:
     """
@@ -28,6 +32,21 @@ class AppConfigMeta:
     """
     filename = "AppConfig.pkl" #what saved instance binary files will be called
 
+def fill_missing_fields(config):
+    """
+    AppConfig binaries pickled by an older version of the program won't have fields added since.
+    Gives any missing (nested) dataclass field its default value, in place.
+    """
+    for f in fields(config):
+        if f.name not in config.__dict__:
+            if f.default_factory is not MISSING:
+                setattr(config, f.name, f.default_factory())
+            elif f.default is not MISSING:
+                setattr(config, f.name, f.default)
+        value = getattr(config, f.name, None)
+        if is_dataclass(value) and not isinstance(value, type):
+            fill_missing_fields(value)
+    return config
 
 if __name__ == "__main__":
     config = AppConfig()
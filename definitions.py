@@ -18,6 +18,7 @@ NAME_INPUTS = "Inputs"
 NAME_COILS = "CoilConfigurations"
 NAME_PARTICLES = "ParticleConditions"
 NAME_DISKS = "Disks"
+NAME_ANNULI = "AnnularCoils" # annular B coils (the 'annulus' B method)
 NAME_lastUsed = "lastUsed" # a text file holding the last used configs.
 NAME_BOB_E_CHARGES = "Bobs"
 NAME_OUTPUTS = "Outputs"
@@ -32,7 +33,8 @@ _input_preset = "Presets" # name of the presets folder, if present.
 FOLDER_INPUTS = { # subdirs of the inputs folder
     NAME_COILS:[_input_preset], 
     NAME_PARTICLES:[_input_preset], 
-    NAME_DISKS:[_input_preset]}
+    NAME_DISKS:[_input_preset],
+    NAME_ANNULI:[_input_preset]}
 
 # App Metadata
 app_name = "BorisPusher"